@@ -0,0 +1,73 @@
+# assistant_lines.py
+# 助播台词的预取与复用：
+# - AI回复按 (关键词, 规范化上下文) 缓存，带过期时间；缓存的是 future，同一上下文的并发请求共享一次AI调用。
+# - 每个关键词保留少量已合成好的助播台词（文本+音频），AI回复来不及时可以直接拿来播放。
+import random, threading, time
+from collections import OrderedDict, deque
+from synthesis_cache import normalize_text
+
+
+def _usable(future):
+    """未完成的 future 可以等待；已完成的只有返回了非空文本才可复用"""
+    if not future.done(): return True
+    if future.cancelled() or future.exception() is not None: return False
+    result = future.result()
+    return bool(result and result.strip())
+
+
+class AssistantLineCache:
+    def __init__(self, ttl=300.0, max_entries=256, pool_size=4, pool_ttl=1800.0):
+        self.ttl = ttl  # AI回复的有效期（秒）
+        self.max_entries = max_entries
+        self.pool_size = pool_size  # 每个关键词保留的预合成台词条数
+        self.pool_ttl = pool_ttl
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()  # (关键词, 上下文) -> (过期时间, future)
+        self._pools = {}  # 关键词 -> deque[(过期时间, 文本, 音频)]
+        self._last_taken = {}  # 关键词 -> 上次取出的文本，避免连续重复
+        self.stats = {"response_hits": 0, "response_misses": 0, "pool_hits": 0, "pool_misses": 0}
+
+    def get_or_start(self, keyword, context, start):
+        """返回AI回复的 future；没有未过期的可用记录时调用 start() 发起请求（start 抛出的异常原样传出）"""
+        key = (keyword, normalize_text(context))
+        now = time.monotonic()
+        with self._lock:
+            item = self._responses.get(key)
+            if item is not None and item[0] > now and _usable(item[1]):
+                self._responses.move_to_end(key)
+                self.stats["response_hits"] += 1
+                return item[1]
+            future = start()
+            self._responses[key] = (now + self.ttl, future)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries: self._responses.popitem(last=False)
+            self.stats["response_misses"] += 1
+            return future
+
+    def add_line(self, keyword, text, audio):
+        """记录一条已合成的助播台词；同一文本只保留一份，超出条数时淘汰最旧的"""
+        if not keyword or not text or audio is None: return
+        with self._lock:
+            pool = self._pools.setdefault(keyword, deque(maxlen=self.pool_size))
+            if any(line[1] == text for line in pool): return
+            pool.append((time.monotonic() + self.pool_ttl, text, audio))
+
+    def take_line(self, keyword):
+        """随机取一条未过期的预合成台词，返回 (文本, 音频)；没有时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            pool = self._pools.get(keyword)
+            if pool:
+                for line in [line for line in pool if line[0] <= now]: pool.remove(line)
+            lines = [line for line in pool or () if line[1] != self._last_taken.get(keyword)] or list(pool or ())
+            if not lines:
+                self.stats["pool_misses"] += 1
+                return None
+            _, text, audio = random.choice(lines)
+            self._last_taken[keyword] = text
+            self.stats["pool_hits"] += 1
+            return text, audio
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, responses=len(self._responses), pooled_lines=sum(len(p) for p in self._pools.values()))
@@ -0,0 +1,195 @@
+# async_transport.py
+# asyncio 传输层：发送与接收跑在同一个事件循环上，连接断开后按带抖动的指数退避自动重连，
+# 重连成功后把尚未收到回复的请求重新发送一遍。
+# 每个请求对应一个可等待的 future；submit() 是给现有同步调用方用的线程安全外壳。
+# 给出 codecs 时，每次连上后先发送编码协商的 hello，再发送/重发请求。
+import asyncio, json, random, threading
+import tts_protocol
+
+
+class AsyncTTSTransport:
+    def __init__(self, host, port, on_packet, binary_frames=True, loop=None, is_pending=None,
+                 backoff_base=0.2, backoff_max=5.0, connect_timeout=5.0, log=print, on_connection_change=None,
+                 codecs=()):
+        self.host = host
+        self.port = port
+        self.on_packet = on_packet  # 在事件循环线程中调用 on_packet(packet)
+        self.binary_frames = binary_frames
+        self.is_pending = is_pending  # is_pending(request_id) 为False的请求重连后不再重发
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.log = log
+        self.on_connection_change = on_connection_change  # on_connection_change(transport, connected)，在事件循环中调用
+        self.codecs = list(codecs)  # 客户端能解码的音频编码，按偏好顺序
+        self.codec = "wav"  # 当前连接协商得到的编码
+        self._loop = loop
+        self._owns_loop = loop is None
+        self._loop_thread = None
+        self._inflight = {}  # (request_id, is_assistant) -> (payload, asyncio.Future)
+        self._send_q = None
+        self._connected = False
+        self._closed = False
+        self._run_task = None
+        self.stats = {"connects": 0, "reconnects": 0, "resent": 0, "disconnects": 0, "cancelled": 0}
+
+    @property
+    def outstanding(self):
+        return len(self._inflight)
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def start(self):
+        """启动连接循环。未传入外部事件循环时，自建一个后台线程运行事件循环"""
+        if self._owns_loop:
+            self._loop = asyncio.new_event_loop()
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True,
+                                                 name=f"TTSTransport-{self.host}:{self.port}")
+            self._loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self):
+        self._send_q = asyncio.Queue()
+        self._run_task = asyncio.ensure_future(self._run())
+
+    def submit(self, payload):
+        """线程安全：发送请求并返回 concurrent.futures.Future，结果为服务器返回的packet"""
+        return asyncio.run_coroutine_threadsafe(self.request(payload), self._loop)
+
+    async def request(self, payload):
+        """在事件循环中发送请求并等待对应的回复packet"""
+        key = (payload['request_id'], bool(payload.get('is_assistant')))
+        future = self._loop.create_future()
+        self._inflight[key] = (payload, future)
+        if self._connected: self._send_q.put_nowait(self._encode(payload))
+        try:
+            return await future
+        finally:
+            if self._inflight.get(key, (None, None))[1] is future: del self._inflight[key]
+
+    def cancel(self, request_id):
+        """线程安全：取消某个请求的主线和助播两部分，等待方收到 CancelledError，并通知服务器停止合成"""
+        self._loop.call_soon_threadsafe(self._cancel, request_id)
+
+    def _cancel(self, request_id):
+        found = False
+        for key in ((request_id, False), (request_id, True)):
+            entry = self._inflight.pop(key, None)
+            if entry is None: continue
+            found = True
+            if not entry[1].done(): entry[1].cancel()
+        if not found: return False
+        self.stats["cancelled"] += 1
+        if self._connected: self._send_q.put_nowait(tts_protocol.frame_msg(tts_protocol.cancel_msg(request_id)))
+        return True
+
+    def close(self):
+        if self._loop is None or self._closed: return
+        self._closed = True
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(timeout=5)
+        if self._owns_loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _close(self):
+        if self._run_task: self._run_task.cancel()
+        for _, future in list(self._inflight.values()):
+            if not future.done(): future.cancel()
+        self._inflight.clear()
+
+    def _encode(self, payload):
+        if self.binary_frames: payload = dict(payload, frame_format="binary")
+        return tts_protocol.frame_msg(json.dumps(payload).encode('utf-8'))
+
+    async def _run(self):
+        attempt = 0
+        while not self._closed:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                        timeout=self.connect_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                attempt += 1
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay = random.uniform(delay / 2, delay)
+                self.log(f"❌ 连接TTS服务器 {self.host}:{self.port} 失败: {e}，{delay:.2f}秒后重试。")
+                await asyncio.sleep(delay)
+                continue
+
+            self.stats["connects"] += 1
+            if self.stats["connects"] > 1: self.stats["reconnects"] += 1
+            attempt = 0
+            self.log(f"✅ 成功连接到TTS服务器 {self.host}:{self.port}。")
+            self._connected = True
+            self.codec = "wav"
+            # hello 直接写入，保证排在重发的请求之前
+            if self.codecs: writer.write(tts_protocol.frame_msg(tts_protocol.hello_msg(self.codecs)))
+            self._notify_connection_change(True)
+            self._replay_inflight()
+            tasks = [asyncio.ensure_future(self._reader_loop(reader)),
+                     asyncio.ensure_future(self._writer_loop(writer))]
+            try:
+                done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception(): self.log(f"与服务器 {self.host}:{self.port} 连接中断: {task.exception()}")
+            finally:
+                self._connected = False
+                self.stats["disconnects"] += 1
+                for task in tasks: task.cancel()
+                writer.close()
+                self._notify_connection_change(False)
+
+    def _notify_connection_change(self, connected):
+        if not self.on_connection_change: return
+        try:
+            self.on_connection_change(self, connected)
+        except Exception as e:
+            self.log(f"处理连接状态变化时出错: {e}")
+
+    def abandon_inflight(self, exc):
+        """放弃所有等待中的请求，让等待方收到 exc 并自行转发到其它服务器；返回被放弃的请求数"""
+        abandoned = [future for _, future in self._inflight.values() if not future.done()]
+        self._inflight.clear()
+        for future in abandoned: future.set_exception(exc)
+        return len(abandoned)
+
+    def _replay_inflight(self):
+        """重连后清空旧的发送队列，按原顺序重发仍在等待回复的请求"""
+        while not self._send_q.empty(): self._send_q.get_nowait()
+        for key, (payload, future) in list(self._inflight.items()):
+            if future.done(): continue
+            if self.is_pending and not self.is_pending(key[0]):
+                future.cancel(); continue
+            self._send_q.put_nowait(self._encode(payload))
+            if self.stats["connects"] > 1: self.stats["resent"] += 1
+
+    async def _writer_loop(self, writer):
+        while True:
+            batch = [await self._send_q.get()]
+            while not self._send_q.empty(): batch.append(self._send_q.get_nowait())
+            writer.write(b''.join(batch))
+            await writer.drain()
+
+    async def _reader_loop(self, reader):
+        while True:
+            msglen = tts_protocol.LENGTH_PREFIX.unpack(await reader.readexactly(tts_protocol.LENGTH_PREFIX.size))[0]
+            head = await reader.readexactly(min(msglen, tts_protocol.FRAME_HEADER.size))
+            if tts_protocol.is_binary_frame(head):
+                ext = await reader.readexactly(tts_protocol.frame_ext_size(head))
+                audio = await reader.readexactly(msglen - len(head) - len(ext))
+                packet = tts_protocol.parse_frame_header(head, audio, ext)
+            else:
+                packet = tts_protocol.parse_json_packet(head + await reader.readexactly(msglen - len(head)))
+            self._dispatch(packet)
+
+    def _dispatch(self, packet):
+        if packet.get('type') == tts_protocol.MSG_HELLO_ACK: self.codec = packet.get('codec', "wav")
+        key = (packet.get('request_id'), bool(packet.get('is_assistant')))
+        # 流式回包要等最后一块到达才算完成；中途断线重连会从第0块重发，由接收方去重
+        if packet.get('end_of_stream', True) or packet.get('status') == 'error':
+            entry = self._inflight.pop(key, None)
+            if entry and not entry[1].done(): entry[1].set_result(packet)
+        try:
+            self.on_packet(packet)
+        except Exception as e:
+            self.log(f"处理服务器回包时出错: {e}")
@@ -0,0 +1,76 @@
+# audio_codecs.py
+# 线路上的音频压缩：服务器与客户端在连接握手时协商编码，音频帧按协商结果压缩后传输。
+# - flac: 无损，解码结果与原WAV逐采样一致；
+# - opus: 有损，码率低得多，只在调用方明确要求时使用；
+# - wav: 不压缩，任何一方不支持压缩时的回退。
+# flac/opus 依赖可选的 soundfile(libsndfile)，未安装时只能使用 wav。
+import io
+from audio_pcm import PcmClip
+
+WAV, FLAC, OPUS = "wav", "flac", "opus"
+LOSSLESS = (FLAC, WAV)
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class CodecError(ValueError):
+    """编码不可用，或这段音频不能用该编码（调用方应回退到 wav）"""
+
+
+def _soundfile():
+    try:
+        import soundfile
+    except (ImportError, OSError):  # 缺少 libsndfile 时导入抛出 OSError
+        return None
+    return soundfile
+
+
+def available_codecs(lossless=True):
+    """本机可编解码的格式，按优先顺序排列，最后总是 wav"""
+    soundfile = _soundfile()
+    codecs = []
+    if soundfile is not None:
+        formats = soundfile.available_formats()
+        if not lossless and "OPUS" in soundfile.available_subtypes("OGG"): codecs.append(OPUS)
+        if "FLAC" in formats: codecs.append(FLAC)
+    return codecs + [WAV]
+
+
+def choose(offered, supported):
+    """握手时服务器端的选择：客户端给出的偏好列表中第一个本端也支持的编码"""
+    return next((codec for codec in offered if codec in supported), WAV)
+
+
+def encode(clip, codec):
+    """把 PcmClip（或WAV字节）按 codec 编码为线路上传输的字节"""
+    if not isinstance(clip, PcmClip): clip = PcmClip.from_bytes(clip)
+    if codec == WAV: return clip.to_wav_bytes()
+    soundfile = _soundfile()
+    if soundfile is None: raise CodecError(f"未安装 soundfile，无法使用 {codec} 编码")
+    if clip.sample_width != 2: raise CodecError(f"{codec} 编码只处理16位PCM，当前为 {clip.sample_width * 8} 位")
+    if codec == FLAC:
+        fmt, subtype = "FLAC", "PCM_16"
+    elif codec == OPUS:
+        fmt, subtype = "OGG", "OPUS"
+        # Opus 只支持固定的几种采样率，其他采样率先重采样到48k
+        if clip.sample_rate not in OPUS_SAMPLE_RATES: clip = clip.convert(48000, 2, clip.channels)
+    else:
+        raise CodecError(f"未知的音频编码: {codec}")
+    buf = io.BytesIO()
+    with soundfile.SoundFile(buf, 'w', clip.sample_rate, clip.channels, subtype, format=fmt) as f:
+        f.buffer_write(clip.pcm, dtype='int16')
+    return buf.getvalue()
+
+
+def decode(data, codec):
+    """把线路上的字节解码为 PcmClip；wav 走原来的零拷贝解析"""
+    if codec == WAV: return PcmClip.from_bytes(data)
+    soundfile = _soundfile()
+    if soundfile is None or codec not in (FLAC, OPUS): raise CodecError(f"无法解码 {codec} 音频")
+    with soundfile.SoundFile(io.BytesIO(bytes(data))) as f:
+        pcm = f.buffer_read(dtype='int16')
+        return PcmClip(memoryview(pcm), f.samplerate, 2, f.channels)
+
+
+def decode_to_wav(data, codec):
+    """解码为WAV字节，下游（重组、缓存、助播台词池）仍按原WAV路径处理"""
+    return decode(data, codec).to_wav_bytes()
@@ -0,0 +1,151 @@
+# audio_pcm.py
+# 内存中的PCM音频片段：直接从收到的字节解码、拼接，不经过磁盘。
+# WAV由标准库解析（零拷贝切出PCM数据），其他格式交给pydub解码。
+import io, struct, threading, wave
+from pydub import AudioSegment
+
+
+class PcmClip:
+    """一段原始PCM音频及其采样格式"""
+    __slots__ = ('pcm', 'sample_rate', 'sample_width', 'channels')
+
+    def __init__(self, pcm, sample_rate, sample_width, channels):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+
+    @property
+    def format(self):
+        return (self.sample_rate, self.sample_width, self.channels)
+
+    @property
+    def frame_size(self):
+        return self.sample_width * self.channels
+
+    @property
+    def duration(self):
+        """时长（秒）"""
+        return len(self.pcm) / float(self.frame_size * self.sample_rate)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """解码服务器返回的音频字节，优先走WAV快速路径"""
+        clip = cls.from_wav_buffer(data)
+        if clip is not None: return clip
+        return cls.from_segment(AudioSegment.from_file(io.BytesIO(bytes(data))))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'rb') as f: return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_wav_buffer(cls, data):
+        """解析RIFF/WAVE头部，返回指向原缓冲区的PCM切片；不是PCM WAV时返回None"""
+        view = memoryview(data)
+        if len(view) < 12 or view[:4] != b'RIFF' or view[8:12] != b'WAVE': return None
+        fmt = None
+        pos = 12
+        while pos + 8 <= len(view):
+            chunk_id = bytes(view[pos:pos + 4])
+            chunk_size = struct.unpack_from('<I', view, pos + 4)[0]
+            body = pos + 8
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack_from('<HHIIHH', view, body)
+            elif chunk_id == b'data' and fmt is not None:
+                audio_format, channels, sample_rate, _, _, bits = fmt
+                if audio_format not in (1, 0xFFFE): return None  # 仅处理整型PCM
+                end = min(body + chunk_size, len(view))  # 流式输出的WAV长度字段可能不准
+                return cls(view[body:end], sample_rate, bits // 8, channels)
+            pos = body + chunk_size + (chunk_size & 1)
+        return None
+
+    @classmethod
+    def from_segment(cls, segment):
+        return cls(segment.raw_data, segment.frame_rate, segment.sample_width, segment.channels)
+
+    def to_segment(self):
+        return AudioSegment(data=bytes(self.pcm), sample_width=self.sample_width,
+                            frame_rate=self.sample_rate, channels=self.channels)
+
+    def convert(self, sample_rate, sample_width, channels):
+        """转换到指定采样格式，格式相同时原样返回"""
+        if self.format == (sample_rate, sample_width, channels): return self
+        segment = self.to_segment().set_frame_rate(sample_rate).set_sample_width(sample_width).set_channels(channels)
+        return PcmClip.from_segment(segment)
+
+    def __add__(self, other):
+        """拼接两段音频，格式不同时只对后一段做一次重采样"""
+        other = other.convert(*self.format)
+        return PcmClip(b''.join((self.pcm, other.pcm)), *self.format)
+
+    def to_wav_bytes(self):
+        buf = io.BytesIO()
+        self._write_wav(buf)
+        return buf.getvalue()
+
+    def write_wav(self, path):
+        with open(path, 'wb') as f: self._write_wav(f)
+
+    def _write_wav(self, fileobj):
+        with wave.open(fileobj, 'wb') as w:
+            w.setnchannels(self.channels)
+            w.setsampwidth(self.sample_width)
+            w.setframerate(self.sample_rate)
+            w.writeframes(self.pcm)
+
+
+class StreamingClip:
+    """边接收边播放的音频：PCM分块陆续追加，播放端按顺序读取，finish() 之后读取结束"""
+    def __init__(self, first_piece):
+        self.format = first_piece.format
+        self._pieces = [first_piece]
+        self._finished = False
+        self._cond = threading.Condition()
+
+    @property
+    def duration(self):
+        """已收到部分的时长（秒）"""
+        with self._cond: return sum(piece.duration for piece in self._pieces)
+
+    @property
+    def finished(self):
+        return self._finished
+
+    def append(self, piece):
+        with self._cond:
+            self._pieces.append(piece.convert(*self.format))
+            self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def wake(self):
+        """唤醒正在等待下一块的读取方，让它重新检查 cancel"""
+        with self._cond: self._cond.notify_all()
+
+    def iter_pieces(self, timeout=None, cancel=None):
+        """按到达顺序产出PcmClip分块；等待下一块超过 timeout 秒视为流中断，提前结束。
+        cancel 为 threading.Event，等待期间被设置（并调用 wake()）时立即结束"""
+        index = 0
+        cancelled = cancel.is_set if cancel is not None else lambda: False
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: index < len(self._pieces) or self._finished or cancelled(),
+                                           timeout): return
+                if index >= len(self._pieces): return
+                piece = self._pieces[index]
+            index += 1
+            yield piece
+
+    def snapshot(self):
+        """把目前已收到的分块合并为一个PcmClip"""
+        with self._cond:
+            return PcmClip(b''.join(bytes(piece.pcm) for piece in self._pieces), *self.format)
+
+    def to_clip(self, timeout=None):
+        """等待流结束后返回完整音频（供只能播放完整文件的后端使用）"""
+        with self._cond: self._cond.wait_for(lambda: self._finished, timeout)
+        return self.snapshot()
@@ -0,0 +1,200 @@
+# audio_spool.py
+# 生成音频的落盘目录管理：
+# - 文件名由进程号、seq 和自增计数组成，并发写入不会互相覆盖；
+# - 先写 .part 再 os.replace，同一文件系统内直接原子移动，跨文件系统时复制后再原子改名；
+# - 可放在内存盘(/dev/shm)上，并限制占用的总字节数；
+# - 启动时清理崩溃残留的文件（所属进程确定已不存在，或属于本进程但超过 orphan_age 秒）；
+# - 删除失败的文件（Windows 上仍被占用）继续占用配额，之后重试删除，配额始终与磁盘上的文件一致。
+# 播放时大文件通过 mmap 读取，PCM 数据直接引用映射的页面而不是再复制一份；小文件直接读入内存。
+import contextlib, ctypes, itertools, mmap, os, re, shutil, tempfile, threading, time
+from audio_pcm import PcmClip
+
+
+class SpoolFull(RuntimeError):
+    pass
+
+
+def _pid_alive(pid):
+    """进程是否存在；无法确定时返回None（调用方按存活处理）"""
+    if os.name == 'nt': return _pid_alive_windows(pid)
+    if os.name != 'posix': return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pid_alive_windows(pid):
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+    if not handle:
+        return False if ctypes.get_last_error() == 87 else None  # ERROR_INVALID_PARAMETER：没有这个进程
+    try:
+        code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)): return None
+        return code.value == 259  # STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def default_ram_dir():
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class AudioSpool:
+    def __init__(self, directory=None, quota_bytes=256 * 1024 * 1024, ram=False, prefix="tts", orphan_age=600.0,
+                 mmap_min_bytes=1024 * 1024):
+        """directory 为空时使用临时目录（ram=True 时为内存盘）下的 {prefix}_spool；
+        open_clip 对小于 mmap_min_bytes 的文件直接读入内存"""
+        if directory is None:
+            directory = os.path.join(default_ram_dir() if ram else tempfile.gettempdir(), f"{prefix}_spool")
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.prefix = prefix
+        self.orphan_age = orphan_age
+        self.mmap_min_bytes = mmap_min_bytes
+        self._pattern = re.compile(rf"^{re.escape(prefix)}_(\d+)_.*")
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._files = {}  # 路径 -> 字节数
+        self._undeleted = set()  # 已释放但删除失败、等待重试的路径，仍计入配额
+        self._bytes = 0
+        self.stats = {"moved": 0, "copied": 0, "written": 0, "released": 0, "rejected": 0, "orphans_removed": 0,
+                      "remove_failures": 0}
+        self.cleanup_orphans()
+
+    @property
+    def used_bytes(self):
+        return self._bytes
+
+    def path_for(self, tag=None, suffix=".wav"):
+        """生成不重复的文件路径；tag 一般为任务 seq，便于排查"""
+        name = f"{self.prefix}_{os.getpid()}_{'' if tag is None else f'{tag}_'}{next(self._counter)}{suffix}"
+        return os.path.join(self.directory, name)
+
+    def adopt(self, src, tag=None):
+        """把外部生成的文件（如 gradio 的临时文件）移入spool，返回新路径；超出配额时抛出 SpoolFull，源文件保持不动"""
+        size = os.path.getsize(src)
+        dst = self.path_for(tag, os.path.splitext(src)[1] or ".wav")
+        self._reserve(dst, size)
+        try:
+            try:
+                os.replace(src, dst)  # 同一文件系统：原子改名，不复制数据
+                self.stats["moved"] += 1
+            except OSError:
+                part = dst + ".part"
+                shutil.copyfile(src, part)
+                os.replace(part, dst)
+                os.remove(src)
+                self.stats["copied"] += 1
+        except BaseException:
+            self._unreserve(dst)
+            raise
+        return dst
+
+    def write(self, clip, tag=None):
+        """把 PcmClip 或 WAV 字节写入spool，返回路径"""
+        data = clip.to_wav_bytes() if isinstance(clip, PcmClip) else clip
+        dst = self.path_for(tag)
+        self._reserve(dst, len(data))
+        try:
+            part = dst + ".part"
+            with open(part, 'wb') as f: f.write(data)
+            os.replace(part, dst)
+        except BaseException:
+            self._unreserve(dst)
+            raise
+        self.stats["written"] += 1
+        return dst
+
+    def release(self, path):
+        """删除播放完的文件并归还配额；删除失败时保留配额，下次 release/写入时重试"""
+        self._retry_removals()
+        self._remove(path)
+
+    def owns(self, path):
+        return path in self._files
+
+    @contextlib.contextmanager
+    def open_clip(self, path):
+        """with spool.open_clip(path) as clip: 大文件以只读 mmap 打开，PcmClip 直接引用映射的内存，
+        退出 with 时解除映射（之后 release 才能在 Windows 上删掉文件）；小文件直接读入内存"""
+        if os.path.getsize(path) < self.mmap_min_bytes:
+            yield PcmClip.from_file(path)
+            return
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        clip = None
+        try:
+            clip = PcmClip.from_wav_buffer(mapped)
+            yield clip if clip is not None else PcmClip.from_bytes(mapped[:])
+        finally:
+            if clip is not None: clip.pcm.release()
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # 调用方仍持有切片，映射随其一起释放；删除失败时 release 会重试
+
+    def cleanup_orphans(self):
+        """删除本前缀下确定已不存在的进程留下的文件，以及本进程未登记且超过 orphan_age 的残留文件。
+        无法探测进程是否存在时保留文件，不按年龄删除其他进程可能还在播放的文件"""
+        now = time.time()
+        removed = 0
+        for name in os.listdir(self.directory):
+            match = self._pattern.match(name)
+            if not match: continue
+            path = os.path.join(self.directory, name)
+            pid = int(match.group(1))
+            if pid == os.getpid() and path in self._files: continue
+            alive = _pid_alive(pid)
+            try:
+                expired = now - os.path.getmtime(path) > self.orphan_age
+                if alive is False or (pid == os.getpid() and expired):
+                    os.remove(path); removed += 1
+            except OSError:
+                pass
+        self.stats["orphans_removed"] += removed
+        return removed
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, files=len(self._files), undeleted=len(self._undeleted), used_bytes=self._bytes,
+                        quota_bytes=self.quota_bytes)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            with self._lock:
+                if path in self._files and path not in self._undeleted:
+                    self._undeleted.add(path)
+                    self.stats["remove_failures"] += 1
+            return
+        with self._lock: self._undeleted.discard(path)
+        if self._unreserve(path): self.stats["released"] += 1
+
+    def _retry_removals(self):
+        with self._lock: pending = list(self._undeleted)
+        for path in pending: self._remove(path)
+
+    def _reserve(self, path, size):
+        self._retry_removals()
+        with self._lock:
+            if self.quota_bytes is not None and self._bytes + size > self.quota_bytes:
+                self.stats["rejected"] += 1
+                raise SpoolFull(f"spool目录已用 {self._bytes} 字节，写入 {size} 字节将超过配额 {self.quota_bytes}")
+            self._files[path] = size
+            self._bytes += size
+
+    def _unreserve(self, path):
+        with self._lock:
+            size = self._files.pop(path, None)
+            if size is None: return False
+            self._bytes -= size
+            return True
@@ -0,0 +1,89 @@
+# bench_codecs.py
+# 对比线路上各种音频格式的带宽和编解码CPU：JSON+base64 WAV、二进制帧 WAV、FLAC(无损)、Opus(有损)。
+# 报告每秒音频占用的字节数、相对二进制WAV的压缩比、每秒音频的编码/解码CPU毫秒数，以及解码结果是否与WAV逐采样一致。
+# 默认用合成的类语音信号（谐波+音节包络+停顿+底噪）；最好用 --wav 指定一段真实的TTS输出。
+# 用法: python benchmarks/bench_codecs.py [--wav sample.wav] [--seconds 10] [--repeat 5] [--workers 4]
+import argparse, array, base64, json, math, os, random, sys, time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import audio_codecs
+from audio_pcm import PcmClip
+
+
+def speech_like_clip(seconds, sample_rate=32000, seed=1):
+    """基频缓慢起伏的谐波，按每秒约4个音节做幅度包络，音节间夹短停顿，再叠加少量底噪；
+    纯正弦波压缩率高得不真实，这样更接近语音的压缩表现"""
+    rng = random.Random(seed)
+    samples = array.array('h')
+    phase = [0.0] * 12
+    n = int(seconds * sample_rate)
+    syllable = int(sample_rate / 4)
+    for i in range(n):
+        t = i / sample_rate
+        pos = i % syllable
+        if (i // syllable) % 7 == 6: envelope = 0.0  # 每7个音节停顿一次
+        else: envelope = math.sin(math.pi * pos / syllable) ** 2
+        f0 = 180 + 30 * math.sin(2 * math.pi * 0.7 * t) + 10 * math.sin(2 * math.pi * 5.3 * t)
+        value = 0.0
+        for h in range(12):
+            phase[h] += 2 * math.pi * f0 * (h + 1) / sample_rate
+            value += math.sin(phase[h]) / (h + 1) ** 1.2
+        value = value * envelope * 6000 + rng.gauss(0, 60)
+        samples.append(max(-32768, min(32767, int(value))))
+    return PcmClip(samples.tobytes(), sample_rate, 2, 1)
+
+
+def cpu_per_audio_second(fn, repeat, seconds):
+    """重复执行 fn，返回每秒音频消耗的CPU毫秒数（process_time，包含所有线程）"""
+    start = time.process_time()
+    for _ in range(repeat): result = fn()
+    return (time.process_time() - start) * 1000.0 / (repeat * seconds), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线路音频编码基准")
+    parser.add_argument('--wav', help="用这段WAV测量（默认合成类语音信号）")
+    parser.add_argument('--seconds', type=float, default=10.0, help="合成信号的时长")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4, help="并行解码测量用的线程数")
+    parser.add_argument('--json', action='store_true', help="以JSON输出结果")
+    args = parser.parse_args()
+
+    clip = PcmClip.from_file(args.wav) if args.wav else speech_like_clip(args.seconds)
+    seconds = clip.duration
+    wav = clip.to_wav_bytes()
+    available = audio_codecs.available_codecs(lossless=False)
+    results = {}
+
+    encoded = base64.b64encode(wav)
+    b64_ms, _ = cpu_per_audio_second(lambda: base64.b64decode(encoded), args.repeat, seconds)
+    results["json_base64_wav"] = {"bytes_per_second": len(encoded) / seconds, "ratio_vs_wav": len(wav) / float(len(encoded)),
+                                  "decode_cpu_ms_per_second": b64_ms, "lossless": True}
+    for codec in available:
+        encode_ms, data = cpu_per_audio_second(lambda: audio_codecs.encode(clip, codec), args.repeat, seconds)
+        decode_ms, decoded = cpu_per_audio_second(lambda: audio_codecs.decode(data, codec), args.repeat, seconds)
+        # 与现有WAV路径对比：格式相同且PCM逐字节相同才算无损
+        lossless = decoded.format == clip.format and bytes(decoded.pcm) == bytes(clip.pcm)
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: audio_codecs.decode(data, codec), range(args.workers * args.repeat)))
+            parallel = args.workers * args.repeat * seconds / (time.perf_counter() - start)
+        results[codec] = {"bytes_per_second": len(data) / seconds, "ratio_vs_wav": len(wav) / float(len(data)),
+                          "encode_cpu_ms_per_second": encode_ms, "decode_cpu_ms_per_second": decode_ms,
+                          "decode_audio_seconds_per_wall_second": parallel, "lossless": lossless}
+    results["binary_wav"] = results.pop(audio_codecs.WAV)
+
+    report = {"audio_seconds": seconds, "format": clip.format, "codecs": available, "results": results}
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    print(f"音频 {seconds:.1f} 秒，格式 {clip.format}，可用编码 {available}")
+    print(f"{'格式':18s} {'字节/秒':>10s} {'压缩比':>7s} {'编码ms/秒':>10s} {'解码ms/秒':>10s} {'并行解码x实时':>14s} 无损")
+    for name, r in results.items():
+        print(f"{name:18s} {r['bytes_per_second']:10.0f} {r.get('ratio_vs_wav', 0):7.2f} "
+              f"{r.get('encode_cpu_ms_per_second', 0):10.2f} {r['decode_cpu_ms_per_second']:10.2f} "
+              f"{r.get('decode_audio_seconds_per_wall_second', 0):14.0f} {'是' if r['lossless'] else '否'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# bench_keyword_matcher.py
+# 对比原来的逐词循环与 Aho-Corasick 自动机在真实规模词表下的耗时。
+# 用法: python benchmarks/bench_keyword_matcher.py [敏感词数] [关键词数] [句子数]
+import os, random, sys, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keyword_matcher import MultiPatternMatcher
+
+# 常用汉字范围内随机取字，模拟中文词表和直播话术
+CHARS = [chr(c) for c in range(0x4E00, 0x4E00 + 2500)]
+
+
+def random_words(n, rng, min_len=2, max_len=4):
+    return list({''.join(rng.choice(CHARS) for _ in range(rng.randint(min_len, max_len))) for _ in range(n)})
+
+
+def random_sentences(n, words, rng, min_len=30, max_len=150):
+    sentences = []
+    for _ in range(n):
+        parts = [''.join(rng.choice(CHARS) for _ in range(rng.randint(min_len, max_len)))]
+        if rng.random() < 0.3: parts.insert(rng.randint(0, 1), rng.choice(words))  # 约三成句子带关键词/敏感词
+        sentences.append(''.join(parts))
+    return sentences
+
+
+def legacy_filter(text, sensitive_words):
+    for word in sensitive_words:
+        text = text.replace(word, "**")
+    return text
+
+
+def legacy_trigger(text, keyword_responses):
+    return next((kw for kw in keyword_responses if kw in text), None)
+
+
+def main():
+    n_sensitive = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    n_keywords = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    n_sentences = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    rng = random.Random(42)
+    sensitive_words = random_words(n_sensitive, rng)
+    keyword_responses = {kw: "" for kw in random_words(n_keywords, rng)}
+    sentences = random_sentences(n_sentences, sensitive_words + list(keyword_responses), rng)
+
+    start = time.perf_counter()
+    matcher = MultiPatternMatcher()
+    matcher.update('sensitive', sensitive_words)
+    matcher.update('keyword', keyword_responses)
+    matcher.find_all("")
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for s in sentences:
+        legacy_trigger(legacy_filter(s, sensitive_words), keyword_responses)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for s in sentences:
+        matches = matcher.find_all(s)
+        matcher.select_non_overlapping([m for m in matches if 'sensitive' in m.tags])
+        [m for m in matches if 'keyword' in m.tags]
+    matcher_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher.update('keyword', list(keyword_responses)[:-10] + random_words(10, rng))
+    matcher.find_all("")
+    rebuild_time = time.perf_counter() - start
+
+    print(f"敏感词 {len(sensitive_words)} 个, 关键词 {len(keyword_responses)} 个, 句子 {n_sentences} 条")
+    print(f"自动机构建:       {build_time * 1000:8.1f} ms")
+    print(f"词表更新后重建:   {rebuild_time * 1000:8.1f} ms")
+    print(f"原逐词循环:       {legacy_time * 1e6 / n_sentences:8.1f} us/句")
+    print(f"Aho-Corasick:     {matcher_time * 1e6 / n_sentences:8.1f} us/句")
+    print(f"加速比:           {legacy_time / matcher_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# bench_pipeline.py
+# 端到端基准：用本地TTS替身服务器和假AI模块驱动 TTSClientGenerator / TTSGenerator，
+# 按固定速率调用 add_task，报告首音延迟、句子到播放的延迟分位数、队列深度变化、创建的线程数和峰值RSS。
+# 用法:
+#   python benchmarks/bench_pipeline.py client --tasks 50 --rate 5 --transport asyncio --streaming
+#   python benchmarks/bench_pipeline.py generator --tasks 30 --rate 2
+import argparse, json, os, sys, tempfile, threading, time, types
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_ai
+from loopback_server import LoopbackTTSServer, synth_wav
+
+try:
+    import ali  # noqa: F401
+except ImportError:
+    sys.modules['ali'] = fake_ai  # main.py 在导入时需要 ali.AIResponseGenerator
+
+from playback_engine import NullSink
+from audio_pcm import PcmClip
+
+KEYWORDS = {"下单": "现在下单最划算！", "优惠": "优惠只有今天！", "库存": "库存真的不多了！"}  # 推测模式下预合成进台词池
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024.0 if sys.platform != 'darwin' else rss / (1024.0 * 1024.0)
+    except ImportError:
+        return None
+
+
+def percentile(values, p):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+class Recorder:
+    """记录每句的受理/开播时间、队列深度采样和线程创建数"""
+    def __init__(self):
+        self.accepted = {}
+        self.started = {}
+        self.play_starts = []
+        self.samples = []  # (相对时间, 播放队列深度, 在途任务数, 活动线程数)
+        self.threads_created = 0
+        self.t0 = time.monotonic()
+        self._stop = threading.Event()
+        original_start = threading.Thread.start
+        recorder = self
+        def counting_start(thread, *args, **kwargs):
+            recorder.threads_created += 1
+            return original_start(thread, *args, **kwargs)
+        threading.Thread.start = counting_start
+
+    def accept(self, key):
+        self.accepted[key] = time.monotonic()
+
+    def on_play(self, key):
+        now = time.monotonic()
+        self.play_starts.append(now)
+        self.started.setdefault(key, now)
+
+    def sample(self, queue_depth, in_flight, interval=0.05):
+        def loop():
+            while not self._stop.wait(interval):
+                self.samples.append((time.monotonic() - self.t0, queue_depth(), in_flight(), threading.active_count()))
+        threading.Thread(target=loop, daemon=True, name="BenchSampler").start()
+
+    def stop(self):
+        self._stop.set()
+
+    def report(self, latencies, extra=None):
+        first_accept = min(self.accepted.values()) if self.accepted else None
+        result = {
+            "tasks": len(self.accepted),
+            "played": len(latencies),
+            "time_to_first_audio_s": (min(self.play_starts) - first_accept) if self.play_starts and first_accept else None,
+            "latency_p50_s": percentile(latencies, 50),
+            "latency_p90_s": percentile(latencies, 90),
+            "latency_p99_s": percentile(latencies, 99),
+            "latency_max_s": max(latencies) if latencies else None,
+            "max_queue_depth": max((s[1] for s in self.samples), default=0),
+            "max_in_flight": max((s[2] for s in self.samples), default=0),
+            "peak_threads": max((s[3] for s in self.samples), default=threading.active_count()),
+            "threads_created": self.threads_created,
+            "peak_rss_mb": peak_rss_mb(),
+            "queue_depth_timeline": [(round(t, 2), q, f) for t, q, f, _ in self.samples[::10]],
+        }
+        if extra: result.update(extra)
+        return result
+
+
+def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate(): return True
+        time.sleep(0.05)
+    return False
+
+
+def make_text(i, keyword_every, effects_every=0):
+    text = f"第{i}句，这款产品今天在直播间特别划算，大家可以放心购买"
+    if effects_every and i % effects_every == 0: text = text.replace("，", "，[咳嗽]", 1)
+    if keyword_every and i % keyword_every == 0: text += "，现在下单还有优惠"
+    return text + "。"
+
+
+def make_sounds(seconds=0.3):
+    """临时音效目录：内嵌在话术中的 [咳嗽] 用一段合成音代替"""
+    directory = tempfile.mkdtemp(prefix="bench_sounds_")
+    with open(os.path.join(directory, "cough.wav"), 'wb') as f: f.write(synth_wav(seconds, sample_rate=16000, freq=440.0))
+    return directory, {"[咳嗽]": "cough.wav"}
+
+
+def text_deltas(text, size, interval=0.02):
+    """模拟流式AI回复：每隔 interval 秒到达 size 个字"""
+    for i in range(0, len(text), size):
+        time.sleep(interval)
+        yield text[i:i + size]
+
+
+def bench_client(args, server, recorder):
+    from main import TTSClientGenerator
+    ai = fake_ai.FakeAIResponseGenerator(delay=args.ai_delay, seed=1)
+    sounds_path, sounds_library = make_sounds()
+    gen = TTSClientGenerator(server.host, server.port, tempfile.mkdtemp(prefix="bench_client_"),
+                             now_playing_callback=recorder.on_play, keyword_responses=KEYWORDS, ai_generator=ai,
+                             playback_sink=NullSink(realtime=args.realtime), transport=args.transport,
+                             streaming=args.streaming, speculative_assistant=args.speculative,
+                             buffer_target_seconds=args.buffer_target, first_segment_chars=args.first_segment_chars,
+                             sounds_path=sounds_path, sounds_library=sounds_library,
+                             **({"audio_codecs": args.codecs.split(',')} if args.codecs is not None else {}))
+    recorder.sample(gen.play_queue.qsize, gen.get_unprocessed_size)
+    i = 0
+    urgent = set()
+    while i < args.tasks:
+        if args.demand:
+            # 按调度器给出的需求量生成话术，而不是固定速率
+            seconds, chars = gen.wait_for_demand(timeout=1.0)
+            if not seconds: continue
+        else:
+            chars = 0
+        while i < args.tasks:
+            text = make_text(i, args.keyword_every, args.effects_every)
+            recorder.accept(text.replace(" ", ""))
+            priority = 0 if args.urgent_every and i % args.urgent_every == args.urgent_every - 1 else args.priority
+            if priority == 0: urgent.add(text.replace(" ", ""))
+            if args.stream_text: gen.add_text_stream(text_deltas(text, args.stream_text), priority=priority)
+            else: gen.add_task(text, priority=priority)
+            i += 1
+            chars -= len(text)
+            if chars <= 0: break
+        if not args.demand: time.sleep(1.0 / args.rate)
+    # 优先级1的任务会被新任务顶替取消，不一定全部播放，所以等到全部处理完为止
+    wait_until(lambda: gen.scheduler.get_stats()["tasks"] == 0 and gen.play_queue.empty() and gen._playing_priority is None,
+               args.timeout)
+    # 一条文本可能被分成几段，按首段开始播放的时间计算延迟
+    started = {text: min((t for k, t in recorder.started.items() if text.startswith(k)), default=None)
+               for text in recorder.accepted}
+    urgent_latencies = [started[k] - recorder.accepted[k] for k in urgent if started[k] is not None]
+    extra = {"reassembly": gen.get_reassembly_metrics(), "cache": gen.synthesis_cache.get_stats(),
+             "urgent_latency_p90_s": percentile(urgent_latencies, 90), "urgent_played": len(urgent_latencies),
+             "scheduler": gen.scheduler.get_stats(), "sounds": gen.sound_bank.get_stats(),
+             "engine": gen.playback_engine.stats if gen.playback_engine else None,
+             "stage_metrics": gen.get_metrics()}
+    gen.stop()
+    return [started[k] - t for k, t in recorder.accepted.items() if started[k] is not None], extra
+
+
+class FakeGradioClient:
+    """gradio_client.Client 的替身，模拟 /get_tts_wav 接口：按延迟写出合成WAV并返回临时文件路径"""
+    def __init__(self, server):
+        self.server = server
+
+    def predict(self, *args, text="", how_to_cut=None, pause_second=0.3, **kwargs):
+        time.sleep(self.server.delay + self.server.delay_per_char * len(text))
+        fd, path = tempfile.mkstemp(suffix=".wav", prefix="fake_gradio_")
+        segments = [s for s in text.split("。") if s.strip()] if how_to_cut == "按中文句号。切" else [text]
+        clip = None
+        for segment in segments:
+            # 与 GPT-SoVITS 相同，切分后的各段之间插入 pause_second 秒静音
+            piece = PcmClip.from_bytes(synth_wav(max(0.2, len(segment) * self.server.seconds_per_char),
+                                                 self.server.sample_rate))
+            if clip is not None:
+                silence = PcmClip(bytes(int(pause_second * piece.sample_rate) * piece.frame_size), *piece.format)
+                piece = silence + piece
+            clip = piece if clip is None else clip + piece
+        with os.fdopen(fd, 'wb') as f:
+            f.write(clip.to_wav_bytes())
+        return path
+
+
+def bench_generator(args, server, recorder):
+    try:
+        import gradio_client  # noqa: F401
+    except ImportError:
+        sys.modules['gradio_client'] = types.SimpleNamespace(Client=None, handle_file=None)
+    import tts_generator
+    tts_generator.Client = lambda url: FakeGradioClient(server)
+    tts_generator.handle_file = lambda path: path
+    gen = tts_generator.TTSGenerator("http://fake", "ref.wav", tempfile.mkdtemp(prefix="bench_gen_"),
+                                     playback_sink=NullSink(realtime=args.realtime),
+                                     chunk_parallelism=args.chunk_parallelism, batch_short_texts=args.batch,
+                                     first_segment_chars=args.first_segment_chars)
+    original_play = gen.playback_engine.play
+    def recording_play(clip):
+        recorder.on_play(len(recorder.play_starts))
+        return original_play(clip)
+    gen.playback_engine.play = recording_play
+    recorder.sample(gen.play_queue.qsize, gen.get_number_ds)
+    for i in range(args.tasks):
+        text = make_text(i, 0) * args.repeat
+        submitted = gen.scheduler.get_stats()["submitted"]
+        accepted = time.monotonic()
+        if args.stream_text: gen.add_text_stream(text_deltas(text, args.stream_text), priority=args.priority)
+        else: gen.add_task(text, priority=args.priority)
+        # 每个分段在调度器里登记一次，用登记数得知这条文本被切成了几段
+        for chunk in range(gen.scheduler.get_stats()["submitted"] - submitted): recorder.accepted[(i, chunk)] = accepted
+        time.sleep(1.0 / args.rate)
+    wait_until(lambda: gen.scheduler.get_stats()["tasks"] == 0, args.timeout)
+    # TTSGenerator 不回调播放内容，按完成顺序与受理顺序配对估算每句延迟
+    accepted = sorted(recorder.accepted.values())
+    return [start - accept for start, accept in zip(sorted(recorder.play_starts), accepted)], None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS管线端到端基准")
+    parser.add_argument('target', choices=['client', 'generator'])
+    parser.add_argument('--tasks', type=int, default=30)
+    parser.add_argument('--rate', type=float, default=4.0, help="每秒调用 add_task 的次数")
+    parser.add_argument('--priority', type=int, default=2)
+    parser.add_argument('--delay', type=float, default=0.2, help="替身服务器每个请求的合成耗时")
+    parser.add_argument('--seconds-per-char', type=float, default=0.02, help="生成音频时长 = 字数 × 该值")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--ai-delay', type=float, default=0.3)
+    parser.add_argument('--keyword-every', type=int, default=3, help="每隔几句带一个助播关键词，0为不带")
+    parser.add_argument('--transport', default='thread', choices=['thread', 'asyncio'])
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--codecs', help="client: 握手时提供的音频编码，逗号分隔，如 flac / opus,flac / wav（默认本机支持的无损编码）")
+    parser.add_argument('--speculative', action='store_true', help="分句前预取助播AI回复，并使用预合成台词")
+    parser.add_argument('--demand', action='store_true', help="client: 按 wait_for_demand 的需求量生成话术（忽略 --rate）")
+    parser.add_argument('--buffer-target', type=float, default=20.0, help="client: 目标缓冲秒数")
+    parser.add_argument('--urgent-every', type=int, default=0, help="client: 每隔几句插入一条优先级0的紧急任务，0为不插入")
+    parser.add_argument('--effects-every', type=int, default=0, help="client: 每隔几句在话术中内嵌一个 [咳嗽] 音效标记，0为不带")
+    parser.add_argument('--realtime', action='store_true', help="按真实时长播放（否则播放不占时间，只测管线）")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--repeat', type=int, default=1, help="generator: 每条文本重复几遍（>200字走长文本分块路径）")
+    parser.add_argument('--chunk-parallelism', type=int, default=3, help="generator: 长文本分块的并发数")
+    parser.add_argument('--batch', action='store_true', help="generator: 合并短文本为一次合成")
+    parser.add_argument('--first-segment-chars', type=int, default=20, help="首段长度上限，设为很大的值即关闭首段取短")
+    parser.add_argument('--delay-per-char', type=float, default=0.0, help="替身服务器每个字额外的合成耗时")
+    parser.add_argument('--stream-text', type=int, default=0, help="每条文本按每次N个字流式送入 add_text_stream，0为整段 add_task")
+    parser.add_argument('--json', action='store_true', help="以JSON输出结果")
+    args = parser.parse_args()
+
+    server = LoopbackTTSServer(delay=args.delay, delay_per_char=args.delay_per_char, seconds_per_char=args.seconds_per_char, error_rate=args.error_rate,
+                               disconnect_rate=args.disconnect_rate, seed=0).start()
+    recorder = Recorder()
+    try:
+        latencies, extra = (bench_client if args.target == 'client' else bench_generator)(args, server, recorder)
+    finally:
+        recorder.stop()
+        server.stop()
+    result = recorder.report(latencies, {"server": server.stats, **(extra or {})})
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+        return
+    for key, value in result.items():
+        if key == "queue_depth_timeline": continue
+        print(f"{key:24s} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# fake_ai.py
+# ali.AIResponseGenerator 的替身：按配置的延迟返回预置台词，可注入空回复和异常。
+import random, time
+
+ASSISTANT_LINES = ["对对对，这个真的划算！", "家人们赶紧下单吧！", "我自己也在用，效果很好。",
+                   "库存不多了，手慢无啊！", "这个价格真的找不到第二家。"]
+
+
+class FakeAIResponseGenerator:
+    def __init__(self, delay=0.3, jitter=0.1, empty_rate=0.0, error_rate=0.0, seed=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.empty_rate = empty_rate
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def get_response(self, user, prompt, history, is_assistant_task=False):
+        self.calls += 1
+        time.sleep(max(0.0, self.delay + self._rng.uniform(-self.jitter, self.jitter)))
+        roll = self._rng.random()
+        if roll < self.error_rate: raise RuntimeError("模拟AI接口异常")
+        if roll < self.error_rate + self.empty_rate: return ""
+        return self._rng.choice(ASSISTANT_LINES)
+
+
+# 与 ali 模块同名，便于在没有 ali 模块的环境中替换导入
+AIResponseGenerator = FakeAIResponseGenerator
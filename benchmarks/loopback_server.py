@@ -0,0 +1,187 @@
+# loopback_server.py
+# 本地TTS服务器替身：与中央服务器使用同样的长度前缀协议（JSON/二进制帧、流式分块），
+# 返回按文本长度生成的合成WAV，可配置合成延迟、并发数，并可按比例注入错误回包和断线。
+# 支持连接握手的编码协商：按客户端的偏好选择本机能编码的格式（--codecs 限制服务器端可用的编码）。
+# 用法: python benchmarks/loopback_server.py --port 9000 --delay 0.3 --error-rate 0.05
+import argparse, array, base64, io, json, math, os, random, socket, sys, threading, time, wave
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tts_protocol, audio_codecs
+
+
+def synth_wav(seconds, sample_rate=32000, freq=220.0):
+    """生成指定时长的16位单声道正弦波WAV"""
+    frames = max(1, int(seconds * sample_rate))
+    samples = array.array('h', (int(8000 * math.sin(2 * math.pi * freq * i / sample_rate)) for i in range(frames)))
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1); w.setsampwidth(2); w.setframerate(sample_rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+class LoopbackTTSServer:
+    def __init__(self, host='127.0.0.1', port=0, delay=0.2, delay_per_char=0.0, seconds_per_char=0.18,
+                 sample_rate=32000, workers=4, error_rate=0.0, disconnect_rate=0.0, chunk_count=4, seed=None,
+                 codecs=None):
+        self.delay = delay  # 每个请求的固定合成耗时（秒）
+        self.delay_per_char = delay_per_char
+        self.seconds_per_char = seconds_per_char  # 生成音频的时长 = 字数 × 该值
+        self.sample_rate = sample_rate
+        self.error_rate = error_rate  # 返回 status=error 的比例
+        self.disconnect_rate = disconnect_rate  # 收到请求后直接断开连接的比例
+        self.chunk_count = chunk_count  # 流式请求拆分的块数
+        self.codecs = audio_codecs.available_codecs(lossless=False) if codecs is None else list(codecs)
+        self._rng = random.Random(seed)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="LoopbackSynth")
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen()
+        self.host, self.port = self._sock.getsockname()[:2]
+        self._stopped = threading.Event()
+        self._conns = set()  # 已接受的连接，stop() 时一并关闭，模拟服务器整体下线
+        self._conns_lock = threading.Lock()
+        self._audio_cache = {}
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "disconnects": 0, "bytes_sent": 0, "cancelled": 0,
+                      "negotiated": {}}
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True, name="LoopbackAccept").start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        try: self._sock.close()
+        except OSError: pass
+        with self._conns_lock: conns, self._conns = self._conns, set()
+        for conn in conns:
+            try: conn.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            conn.close()
+        self._executor.shutdown(wait=False)
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with self._conns_lock:
+                if self._stopped.is_set():
+                    conn.close(); return
+                self._conns.add(conn)
+            self.stats["connections"] += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True, name="LoopbackConn").start()
+
+    def _serve(self, conn):
+        try:
+            self._serve_requests(conn)
+        finally:
+            with self._conns_lock: self._conns.discard(conn)
+            conn.close()
+
+    def _serve_requests(self, conn):
+        send_lock = threading.Lock()
+        session = {"codec": audio_codecs.WAV, "cancelled": set()}  # 本连接协商的编码、被客户端取消的 request_id
+        while not self._stopped.is_set():
+            try:
+                request = tts_protocol.recv_msg(conn)
+            except OSError:
+                return
+            if request is None: return
+            if request.get('type') == tts_protocol.MSG_CANCEL:
+                session["cancelled"].add(request.get('cancel_id')); continue
+            if request.get('type') == tts_protocol.MSG_HELLO:
+                session["codec"] = audio_codecs.choose(request.get('codecs', ()), self.codecs)
+                negotiated = self.stats["negotiated"]
+                negotiated[session["codec"]] = negotiated.get(session["codec"], 0) + 1
+                with send_lock: tts_protocol.send_msg(conn, tts_protocol.hello_ack_msg(session["codec"]))
+                continue
+            if request.get('request_id') is None: continue
+            self.stats["requests"] += 1
+            if self._rng.random() < self.disconnect_rate:
+                self.stats["disconnects"] += 1
+                conn.close(); return
+            try:
+                self._executor.submit(self._respond, conn, send_lock, request, session)
+            except RuntimeError:  # stop() 之后线程池已关闭
+                return
+
+    def _respond(self, conn, send_lock, request, session):
+        cancelled, codec = session["cancelled"], session["codec"]
+        req_id, is_assistant = request['request_id'], bool(request.get('is_assistant'))
+        text = request.get('text', '')
+        if req_id not in cancelled: time.sleep(self.delay + self.delay_per_char * len(text))
+        if req_id in cancelled:  # 排队或合成期间被取消：不再回包
+            cancelled.discard(req_id)
+            self.stats["cancelled"] += 1
+            return
+        binary = request.get('frame_format') == 'binary'
+        try:
+            if self._rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                self._send(conn, send_lock, binary, req_id, is_assistant, b'', status=tts_protocol.STATUS_ERROR)
+                return
+            seconds = max(0.2, len(text) * self.seconds_per_char)
+            if not request.get('stream'):
+                self._send(conn, send_lock, binary, req_id, is_assistant, *self._audio(seconds, codec))
+                return
+            for index in range(self.chunk_count):
+                end = index == self.chunk_count - 1
+                self._send(conn, send_lock, binary, req_id, is_assistant, *self._audio(seconds / self.chunk_count, codec),
+                           chunk_index=index, end_of_stream=end)
+        except OSError:
+            pass
+
+    def _audio(self, seconds, codec):
+        """返回 (编码后的音频, 实际使用的编码)；该段音频不能用协商的编码时回退为WAV"""
+        key = (round(seconds, 2), codec)
+        if key not in self._audio_cache:
+            wav = synth_wav(key[0], self.sample_rate)
+            try:
+                self._audio_cache[key] = (audio_codecs.encode(wav, codec), codec)
+            except audio_codecs.CodecError:
+                self._audio_cache[key] = (wav, audio_codecs.WAV)
+        return self._audio_cache[key]
+
+    def _send(self, conn, send_lock, binary, req_id, is_assistant, audio, codec=audio_codecs.WAV,
+              status=tts_protocol.STATUS_OK, chunk_index=None, end_of_stream=True):
+        with send_lock:
+            if binary:
+                tts_protocol.send_audio_frame(conn, req_id, audio, is_assistant, status, tts_protocol.CODEC_IDS[codec],
+                                              chunk_index=chunk_index, end_of_stream=end_of_stream)
+            else:
+                packet = {"request_id": req_id, "is_assistant": is_assistant,
+                          "status": tts_protocol.STATUS_NAMES[status], "codec": codec,
+                          "audio_data": base64.b64encode(audio).decode('ascii')}
+                if chunk_index is not None: packet.update(chunk_index=chunk_index, end_of_stream=end_of_stream)
+                tts_protocol.send_msg(conn, json.dumps(packet).encode('utf-8'))
+            self.stats["bytes_sent"] += len(audio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地TTS服务器替身")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--delay', type=float, default=0.2, help="每个请求的固定合成耗时（秒）")
+    parser.add_argument('--delay-per-char', type=float, default=0.0)
+    parser.add_argument('--seconds-per-char', type=float, default=0.18, help="生成音频时长 = 字数 × 该值")
+    parser.add_argument('--workers', type=int, default=4, help="同时合成的请求数（模拟GPU并发）")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--disconnect-rate', type=float, default=0.0)
+    parser.add_argument('--codecs', help="服务器端可用的音频编码，逗号分隔（默认本机支持的全部）")
+    args = parser.parse_args()
+    server = LoopbackTTSServer(args.host, args.port, args.delay, args.delay_per_char, args.seconds_per_char,
+                               workers=args.workers, error_rate=args.error_rate,
+                               disconnect_rate=args.disconnect_rate,
+                               codecs=args.codecs.split(',') if args.codecs else None).start()
+    print(f"本地TTS替身服务器已启动: {server.host}:{server.port}")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
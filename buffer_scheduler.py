@@ -0,0 +1,119 @@
+# buffer_scheduler.py
+# 按"缓冲的音频秒数"做背压，取代按任务个数的阈值。
+# 缓冲 = 正在合成的任务的预估时长 + 已就绪待播放的时长 + 正在播放片段的剩余时长；
+# 预估时长 = 字数 × 每字秒数，每字秒数由已合成音频的实际时长按EWMA学习。
+# 缓冲低于 low_water 时需要补充话术，补到 target 为止；需求量以秒和字数给出。
+import itertools, threading, time
+
+
+class BufferScheduler:
+    def __init__(self, target_seconds=20.0, low_water_seconds=None, seconds_per_char=0.25, alpha=0.2,
+                 on_demand=None, poll_interval=0.2, renotify_seconds=5.0, log=print):
+        self.target_seconds = target_seconds
+        self.low_water_seconds = target_seconds / 2 if low_water_seconds is None else low_water_seconds
+        self.seconds_per_char = seconds_per_char  # 初始估计，随实际合成结果更新
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._tasks = {}  # key -> [字数, 时长(预估或实际), 开始播放的时间]
+        self._keys = itertools.count(1)
+        self.stats = {"submitted": 0, "finished": 0, "discarded": 0, "demands": 0}
+        # 可选回调 on_demand(秒数, 字数)：缓冲跌破 low_water 时调用；之后 renotify_seconds 秒内仍未补上才再次调用
+        self.on_demand = on_demand
+        self.poll_interval = poll_interval
+        self.renotify_seconds = renotify_seconds
+        self.log = log
+        self._last_demand = None
+        self._stopped = False
+        if on_demand:
+            threading.Thread(target=self._demand_monitor, daemon=True, name="BufferScheduler").start()
+
+    def submitted(self, key=None, text=""):
+        """登记一个开始合成的任务，按字数预估时长；key 为空时分配一个并返回"""
+        with self._lock:
+            if key is None: key = ("auto", next(self._keys))
+            chars = len(text)
+            self._tasks[key] = [chars, chars * self.seconds_per_char, None]
+            self.stats["submitted"] += 1
+            return key
+
+    def ready(self, key, duration, learn=True):
+        """合成完成，记录实际时长；learn=False 时不用它更新每字秒数（例如拼接了助播的音频）"""
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None: return
+            task[1] = duration
+            if learn and task[0] > 0:
+                self.seconds_per_char += self.alpha * (duration / task[0] - self.seconds_per_char)
+            self._changed.notify_all()
+
+    def started(self, key):
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None: task[2] = time.monotonic()
+
+    def finished(self, key):
+        self._remove(key, "finished")
+
+    def discard(self, key):
+        """任务被丢弃或取消，不再计入缓冲"""
+        self._remove(key, "discarded")
+
+    def buffered_seconds(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(max(0.0, duration - (now - start)) if start is not None else duration
+                       for _, duration, start in self._tasks.values())
+
+    def deficit(self):
+        """补足到目标窗口还差多少秒；缓冲仍高于 low_water 时为0"""
+        buffered = self.buffered_seconds()
+        return 0.0 if buffered >= self.low_water_seconds else self.target_seconds - buffered
+
+    def demand(self):
+        """返回 (秒数, 预估字数)：现在应该生成多少话术"""
+        seconds = self.deficit()
+        return seconds, int(seconds / self.seconds_per_char) if seconds else 0
+
+    def needs_more(self):
+        return self.deficit() > 0
+
+    def wait_for_demand(self, timeout=None):
+        """阻塞到需要补充话术为止，返回 (秒数, 字数)；超时返回 (0.0, 0)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            seconds, chars = self.demand()
+            if seconds: return seconds, chars
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0: return 0.0, 0
+            # 播放中的片段的剩余时长随时间减少，所以按缓冲高出低水位的部分来定等待时间
+            wait = max(self.poll_interval, self.buffered_seconds() - self.low_water_seconds)
+            with self._lock: self._changed.wait(wait if remaining is None else min(wait, remaining))
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, tasks=len(self._tasks), seconds_per_char=self.seconds_per_char)
+
+    def stop(self):
+        self._stopped = True
+
+    def _remove(self, key, counter):
+        with self._lock:
+            if self._tasks.pop(key, None) is not None:
+                self.stats[counter] += 1
+                self._changed.notify_all()
+
+    def _demand_monitor(self):
+        while not self._stopped:
+            seconds, chars = self.demand()
+            now = time.monotonic()
+            if not seconds:
+                self._last_demand = None
+            elif self._last_demand is None or now - self._last_demand >= self.renotify_seconds:
+                self._last_demand = now
+                self.stats["demands"] += 1
+                try:
+                    self.on_demand(seconds, chars)
+                except Exception as e:
+                    self.log(f"❌ 补充话术回调 on_demand 出错: {e}")
+            time.sleep(self.poll_interval)
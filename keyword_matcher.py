@@ -0,0 +1,103 @@
+# keyword_matcher.py
+# Aho-Corasick 多模式匹配：敏感词过滤和助播关键词检测共用一个自动机，
+# 一次线性扫描找出所有命中及其位置，代价与词表大小无关。
+# 词表变化时只增删字典树上的节点标记，失配指针在下一次查询前重新计算（与字典树大小成线性）。
+import threading
+from collections import deque, namedtuple
+
+KeywordMatch = namedtuple('KeywordMatch', 'start end word tags')
+
+
+class MultiPatternMatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._children = [{}]  # 字典树：节点 -> {字符: 子节点}
+        self._tags = [None]  # 节点 -> 以该节点结尾的词所属的标签集合
+        self._words = {}  # 标签 -> 词集合
+        self._compiled = None  # (goto, fail, output, node_word, node_tags)，查询只读这份快照
+
+    def update(self, tag, words):
+        """用新词表替换某个标签下的全部词，只对增删的词做修改"""
+        words = {w for w in words if w}
+        with self._lock:
+            old = self._words.get(tag, set())
+            for word in old - words: self._remove(word, tag)
+            for word in words - old: self._add(word, tag)
+            self._words[tag] = words
+            if old != words: self._compiled = None
+
+    def find_all(self, text):
+        """返回所有命中（允许重叠），按结束位置排序"""
+        goto, fail, output, node_word, node_tags = self._snapshot()
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]: node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if node_tags[node] else output[node]
+            while hit:
+                word = node_word[hit]
+                matches.append(KeywordMatch(i + 1 - len(word), i + 1, word, node_tags[hit]))
+                hit = output[hit]
+        return matches
+
+    @staticmethod
+    def select_non_overlapping(matches):
+        """从命中中选出最左最长、互不重叠的一组"""
+        chosen = []
+        last_end = 0
+        for m in sorted(matches, key=lambda m: (m.start, -len(m.word))):
+            if m.start >= last_end:
+                chosen.append(m)
+                last_end = m.end
+        return chosen
+
+    def _add(self, word, tag):
+        node = 0
+        for ch in word:
+            nxt = self._children[node].get(ch)
+            if nxt is None:
+                nxt = len(self._children)
+                self._children[node][ch] = nxt
+                self._children.append({})
+                self._tags.append(None)
+            node = nxt
+        self._tags[node] = (self._tags[node] or frozenset()) | {tag}
+
+    def _remove(self, word, tag):
+        node = 0
+        for ch in word:
+            node = self._children[node].get(ch)
+            if node is None: return
+        tags = (self._tags[node] or frozenset()) - {tag}
+        self._tags[node] = tags or None
+
+    def _snapshot(self):
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None: self._compiled = self._build()
+                compiled = self._compiled
+        return compiled
+
+    def _build(self):
+        """BFS 计算失配指针和输出链接（最近的、本身是词尾的失配祖先）"""
+        goto = [dict(c) for c in self._children]
+        node_tags = list(self._tags)
+        fail = [0] * len(goto)
+        output = [0] * len(goto)
+        node_word = [None] * len(goto)
+        queue = deque()
+        for ch, child in goto[0].items():
+            node_word[child] = ch
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                node_word[child] = node_word[node] + ch
+                f = fail[node]
+                while f and ch not in goto[f]: f = fail[f]
+                fail[child] = goto[f].get(ch, 0)
+                output[child] = fail[child] if node_tags[fail[child]] else output[fail[child]]
+                queue.append(child)
+        return goto, fail, output, node_word, node_tags
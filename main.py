@@ -1,30 +1,90 @@
 # tts_client.py (V10.3 - 测试逻辑最终修复版)
 # 核心架构：客户端完整复刻 tts_text.py 的所有功能逻辑。
 # 本次更新：彻底分离了常规任务和声音测试的任务分发逻辑，确保测试指令能被准确执行。
-import collections, random, re, time, os, shutil, threading, queue, json, struct, socket, sys, base64
+import collections, os, shutil, threading, queue, json, socket, sys, logging
 import subprocess
-from pydub import AudioSegment
+from concurrent.futures import ThreadPoolExecutor
+import tts_protocol, audio_codecs
+from audio_pcm import PcmClip, StreamingClip
+from playback_engine import PlaybackEngine, create_default_sink
+from synthesis_cache import SynthesisCache
+from worker_pool import BoundedExecutor, PoolRejected
+from async_transport import AsyncTTSTransport
+from server_pool import TTSServerPool
+from keyword_matcher import MultiPatternMatcher
+from reassembly_store import ReassemblyStore, DEGRADE
+from assistant_lines import AssistantLineCache
+from audio_spool import AudioSpool
+from buffer_scheduler import BufferScheduler
+from text_segmenter import TextSegmenter
+from sound_bank import SoundBank
+from tts_logging import get_logger
+from tts_metrics import PipelineMetrics
 from ali import AIResponseGenerator # 客户端需要自己调用AI
 
+# 组件统计中表示当前大小/用量的项（可增可减），按 gauge 导出；其余都是只增不减的计数
+EXTRA_GAUGES = {"reassembly_buffered_bytes", "reassembly_peak_bytes", "assistant_responses", "assistant_pooled_lines",
+                "spool_files", "spool_undeleted", "spool_used_bytes", "spool_quota_bytes", "sound_sounds", "sound_bytes"}
+
 class TTSClientGenerator:
     def __init__(self, server_host, server_port, output_dir, now_playing_callback=None, **kwargs):
+        self.logger = get_logger("TTSClient", kwargs.get('log_level', logging.INFO))
+        self.metrics = PipelineMetrics() # 每个任务的阶段时间线与聚合直方图
+        self._connect_count = 0
         # 网络配置
         self.server_host = server_host
         self.server_port = server_port
         self.sock = None
         self.lock = threading.Lock() # 用于保护socket连接
+        self._connected = threading.Event() # 连接建立时置位，唤醒监听线程
+        # 传输模式: 'thread' 阻塞socket + 发送/监听线程（默认）; 'asyncio' 事件循环传输，自动重连并重发未完成的请求
+        self.transport_mode = kwargs.get('transport', 'thread')
+        self.transport = None
+        # 多服务器: [(host, port), ...]，给出时使用连接池做负载均衡与故障转移（基于asyncio传输）
+        self.server_endpoints = kwargs.get('server_endpoints')
+        self.balance_strategy = kwargs.get('balance_strategy', 'least_outstanding') # 或 'ewma'
+        self.binary_frames = kwargs.get('binary_frames', True) # 请求服务器用二进制帧返回音频，旧服务器会忽略并回退到JSON
+        self.streaming = kwargs.get('streaming', False) # 请求服务器分块返回音频，首块到达即开始播放
+        # 连接时协商的音频编码（偏好顺序）。默认只用无损编码，解码结果与WAV逐采样一致；需要更省带宽时可加入 'opus'
+        supported = audio_codecs.available_codecs(lossless=False)
+        self.audio_codecs = [c for c in kwargs.get('audio_codecs', audio_codecs.available_codecs()) if c in supported]
+        self.negotiated_codec = audio_codecs.WAV
+        # 压缩音频在解码线程池中解码，不占用网络监听线程/事件循环；回包处理用锁串行化。
+        # 交接队列不设上限：解码跟不上时回包只会延后处理，投递方（可能是事件循环）从不阻塞，也不丢弃音频
+        self.decode_pool = ThreadPoolExecutor(max_workers=kwargs.get('decode_workers', 2), thread_name_prefix="AudioDecode")
+        self._packet_lock = threading.Lock()
+        # 单一写线程：所有请求帧进入有界队列，由 RequestSender 合并后一次 sendall
+        self.send_queue = queue.Queue(maxsize=kwargs.get('send_queue_size', 256))
+        self.send_timeout = kwargs.get('send_timeout', 2.0) # 队列满时 add_task 最多阻塞的秒数，超时则丢弃该请求
+        self.send_batch_bytes = kwargs.get('send_batch_bytes', 256 * 1024)
         
         # 本地文件与路径配置
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        self.sounds_path = "sounds"
-        self.sounds_library = {"[咳嗽]": "咳嗽声.WAV", "[叹气]": "叹气声.WAV", "[吞咽]": "吞咽声.WAV",
-                               "[呼吸]": ["呼吸1.WAV", "呼吸2.WAV", "呼吸3.WAV"]}
+        # 子进程播放需要的临时WAV放在spool里：唯一文件名、配额、可选内存盘，启动时清理崩溃残留
+        self.spool = kwargs.get('spool') or AudioSpool(None if kwargs.get('spool_ram') else output_dir,
+                                                       quota_bytes=kwargs.get('spool_quota', 256 * 1024 * 1024),
+                                                       ram=kwargs.get('spool_ram', False), prefix="client")
+        self.sounds_path = kwargs.get('sounds_path', "sounds")
+        self.sounds_library = kwargs.get('sounds_library') or {"[咳嗽]": "咳嗽声.WAV", "[叹气]": "叹气声.WAV", "[吞咽]": "吞咽声.WAV",
+                                                           "[呼吸]": ["呼吸1.WAV", "呼吸2.WAV", "呼吸3.WAV"]}
+        # 音效启动时全部解码进内存，文件变化时自动重新加载；文本中内嵌的音效标记直接拼进相邻的语音
+        self.sound_bank = SoundBank(self.sounds_path, self.sounds_library, output_format=kwargs.get('output_format'),
+                                    poll_interval=kwargs.get('sound_poll_interval', 2.0), log=self.log).start_watching()
         
         # 所有功能模块和状态变量
+        # 敏感词与助播关键词编译进同一个多模式自动机；请通过属性赋值更新词表，就地修改不会生效
+        self.matcher = MultiPatternMatcher()
         self.keyword_responses = kwargs.get('keyword_responses', {})
         self.sensitive_words = kwargs.get('sensitive_words', [])
         self.ai_generator = kwargs.get('ai_generator') # 从core.py传入AI实例
+        # AI助播调用走独立的有界线程池，队列满时直接放弃本次助播，主线照常播放
+        self.ai_pool = BoundedExecutor(kwargs.get('ai_concurrency', 4), kwargs.get('ai_queue_depth', 16), name="AIAssistant")
+        # 推测模式：在分句之前就对整段文本发起助播AI调用；主线音频就绪时AI回复还没到，直接用预合成的台词
+        self.speculative_assistant = kwargs.get('speculative_assistant', False)
+        # AI回复缓存与预合成台词池只在推测模式下使用；默认模式每句都现问AI，不复用旧回复
+        self.assistant_lines = kwargs.get('assistant_lines') or AssistantLineCache(ttl=kwargs.get('assistant_response_ttl', 300.0))
+        self._warmup_requests = {} # 预热台词的请求ID -> (关键词, 台词)
         self.now_playing_callback = now_playing_callback
         
         self.play_queue = queue.PriorityQueue()
@@ -34,236 +94,701 @@ class TTSClientGenerator:
         self.seq = 0
         self.pending_priority1 = 0
         self.pending_priority2 = 0
-        self.auto_task_ids = collections.deque(maxlen=5)
-        self.cancelled_auto_tasks = set()
+        self.counter_lock = threading.Lock() # 待处理计数会被网络、播放、清理多个线程修改
+        # 未播放完的自动话术(优先级1)；超过 max_auto_tasks 条时最旧的已过时，在合成前取消
+        self.auto_task_ids = collections.deque()
+        self.max_auto_tasks = kwargs.get('max_auto_tasks', 5)
+        self.preempt_fade_ms = kwargs.get('preempt_fade_ms', 30) # 紧急任务打断当前播放时的淡出时长
+        self._playing_priority = None
+        self._subprocess_preempt = threading.Event() # 子进程后端：打断请求落在进程启动之前时，启动后立即结束
+        # 按缓冲的音频秒数做背压：can_generate_new_script / wait_for_demand / on_demand 回调都由它决定
+        self.scheduler = kwargs.get('scheduler') or BufferScheduler(kwargs.get('buffer_target_seconds', 20.0),
+                                                                    kwargs.get('buffer_low_water_seconds'),
+                                                                    on_demand=kwargs.get('on_script_demand'), log=self.log)
+        self.cancelled_tasks = set() # 已在播放队列中又被取消的seq，播放线程取出时跳过并移除
+        # 低优先级文本的分句：缓冲为空时首段取短，尽快开始播放；其余各段按整句合并到 segment_max_chars
+        self.segmenter = kwargs.get('segmenter') or TextSegmenter(kwargs.get('first_segment_chars', 20),
+                                                                  kwargs.get('segment_max_chars', 100))
         
-        # 音频块重组缓冲区
-        self.reassembly_buffer = {} # 格式: {seq: {"main": data, "assist": data, "content": text, "priority": p}}
+        # 音频块重组缓冲区，格式: {seq: {"main": data, "assist": data, "content": text, "priority": p}}
+        # 条目有截止时间和内存上限，由 ReassemblySweeper 线程定期清理
+        self.reassembly_buffer = ReassemblyStore(main_timeout=kwargs.get('main_timeout', 30.0),
+                                                 assist_timeout=kwargs.get('assist_timeout', 2.0 if self.speculative_assistant else 8.0),
+                                                 auto_timeout=kwargs.get('auto_timeout', 15.0),
+                                                 max_bytes=kwargs.get('reassembly_max_bytes', 64 * 1024 * 1024))
+        self.sweep_interval = kwargs.get('sweep_interval', 0.5)
+
+        # 合成结果缓存：可由外部传入共享实例；cache_dir 为空时只用内存层
+        self.synthesis_cache = kwargs.get('synthesis_cache') or SynthesisCache(kwargs.get('cache_dir'))
+        self.voice_id = kwargs.get('voice_id', 'default') # 服务器端声音配置标识，参与缓存键
+        self.synthesis_params = kwargs.get('synthesis_params', {})
 
         self._stop_event = threading.Event()
         self.current_playback_process = None
+        # 播放后端: 'engine' 常驻进程内播放引擎（默认）; 'subprocess' 每个片段启动一个播放子进程
+        self.playback_backend = kwargs.get('playback_backend', 'engine')
+        self.playback_engine = None
+        if self.playback_backend == 'engine':
+            sink = kwargs.get('playback_sink') or create_default_sink()
+            if sink:
+                self.playback_engine = PlaybackEngine(sink, output_format=kwargs.get('output_format'))
+            else:
+                self.log("⚠️ 未安装 pyaudio，播放引擎不可用，回退到子进程播放。")
+                self.playback_backend = 'subprocess'
 
         self.log(f"TTS客户端初始化，准备连接服务器 {self.server_host}:{self.server_port}")
-        self._connect_to_server()
+        if self.server_endpoints:
+            self.transport = TTSServerPool(self.server_endpoints, self._dispatch_packet, strategy=self.balance_strategy,
+                                           binary_frames=self.binary_frames, log=self.log, codecs=self.audio_codecs,
+                                           is_pending=self._is_request_pending, reply_timeout=kwargs.get('server_reply_timeout', 8.0))
+            self.transport.start()
+        elif self.transport_mode == 'asyncio':
+            self.transport = AsyncTTSTransport(self.server_host, self.server_port, self._dispatch_packet,
+                                               binary_frames=self.binary_frames, log=self.log, codecs=self.audio_codecs,
+                                               is_pending=self._is_request_pending)
+            self.transport.start()
+        else:
+            self._connect_to_server()
+            # 启动独立的网络发送和监听线程
+            self.sender_thread = threading.Thread(target=self.request_sender_worker, daemon=True, name="RequestSender")
+            self.network_thread = threading.Thread(target=self.network_listener_worker, daemon=True, name="NetworkListener")
+            self.sender_thread.start()
+            self.network_thread.start()
 
-        # 启动独立的网络监听和播放线程
-        self.network_thread = threading.Thread(target=self.network_listener_worker, daemon=True, name="NetworkListener")
         self.play_audio_thread = threading.Thread(target=self.play_audio_worker, daemon=True, name="AudioPlayer")
-        self.network_thread.start()
+        self.sweeper_thread = threading.Thread(target=self.reassembly_sweeper_worker, daemon=True, name="ReassemblySweeper")
         self.play_audio_thread.start()
+        self.sweeper_thread.start()
+        if self.speculative_assistant and kwargs.get('assistant_warmup', True): self.warm_assistant_lines()
 
     def log(self, message):
-        print(f"[TTSClient] {message}")
+        self.logger.info(message)
+
+    def _is_request_pending(self, req_id):
+        return req_id in self.reassembly_buffer or req_id in self._warmup_requests
+
+    def warm_assistant_lines(self):
+        """把 keyword_responses 中配置的台词（字符串或字符串列表）预先合成进台词池，关键词第一次出现时就有台词可用"""
+        count = 0
+        for keyword, lines in self.keyword_responses.items():
+            for line in ([lines] if isinstance(lines, str) else lines or ()):
+                if not line or not line.strip(): continue
+                seq = self._get_next_seq()
+                self._warmup_requests[seq] = (keyword, line)
+                if self._send_request({"request_id": seq, "text": line, "is_assistant": True}): count += 1
+                else: self._warmup_requests.pop(seq, None)
+        if count: self.log(f"🔥 已请求预合成 {count} 条助播台词。")
+        return count
 
     def _get_next_seq(self):
         self.seq += 1
         return self.seq
 
-    def _split_text(self, text, max_length=100):
-        sentences = [s.strip() for s in re.split(r'[？！。.~]\s*', text) if s.strip()]
-        parts = []
-        current_part = ""
-        for sentence in sentences:
-            if len(current_part) + len(sentence) + 1 <= max_length:
-                current_part += sentence + "。"
-            else:
-                parts.append(current_part.strip())
-                current_part = sentence + "。"
-        if current_part: parts.append(current_part.strip())
-        return parts
+    def _split_text(self, text):
+        return self.segmenter.split(text, short_first=self.scheduler.buffered_seconds() <= 0)
+
+    @property
+    def sensitive_words(self):
+        return self._sensitive_words
+
+    @sensitive_words.setter
+    def sensitive_words(self, words):
+        self._sensitive_words = list(words)
+        self.matcher.update('sensitive', self._sensitive_words)
+
+    @property
+    def keyword_responses(self):
+        return self._keyword_responses
+
+    @keyword_responses.setter
+    def keyword_responses(self, responses):
+        self._keyword_responses = dict(responses)
+        self._keyword_rank = {kw: i for i, kw in enumerate(self._keyword_responses)} # 字典顺序即优先级
+        self.matcher.update('keyword', self._keyword_responses)
 
     def _filter_sensitive(self, text):
-        for word in self.sensitive_words:
-            text = text.replace(word, "**")
-        return text
+        return self._scan_text(text)[0]
+
+    def _scan_text(self, text):
+        """一次扫描同时完成敏感词替换和关键词检测。
+        返回 (过滤后的文本, 关键词命中列表)；与被替换的敏感词重叠的关键词不算命中。"""
+        matches = self.matcher.find_all(text)
+        if not matches: return text, []
+        censored = self.matcher.select_non_overlapping([m for m in matches if 'sensitive' in m.tags])
+        parts, pos = [], 0
+        for m in censored:
+            parts.append(text[pos:m.start]); parts.append("**"); pos = m.end
+        parts.append(text[pos:])
+        keywords = [m for m in matches if 'keyword' in m.tags
+                    and not any(c.start < m.end and m.start < c.end for c in censored)]
+        return ''.join(parts), keywords
+
+    def _pick_keyword(self, keyword_hits):
+        """多个关键词同时命中时取最长的，长度相同取 keyword_responses 中靠前的"""
+        if not keyword_hits: return None
+        return max(keyword_hits, key=lambda m: (len(m.word), -self._keyword_rank.get(m.word, 0))).word
 
     def _send_request(self, payload):
-        with self.lock:
+        """把请求帧放入发送队列。队列满时最多阻塞 send_timeout 秒，仍满则按失败处理该部分"""
+        seq = payload['request_id']
+        if self.transport:
+            self.transport.submit(payload)
+            self.metrics.mark(seq, "request_sent")
+            return True
+        if self.binary_frames: payload = dict(payload, frame_format="binary")
+        frame = tts_protocol.frame_msg(json.dumps(payload).encode('utf-8'))
+        part = 'assist' if payload.get('is_assistant') else 'main'
+        try:
+            self.send_queue.put((seq, frame, part), timeout=self.send_timeout)
+            return True
+        except queue.Full:
+            self.log(f"❌ 发送队列已满，任务 {seq} 的请求被丢弃。")
+            self._fail_request(seq, part)
+            return False
+
+    def _fail_request(self, seq, part):
+        """请求没能发出：把这一部分标为失败，任务按已有部分拼接或丢弃，不用等到超时"""
+        self.reassembly_buffer.set_part(seq, part, "error")
+        self._check_and_assemble(seq)
+
+    def request_sender_worker(self):
+        """唯一的写线程：取出一帧后顺带取走队列里已积压的帧，合并为一次 sendall"""
+        while not self._stop_event.is_set():
+            try:
+                batch = [self.send_queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            size = len(batch[0][1])
+            while size < self.send_batch_bytes:
+                try: item = self.send_queue.get_nowait()
+                except queue.Empty: break
+                batch.append(item); size += len(item[1])
+            # 排队期间已被取消或已丢弃的任务不再发送，服务器不用白白合成；取消帧(seq为None)照常发送
+            batch = [item for item in batch if item[0] is None or self._is_request_pending(item[0])]
+            if not batch: continue
+
             if not self.sock and not self._connect_to_server():
-                return
+                self.log(f"❌ 未连接到服务器，丢弃 {len(batch)} 个请求。")
+                for seq, _, part in batch:
+                    if seq is not None: self._fail_request(seq, part)
+                continue
             try:
-                request_data = json.dumps(payload).encode('utf-8')
-                self._send_msg(request_data)
+                with self.lock:
+                    self.sock.sendall(b''.join(frame for _, frame, _ in batch))
+                for seq, _, _ in batch: self.metrics.mark(seq, "request_sent")
             except Exception as e:
                 self.log(f"发送请求时出错: {e}")
-                self.sock = None
+                self._drop_connection()
+
+    def _cache_key(self, text, is_assistant):
+        return self.synthesis_cache.make_key(text, (self.voice_id, is_assistant), None, self.synthesis_params)
+
+    def _request_synthesis(self, seq, text, is_assistant):
+        """命中缓存时直接填入重组缓冲区，不走网络；否则向服务器发送合成请求"""
+        cached = self.synthesis_cache.get(self._cache_key(text, is_assistant))
+        if cached is not None:
+            part = 'assist' if is_assistant else 'main'
+            self.reassembly_buffer.set_part(seq, part, cached)
+            self.logger.debug("♻️ 任务 %s: %s音频命中缓存。", seq, '助播' if is_assistant else '主线')
+            self._check_and_assemble(seq)
+            return
+        payload = {"request_id": seq, "text": text, "is_assistant": is_assistant}
+        if self.streaming: payload["stream"] = True
+        self._send_request(payload)
 
-    def add_task(self, text, priority=2, request_type='default'):
-        """【核心改动】主入口：分离常规任务和测试任务的逻辑"""
-        if text in self.sounds_library:
+    def add_task(self, text, priority=2, request_type='default', split=True):
+        """【核心改动】主入口：分离常规任务和测试任务的逻辑。split=False 表示文本已由调用方切好，不再分句"""
+        if self.sound_bank.has(text):
             self._queue_local_sound(text, priority)
             return
-
-        filtered_text = self._filter_sensitive(text)
+        # 文本中内嵌的音效标记（如 "大家好[咳嗽]今天..."）：音效拼进相邻的语音片段，不单独排队
+        for speech, sounds_before, sounds_after in self.sound_bank.split_markers(text):
+            if speech is None:
+                for command in sounds_before: self._queue_local_sound(command, priority)
+            else:
+                self._add_speech(speech, priority, request_type, split, sounds_before, sounds_after)
+
+    def _add_speech(self, text, priority, request_type, split, sounds_before=(), sounds_after=()):
+        filtered_text, keyword_hits = self._scan_text(text)
+        is_test = request_type in ('test_main', 'test_assistant')
+        prefetch = None
+        if self.speculative_assistant and not is_test:
+            prefetch = self._prefetch_assistant(filtered_text, keyword_hits)
         
         # 分割文本
-        sentences = []
-        if len(filtered_text) > 100 and priority == 2:
-             sentences = self._split_text(filtered_text)
-        else:
-             sentences = [filtered_text]
+        sentences = self._split_text(filtered_text) if split and priority == 2 and not is_test else [filtered_text]
+        if prefetch and sentences:
+            # 助播接在关键词所在的句子后面；关键词被分句切断时接在最后一句
+            keyword = prefetch[0]
+            assist_index = next((i for i, s in enumerate(sentences) if keyword in s), len(sentences) - 1)
 
-        for sentence in sentences:
+        for index, sentence in enumerate(sentences):
             clean_sentence = sentence.replace(" ", "").replace("\n", "")
             if not clean_sentence: continue
 
             seq = self._get_next_seq()
             
             # --- 逻辑分流 ---
-            if request_type == 'test_main' or request_type == 'test_assistant':
+            if is_test:
                 # **测试流程**：只发送一个简单的请求
                 self.log(f"【测试流程】任务 {seq}: 发送 {'助播' if request_type == 'test_assistant' else '主线'} 声音请求。")
                 self.reassembly_buffer[seq] = {"main": None, "assist": "done", "content": clean_sentence, "priority": priority}
-                payload = {"request_id": seq, "text": clean_sentence, "is_assistant": (request_type == 'test_assistant')}
-                threading.Thread(target=self._send_request, args=(payload,)).start()
+                self.metrics.mark(seq, "accepted", priority)
+                self._request_synthesis(seq, clean_sentence, request_type == 'test_assistant')
 
             else: # **常规流程**
-                if priority < 2: self.pending_priority1 += 1
-                else: self.pending_priority2 += 1
+                with self.counter_lock:
+                    if priority < 2: self.pending_priority1 += 1
+                    else: self.pending_priority2 += 1
 
                 if priority == 1:
-                    self.auto_task_ids.append(seq)
-                    if len(self.auto_task_ids) > 5:
-                        self.cancelled_auto_tasks.add(self.auto_task_ids.popleft())
-
-                self.reassembly_buffer[seq] = {"main": None, "assist": None, "content": clean_sentence, "priority": priority}
-
-                main_payload = {"request_id": seq, "text": clean_sentence, "is_assistant": False}
-                threading.Thread(target=self._send_request, args=(main_payload,)).start()
-                
-                self._trigger_assistant_if_needed(clean_sentence, seq)
+                    with self.counter_lock:
+                        self.auto_task_ids.append(seq)
+                        superseded = [self.auto_task_ids.popleft() for _ in range(len(self.auto_task_ids) - self.max_auto_tasks)]
+                    for old_seq in superseded: self.cancel_task(old_seq)
+
+                entry = {"main": None, "assist": None, "content": clean_sentence, "priority": priority}
+                if index == 0 and sounds_before: entry['sounds_before'] = sounds_before
+                if index == len(sentences) - 1 and sounds_after: entry['sounds_after'] = sounds_after
+                self.reassembly_buffer[seq] = entry
+                self.metrics.mark(seq, "accepted", priority)
+                self.scheduler.submitted(seq, clean_sentence)
+
+                if self.speculative_assistant:
+                    if prefetch and index == assist_index: self._attach_assistant(seq, *prefetch)
+                    else: self.reassembly_buffer[seq]['assist'] = "done"
+                else:
+                    # 整段未被分割且无需清理空白时，扫描时得到的关键词命中可以直接复用
+                    reuse_hits = len(sentences) == 1 and clean_sentence == filtered_text
+                    self._trigger_assistant_if_needed(clean_sentence, seq, keyword_hits if reuse_hits else None)
+                self._request_synthesis(seq, clean_sentence, False)
 
 
-    def _trigger_assistant_if_needed(self, text, seq):
+    def _trigger_assistant_if_needed(self, text, seq, keyword_hits=None):
         """独立的助播触发函数，包含详细诊断日志"""
-        triggered_keyword = next((kw for kw in self.keyword_responses if kw in text), None)
+        if keyword_hits is None:
+            keyword_hits = [m for m in self.matcher.find_all(text) if 'keyword' in m.tags]
+        triggered_keyword = self._pick_keyword(keyword_hits)
         if not triggered_keyword:
-            self.log(f"【助播诊断】任务 {seq}: 未在'{text[:20]}...'中检测到关键词。流程终止。")
+            self.logger.debug("【助播诊断】任务 %s: 未在'%s...'中检测到关键词。流程终止。", seq, text[:20])
             if seq in self.reassembly_buffer: self.reassembly_buffer[seq]['assist'] = "done"
             return
 
         if not self.ai_generator:
-            self.log(f"【助播诊断】任务 {seq}: 检测到关键词 '{triggered_keyword}'，但AI模块不可用。流程终止。")
+            self.logger.debug("【助播诊断】任务 %s: 检测到关键词 '%s'，但AI模块不可用。流程终止。", seq, triggered_keyword)
             if seq in self.reassembly_buffer: self.reassembly_buffer[seq]['assist'] = "done"
             return
             
-        self.log(f"【助播诊断】🎤 任务 {seq}: 条件满足 (关键词: '{triggered_keyword}')，启动AI助播任务。")
-        
-        def get_assist_voice_task():
-            assistant_prompt = f"主播刚刚说了：『{text}』。请你作为搭档，围绕关键词 '{triggered_keyword}'，说一句简短捧哏的话。"
-            try:
-                assist_text = self.ai_generator.get_response("主播", assistant_prompt, [], is_assistant_task=True)
-                if assist_text and assist_text.strip():
-                    self.log(f"【助播诊断】🤖 AI为任务 {seq} 生成内容: {assist_text}")
-                    assist_payload = {"request_id": seq, "text": assist_text, "is_assistant": True}
-                    self._send_request(assist_payload)
-                else:
-                    self.log(f"【助播诊断】⚠️ AI助播返回内容为空，任务 {seq} 将不触发助播。")
-                    if seq in self.reassembly_buffer: self.reassembly_buffer[seq]['assist'] = "done"
-            except Exception as e:
-                self.log(f"【助播诊断】❌ 调用AI助播时出错 (任务 {seq}): {e}")
-                if seq in self.reassembly_buffer: self.reassembly_buffer[seq]['assist'] = "done"
-        
-        threading.Thread(target=get_assist_voice_task).start()
+        self.logger.debug("【助播诊断】🎤 任务 %s: 条件满足 (关键词: '%s')，启动AI助播任务。", seq, triggered_keyword)
+        start = lambda: self.ai_pool.submit(self._ask_assistant, text, triggered_keyword)
+        try:
+            future = self.assistant_lines.get_or_start(triggered_keyword, text, start) if self.speculative_assistant else start()
+        except PoolRejected:
+            self.logger.warning("【助播诊断】⚠️ AI助播线程池已满，任务 %s 放弃助播。", seq)
+            future = None
+        self._attach_assistant(seq, triggered_keyword, future)
+
+    def _ask_assistant(self, text, keyword):
+        assistant_prompt = f"主播刚刚说了：『{text}』。请你作为搭档，围绕关键词 '{keyword}'，说一句简短捧哏的话。"
+        return self.ai_generator.get_response("主播", assistant_prompt, [], is_assistant_task=True)
+
+    def _prefetch_assistant(self, text, keyword_hits):
+        """推测模式：对分句前的整段文本发起（或复用缓存的）助播AI调用，返回 (关键词, future)；无需助播时返回None"""
+        keyword = self._pick_keyword(keyword_hits)
+        if not keyword or not self.ai_generator: return None
+        try:
+            return keyword, self.assistant_lines.get_or_start(
+                keyword, text, lambda: self.ai_pool.submit(self._ask_assistant, text, keyword))
+        except PoolRejected:
+            self.logger.warning("【助播诊断】⚠️ AI助播线程池已满，预取放弃，只能使用预合成台词。")
+            return keyword, None
+
+    def _attach_assistant(self, seq, keyword, future):
+        """把AI回复接到任务上：回复到达后请求合成助播；没有可用的AI调用时尝试预合成台词"""
+        entry = self.reassembly_buffer.get(seq)
+        if entry is None: return
+        entry['keyword'] = keyword
+        entry['assist_future'] = future
+        if future is None:
+            if not self._use_pooled_line(seq, entry):
+                entry['assist'] = "done"
+                self._check_and_assemble(seq)
+            return
+        future.add_done_callback(lambda f: self._on_assistant_text(seq, f))
+
+    def _on_assistant_text(self, seq, future):
+        entry = self.reassembly_buffer.get(seq)
+        if entry is None or entry['assist'] is not None: return # 已超时，或已用预合成台词顶替
+        try:
+            assist_text = future.result()
+        except Exception as e:
+            self.logger.warning("【助播诊断】❌ 调用AI助播时出错 (任务 %s): %s", seq, e)
+            assist_text = None
+        self.metrics.mark(seq, "assistant_ai_returned")
+        if assist_text and assist_text.strip():
+            self.logger.debug("【助播诊断】🤖 AI为任务 %s 生成内容: %s", seq, assist_text)
+            entry['assist_text'] = assist_text
+            self._request_synthesis(seq, assist_text, True)
+        else:
+            self.logger.debug("【助播诊断】⚠️ AI助播没有可用内容，任务 %s 将不触发助播。", seq)
+            entry['assist'] = "done"
+            self._check_and_assemble(seq)
+
+    def _use_pooled_line(self, seq, entry):
+        """推测模式下用该关键词下预合成好的助播台词填充助播部分，成功返回True"""
+        if not self.speculative_assistant or not entry.get('keyword'): return False
+        line = self.assistant_lines.take_line(entry.get('keyword'))
+        if line is None: return False
+        entry['assist_text'] = line[0]
+        self.reassembly_buffer.set_part(seq, 'assist', line[1])
+        self.logger.debug("【助播诊断】♻️ 任务 %s 使用预合成的助播台词: %s", seq, line[0])
+        return True
 
     def network_listener_worker(self):
         """持续监听并接收服务器返回的音频块"""
         while not self._stop_event.is_set():
-            if not self.sock: time.sleep(1); continue
+            # 连接断开时等待写线程重连成功，而不是固定轮询sleep
+            if not self.sock and not self._connected.wait(timeout=1): continue
             try:
-                response_data = self._recv_msg()
-                if response_data is None: self.sock = None; continue
-                
-                packet = json.loads(response_data.decode('utf-8'))
-                req_id = packet.get('request_id')
-                
-                if not req_id or req_id not in self.reassembly_buffer: continue
-
-                if packet.get("status") == "error":
-                    self.log(f"收到服务器错误包: ReqID {req_id}")
-                    part = 'assist' if packet.get('is_assistant') else 'main'
-                    if req_id in self.reassembly_buffer: self.reassembly_buffer[req_id][part] = "error"
-                else:
-                    audio_data = base64.b64decode(packet['audio_data'])
-                    part = 'assist' if packet.get('is_assistant') else 'main'
-                    if req_id in self.reassembly_buffer: self.reassembly_buffer[req_id][part] = audio_data
-                
-                self._check_and_assemble(req_id)
+                packet = self._recv_msg()
+                if packet is None: self._drop_connection(); continue
+                self._dispatch_packet(packet)
 
             except (ConnectionResetError, BrokenPipeError, ConnectionAbortedError):
-                self.log("与服务器连接中断..."); self.sock = None
+                self.log("与服务器连接中断..."); self._drop_connection()
             except Exception as e:
                 self.log(f"网络监听线程出错: {e}")
 
+    def _dispatch_packet(self, packet):
+        """回包入口：握手应答记下编码；其余回包都交给解码线程池（压缩音频先解码为WAV），
+        事件循环/监听线程不等 _packet_lock，也不做解码和文件读写"""
+        if packet.get('type') == tts_protocol.MSG_HELLO_ACK:
+            self.negotiated_codec = packet.get('codec', audio_codecs.WAV)
+            self.logger.info("🔗 与服务器协商的音频编码: %s", self.negotiated_codec)
+            return
+        codec = packet.get('codec', audio_codecs.WAV)
+        if packet.get('audio_data'): self.metrics.inc("audio_wire_bytes", len(packet['audio_data']))
+        self.decode_pool.submit(self._decode_packet, packet, codec)
+
+    def _decode_packet(self, packet, codec):
+        if codec != audio_codecs.WAV and packet.get('audio_data'):
+            try:
+                packet['audio_data'] = audio_codecs.decode_to_wav(packet['audio_data'], codec)
+                packet['codec'] = audio_codecs.WAV
+                self.metrics.inc("audio_decoded_frames")
+            except Exception as e:
+                self.log(f"❌ 任务 {packet.get('request_id')} 的 {codec} 音频解码失败: {e}")
+                self.metrics.inc("audio_decode_errors")
+                packet['status'] = "error"
+        with self._packet_lock:
+            try:
+                self._handle_packet(packet)
+            except Exception as e:
+                self.log(f"处理服务器回包时出错: {e}")
+
+    def _handle_packet(self, packet):
+        """处理一条服务器回包，在解码线程池中持有 _packet_lock 调用"""
+        req_id = packet.get('request_id')
+        warmup = self._warmup_requests.pop(req_id, None)
+        if warmup is not None:
+            if packet.get("status") != "error" and packet.get('audio_data'):
+                self.assistant_lines.add_line(warmup[0], warmup[1], packet['audio_data'])
+                self.synthesis_cache.put(self._cache_key(warmup[1], True), packet['audio_data'])
+            return
+
+        if not req_id or req_id not in self.reassembly_buffer: return
+
+        part = 'assist' if packet.get('is_assistant') else 'main'
+        entry = self.reassembly_buffer.get(req_id)
+        if not entry: return
+        if packet.get("status") == "error":
+            self.log(f"收到服务器错误包: ReqID {req_id}")
+            self.metrics.inc("server_errors")
+            self.reassembly_buffer.set_part(req_id, part, "error")
+        elif tts_protocol.is_partial_chunk(packet):
+            self.metrics.mark(req_id, "first_byte")
+            self.metrics.mark(req_id, "last_byte", overwrite=True)
+            self._handle_stream_chunk(req_id, entry, part, packet)
+        else:
+            self.metrics.mark(req_id, "first_byte")
+            self.metrics.mark(req_id, "last_byte", overwrite=True)
+            audio_data = packet['audio_data']
+            self.reassembly_buffer.set_part(req_id, part, audio_data)
+            spoken_text = entry['content'] if part == 'main' else entry.get('assist_text')
+            if spoken_text:
+                self.synthesis_cache.put(self._cache_key(spoken_text, part == 'assist'), audio_data)
+                if part == 'assist' and self.speculative_assistant: self.assistant_lines.add_line(entry.get('keyword'), spoken_text, audio_data)
+        
+        self._check_and_assemble(req_id)
+
+    def _handle_stream_chunk(self, seq, entry, part, packet):
+        """流式合成：主线第一块到达就创建 StreamingClip 放入播放队列，后续块追加进去；
+        助播分块先拼成完整片段，等主线结束后接在后面。乱序块暂存，重连导致的重复块丢弃。"""
+        pending = entry.setdefault('chunks', {'main': {}, 'assist': {}})[part]
+        next_index = entry.setdefault('next_chunk', {'main': 0, 'assist': 0})
+        index = packet['chunk_index']
+        if index < next_index[part] or index in pending: return
+        pending[index] = (PcmClip.from_bytes(packet['audio_data']), packet.get('end_of_stream', True))
+
+        while next_index[part] in pending:
+            piece, end_of_stream = pending.pop(next_index[part])
+            next_index[part] += 1
+            if part == 'main':
+                if entry.get('stream') is None:
+                    if entry.get('sounds_before'):
+                        prefixed = self._with_sounds(piece, entry['sounds_before'], ())
+                        entry['sound_offset'] = len(prefixed.pcm) - len(piece.pcm)
+                        piece = prefixed
+                    entry['stream'] = StreamingClip(piece)
+                    self.play_queue.put((entry["priority"], seq, entry['stream'], entry["content"]))
+                    if entry["priority"] <= 0: self._preempt_playback()
+                    self.metrics.mark(seq, "assembled")
+                    self.logger.debug("▶️ 任务 %s 收到首个音频块，开始流式播放。", seq)
+                else:
+                    entry['stream'].append(piece)
+                if end_of_stream:
+                    self.reassembly_buffer.set_part(seq, 'main', "streamed")
+                    # 缓存的是不含音效的语音
+                    spoken = entry['stream'].snapshot()
+                    spoken = PcmClip(memoryview(spoken.pcm)[entry.get('sound_offset', 0):], *spoken.format)
+                    self.synthesis_cache.put(self._cache_key(entry['content'], False), spoken.to_wav_bytes())
+                    if entry.get('sounds_after'):
+                        entry['stream'].append(self._with_sounds(None, (), entry['sounds_after'], spoken.format))
+            else:
+                partial = entry.get('assist_partial')
+                entry['assist_partial'] = piece if partial is None else partial + piece
+                if end_of_stream:
+                    self.reassembly_buffer.set_part(seq, 'assist', entry.pop('assist_partial'))
+                    if entry.get('assist_text'):
+                        self.synthesis_cache.put(self._cache_key(entry['assist_text'], True), entry['assist'].to_wav_bytes())
+                        if self.speculative_assistant: self.assistant_lines.add_line(entry.get('keyword'), entry['assist_text'], entry['assist'])
+
     def _check_and_assemble(self, seq):
         """检查任务的所有部分是否都已收到，如果是，则拼接并入队"""
         buffer_entry = self.reassembly_buffer.get(seq)
+        if self.speculative_assistant and buffer_entry and buffer_entry['main'] is not None and buffer_entry['assist'] is None:
+            # 主线已就绪而AI回复还没到：不再等待，改用预合成台词（没有时等到助播截止时间）
+            future = buffer_entry.get('assist_future')
+            if future is not None and not future.done(): self._use_pooled_line(seq, buffer_entry)
         if buffer_entry and buffer_entry['main'] is not None and buffer_entry['assist'] is not None:
-            buffer_entry = self.reassembly_buffer.pop(seq)
+            buffer_entry = self.reassembly_buffer.pop(seq, None)
+            if buffer_entry is None: return # 其他线程已完成拼接
             
             main_data = buffer_entry['main']
             assist_data = buffer_entry['assist']
+
+            stream = buffer_entry.get('stream')
+            if stream is not None:
+                # 流式任务已在播放队列中，这里只需接上助播并结束流（主线中途出错时按已收到的部分结束）
+                if main_data != "error" and isinstance(assist_data, (bytes, bytearray, PcmClip)):
+                    stream.append(assist_data if isinstance(assist_data, PcmClip) else PcmClip.from_bytes(assist_data))
+                stream.finish()
+                self.scheduler.ready(seq, stream.duration, learn=self._learnable(buffer_entry))
+                self.logger.debug("✅ 任务 %s 流式接收完成。", seq)
+                return
             
             if main_data == "error":
                 self.log(f"任务 {seq} 因主声音生成失败而被丢弃。")
-                if buffer_entry['priority'] < 2: self.pending_priority1 = max(0, self.pending_priority1 - 1)
-                else: self.pending_priority2 = max(0, self.pending_priority2 - 1)
+                self.metrics.discard(seq)
+                self.scheduler.discard(seq)
+                self._release_pending(buffer_entry['priority'])
                 return
 
             try:
-                main_audio_path = os.path.join(self.output_dir, f"main_{seq}.wav")
-                with open(main_audio_path, 'wb') as f: f.write(main_data)
-                
-                final_audio_path = main_audio_path
-                
-                if isinstance(assist_data, bytes):
-                    assist_audio_path = os.path.join(self.output_dir, f"assist_{seq}.wav")
-                    with open(assist_audio_path, 'wb') as f: f.write(assist_data)
-                    
-                    main_audio = AudioSegment.from_file(main_audio_path)
-                    assist_audio = AudioSegment.from_file(assist_audio_path)
-                    combined = main_audio + assist_audio
-                    
-                    final_audio_path = os.path.join(self.output_dir, f"combined_{seq}.wav")
-                    combined.export(final_audio_path, format="wav")
-                    
-                    os.remove(assist_audio_path)
-                    os.remove(main_audio_path)
+                # 直接在内存中解码拼接，播放器拿到的是PCM缓冲区而不是文件路径
+                clip = PcmClip.from_bytes(main_data)
+                if buffer_entry.get('sounds_before') or buffer_entry.get('sounds_after'):
+                    clip = self._with_sounds(clip, buffer_entry.get('sounds_before', ()), buffer_entry.get('sounds_after', ()))
+                if isinstance(assist_data, PcmClip):
+                    clip = clip + assist_data
+                elif isinstance(assist_data, (bytes, bytearray)):
+                    clip = clip + PcmClip.from_bytes(assist_data)
                 
-                self.play_queue.put((buffer_entry["priority"], seq, final_audio_path, buffer_entry["content"]))
-                self.log(f"✅ 任务 {seq} 处理完成并放入播放队列。")
+                self.play_queue.put((buffer_entry["priority"], seq, clip, buffer_entry["content"]))
+                if buffer_entry["priority"] <= 0: self._preempt_playback()
+                self.metrics.mark(seq, "assembled")
+                # 拼接了助播或音效的音频比正文长，不用来学习每字时长
+                self.scheduler.ready(seq, clip.duration, learn=self._learnable(buffer_entry))
+                self.logger.debug("✅ 任务 %s 处理完成并放入播放队列。", seq)
 
             except Exception as e:
-                self.log(f"❌ 拼接或保存任务 {seq} 音频时失败: {e}")
-                if buffer_entry['priority'] < 2: self.pending_priority1 = max(0, self.pending_priority1 - 1)
-                else: self.pending_priority2 = max(0, self.pending_priority2 - 1)
+                self.log(f"❌ 拼接任务 {seq} 音频时失败: {e}")
+                self.metrics.discard(seq)
+                self.scheduler.discard(seq)
+                self._release_pending(buffer_entry['priority'])
+
+    def _with_sounds(self, clip, sounds_before, sounds_after, fmt=None):
+        """把内存中的音效直接拼在语音前后（与语音同一采样格式，中间没有间隙）；clip 为None时只拼音效"""
+        fmt = clip.format if clip is not None else fmt
+        pieces = [self.sound_bank.get(command, fmt) for command in sounds_before]
+        pieces += [clip] + [self.sound_bank.get(command, fmt) for command in sounds_after]
+        pieces = [piece for piece in pieces if piece is not None]
+        if len(pieces) == 1: return pieces[0]
+        return PcmClip(b''.join(piece.pcm for piece in pieces), *fmt)
+
+    @staticmethod
+    def _learnable(entry):
+        return not (isinstance(entry['assist'], (bytes, bytearray, PcmClip)) or entry.get('sounds_before') or entry.get('sounds_after'))
+
+    def cancel_task(self, seq, counter="cancelled_auto_tasks"):
+        """取消一个任务：还在发送队列里的请求不再发送，已发出的通知服务器停止合成，重组缓冲区中的条目直接丢弃；
+        已进入播放队列的由播放线程跳过；已经在播放的不受影响"""
+        # 持有队列的锁检查：要么播放线程之后取出时看到取消标记，要么它已不在队列中，不会留下永远用不到的标记
+        with self.play_queue.mutex:
+            if any(item[1] == seq for item in self.play_queue.queue): self.cancelled_tasks.add(seq)
+        entry = self.reassembly_buffer.pop(seq)
+        if entry is None: return False
+        self._send_cancel(seq)
+        stream = entry.get('stream')
+        if stream is not None:
+            stream.finish() # 已在播放队列中，由播放线程跳过并释放计数
+        else:
+            self._release_pending(entry['priority'])
+            self.metrics.discard(seq, counter)
+            self.scheduler.discard(seq)
+        self.logger.debug("🚫 任务 %s 已取消。", seq)
+        return True
+
+    def _send_cancel(self, seq):
+        if self.transport:
+            self.transport.cancel(seq); return
+        try:
+            self.send_queue.put_nowait((None, tts_protocol.frame_msg(tts_protocol.cancel_msg(seq)), None))
+        except queue.Full:
+            pass # 取消只是为了省掉服务器的合成，发不出去不影响客户端
+
+    def _preempt_playback(self):
+        """紧急任务(优先级<=0)的音频就绪：打断正在播放的普通片段，引擎带短暂淡出，子进程后端直接结束进程"""
+        if self._playing_priority is None or self._playing_priority <= 0: return
+        self.logger.debug("⚡ 紧急任务就绪，打断当前播放。")
+        if self.playback_engine:
+            self.playback_engine.preempt(self.preempt_fade_ms)
+        else:
+            self._subprocess_preempt.set()
+            if self.current_playback_process and self.current_playback_process.poll() is None:
+                self.current_playback_process.terminate()
+
+    def _urgent_waiting(self):
+        with self.play_queue.mutex:
+            return bool(self.play_queue.queue) and self.play_queue.queue[0][0] <= 0
+
+    def _release_pending(self, priority):
+        with self.counter_lock:
+            if priority < 2: self.pending_priority1 = max(0, self.pending_priority1 - 1)
+            else: self.pending_priority2 = max(0, self.pending_priority2 - 1)
+
+    def reassembly_sweeper_worker(self):
+        """定期清理重组缓冲区：助播超时的只播主线，长期收不到主线的任务丢弃并释放待处理计数"""
+        while not self._stop_event.wait(self.sweep_interval):
+            try:
+                self._sweep_reassembly()
+            except Exception as e:
+                self.log(f"清理重组缓冲区时出错: {e}")
+
+    def _sweep_reassembly(self):
+        for seq, entry, action in self.reassembly_buffer.sweep():
+            if action == DEGRADE:
+                abandoned = entry['assist'] is None
+                if abandoned and self._use_pooled_line(seq, entry):
+                    self.log(f"⏱️ 任务 {seq} 等待助播超时，改用预合成的助播台词。")
+                else:
+                    self.log(f"⏱️ 任务 {seq} 等待助播超时，只播放主线。")
+                    if abandoned: entry['assist'] = "done"
+                if abandoned: self._send_cancel(seq) # 主线已收齐，取消只会停掉服务器上还在合成的助播
+                self._check_and_assemble(seq)
+            else:
+                self.log(f"⏱️ 任务 {seq} 超时未收到音频，已丢弃。")
+                self._send_cancel(seq)
+                stream = entry.get('stream')
+                if stream is not None: stream.finish() # 已在播放队列中，计数由播放线程释放
+                else:
+                    self._release_pending(entry['priority'])
+                    self.metrics.discard(seq)
+                    self.scheduler.discard(seq)
+
+    def get_reassembly_metrics(self):
+        return self.reassembly_buffer.get_metrics()
+
+    def _extra_metrics(self):
+        """汇总各组件自己维护的统计，与任务指标一起导出，返回 (计数, gauge)"""
+        counters = {"reassembly_" + k: v for k, v in self.reassembly_buffer.get_metrics().items()}
+        stats = self.synthesis_cache.get_stats()
+        counters.update(cache_hits=stats["hits"], cache_misses=stats["misses"])
+        counters.update({"assistant_" + k: v for k, v in self.assistant_lines.get_stats().items()})
+        counters.update({"spool_" + k: v for k, v in self.spool.get_stats().items()})
+        counters.update({"sound_" + k: v for k, v in self.sound_bank.get_stats().items()})
+        if isinstance(self.transport, TTSServerPool):
+            counters["reconnects"] = self.metrics.counters["reconnects"] + sum(
+                ep["reconnects"] for ep in self.transport.get_stats()["endpoints"])
+            counters["failovers"] = self.transport.stats["failovers"]
+        elif self.transport:
+            counters["reconnects"] = self.metrics.counters["reconnects"] + self.transport.stats["reconnects"]
+        gauges = {name: counters.pop(name) for name in list(counters)
+                  if name in EXTRA_GAUGES or name.endswith("_entries")}
+        return counters, gauges
+
+    def get_metrics(self):
+        """拉取接口：各阶段延迟直方图（按优先级）、计数器与 gauge"""
+        snapshot = self.metrics.snapshot()
+        counters, snapshot["gauges"] = self._extra_metrics()
+        snapshot["counters"].update(counters)
+        if self.playback_engine: snapshot["playback"] = dict(self.playback_engine.stats)
+        return snapshot
+
+    def dump_metrics(self, path=None, fmt="prometheus"):
+        """导出为 Prometheus 文本或 JSON；给出 path 时写入文件"""
+        counters, gauges = self._extra_metrics()
+        if fmt == "json": text = self.metrics.to_json(counters, gauges)
+        else: text = self.metrics.to_prometheus(extra_counters=counters, extra_gauges=gauges)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f: f.write(text)
+        return text
 
     def play_audio_worker(self):
         """完整复刻 tts_text.py 的播放逻辑"""
         while not self._stop_event.is_set():
             try:
-                priority, seq, audio_path, content = self.play_queue.get(timeout=1)
+                priority, seq, audio, content = self.play_queue.get(timeout=1)
+                self.metrics.mark(seq, "dequeued")
                 
                 with self.play_lock:
-                    if priority == 1 and seq in self.cancelled_auto_tasks:
+                    if seq in self.cancelled_tasks:
                         self.log(f"任务 {seq} 已被取消，跳过播放。")
+                        self.cancelled_tasks.discard(seq)
+                        self.metrics.discard(seq, "cancelled_auto_tasks")
+                        self.scheduler.discard(seq)
+                        self.play_queue.task_done()
+                        self._release_pending(priority)
+                        continue
+
+                    # 先清除上一次的打断请求再公布正在播放的优先级，之后到达的打断不会丢失
+                    if self.playback_engine: self.playback_engine.clear_preempt()
+                    else: self._subprocess_preempt.clear()
+                    self._playing_priority = priority
+                    if priority > 0 and self._urgent_waiting():
+                        # 紧急片段在本条取出之后才入队，打断时还看不到本条：放回队列，先播紧急的
+                        self._playing_priority = None
+                        self.play_queue.put((priority, seq, audio, content))
                         self.play_queue.task_done()
-                        self.pending_priority1 = max(0, self.pending_priority1 - 1)
-                        if os.path.exists(audio_path): os.remove(audio_path)
                         continue
 
                     if self.now_playing_callback:
                         self.now_playing_callback(content)
 
-                    self.log(f"正在播放任务 {seq} (Prio:{priority}): '{content[:50]}...'")
-                    self._play_audio_in_subprocess(audio_path)
-                    
-                    if os.path.exists(audio_path) and not audio_path.startswith(self.sounds_path):
-                        try: os.remove(audio_path)
-                        except OSError: pass
+                    self.logger.info("正在播放任务 %s (Prio:%s): '%s...'", seq, priority, content[:50])
+                    self.metrics.mark(seq, "playback_started")
+                    self.scheduler.started(seq)
+                    try:
+                        self._play_clip(seq, audio)
+                        self.metrics.mark(seq, "playback_finished")
+                    finally:
+                        self._playing_priority = None
+                        self.scheduler.finished(seq)
+                    if priority == 1:
+                        with self.counter_lock:
+                            if seq in self.auto_task_ids: self.auto_task_ids.remove(seq)
                     
-                    if priority < 2: self.pending_priority1 = max(0, self.pending_priority1 - 1)
-                    else: self.pending_priority2 = max(0, self.pending_priority2 - 1)
+                    self._release_pending(priority)
 
                 self.play_queue.task_done()
             except queue.Empty:
@@ -272,17 +797,28 @@ class TTSClientGenerator:
                 self.log(f"❌ 音频播放工作线程出错: {e}")
 
     def _queue_local_sound(self, command, priority):
+        """播放引擎直接播放音效库里已解码的PCM；子进程播放器只能播放文件，仍然传文件路径"""
         if self.now_playing_callback: self.now_playing_callback(command)
-        sound_info = self.sounds_library.get(command)
-        if not sound_info: return
-        filename = random.choice(sound_info) if isinstance(sound_info, list) else sound_info
-        audio_path = os.path.join(self.sounds_path, filename)
-        if os.path.exists(audio_path):
-            seq = self._get_next_seq()
-            self.play_queue.put((priority, seq, audio_path, command))
-            self.log(f"✅ 本地音效已入队: {command}")
-        else:
-            self.log(f"❌ 本地音效文件未找到: {audio_path}")
+        if self.playback_engine: audio = self.sound_bank.get(command, self.playback_engine.output_format)
+        else: audio = self.sound_bank.path(command)
+        if audio is None:
+            self.log(f"❌ 本地音效未加载: {command}")
+            return
+        seq = self._get_next_seq()
+        self.play_queue.put((priority, seq, audio, command))
+        if priority <= 0: self._preempt_playback()
+        self.logger.debug("✅ 本地音效已入队: %s", command)
+
+    def add_text_stream(self, chunks, priority=2, request_type='default'):
+        """流式AI文本（逐段到达的字符串迭代器）：每闭合一句就作为一个任务加入，不等整段回复；阻塞到迭代器结束，返回段数"""
+        stream = self.segmenter.stream(short_first=self.scheduler.buffered_seconds() <= 0)
+        count = 0
+        for text in chunks:
+            for segment in stream.feed(text):
+                self.add_task(segment, priority, request_type, split=False); count += 1
+        for segment in stream.flush():
+            self.add_task(segment, priority, request_type, split=False); count += 1
+        return count
 
     def interrupt_and_speak(self, text):
         self.log(f"⚡ 收到紧急插话指令: {text}")
@@ -290,17 +826,40 @@ class TTSClientGenerator:
     def get_unprocessed_size(self):
         return self.pending_priority1 + self.pending_priority2
     def can_generate_new_script(self):
-        return self.get_unprocessed_size() < 5
+        """缓冲的音频（合成中的预估 + 待播放 + 正在播放的剩余）低于低水位时允许生成新话术"""
+        return self.scheduler.needs_more()
+    def wait_for_demand(self, timeout=None):
+        """阻塞到需要补充话术为止，返回 (需要的秒数, 预估字数)；超时返回 (0.0, 0)"""
+        return self.scheduler.wait_for_demand(timeout)
     def test_and_play_sync(self, text, use_assistant=False):
         self.log(f"【声音测试】{'助播' if use_assistant else '主线'}: {text}")
         if not text: return
         self.add_task(text, priority=-1, request_type='test_assistant' if use_assistant else 'test_main')
     def stop(self):
         self._stop_event.set()
+        self.scheduler.stop()
+        self.ai_pool.shutdown(wait=False)
+        self.decode_pool.shutdown(wait=False)
+        self.sound_bank.stop()
+        if self.playback_engine: self.playback_engine.close()
         if self.current_playback_process and self.current_playback_process.poll() is None:
             self.current_playback_process.terminate()
+        if self.transport: self.transport.close()
         with self.lock:
             if self.sock: self.sock.close(); self.sock = None
+    def _play_clip(self, seq, audio):
+        """播放一个队列条目：本地音效是文件路径，合成结果是内存中的PcmClip。
+        子进程播放器只认文件，所以只有这里才会把PCM落盘，播放完立即删除。"""
+        if self.playback_engine:
+            self.playback_engine.play(audio, clear_preempt=False); return
+        if isinstance(audio, StreamingClip): audio = audio.to_clip()
+        if not isinstance(audio, PcmClip):
+            self._play_audio_in_subprocess(audio); return
+        audio_path = self.spool.write(audio, seq)
+        try:
+            self._play_audio_in_subprocess(audio_path)
+        finally:
+            self.spool.release(audio_path)
     def _play_audio_in_subprocess(self, audio_path):
         if self.current_playback_process and self.current_playback_process.poll() is None:
             self.current_playback_process.terminate()
@@ -313,6 +872,7 @@ class TTSClientGenerator:
                 self.log(f"❌ 致命错误：找不到播放脚本 'local_model_client.py'"); return
             command = [sys.executable, player_script_path, os.path.abspath(audio_path)]
             self.current_playback_process = subprocess.Popen(command, cwd=base_dir, creationflags=subprocess.CREATE_NO_WINDOW)
+            if self._subprocess_preempt.is_set(): self.current_playback_process.terminate()
             self.current_playback_process.wait()
         except Exception as e:
             self.log(f"❌ 启动播放子进程时出错: {e}")
@@ -323,20 +883,24 @@ class TTSClientGenerator:
                 self.log("正在连接到TTS中央服务器...")
                 self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.sock.connect((self.server_host, self.server_port))
+                self.negotiated_codec = audio_codecs.WAV
+                if self.audio_codecs: tts_protocol.send_msg(self.sock, tts_protocol.hello_msg(self.audio_codecs))
+                self._connected.set()
+                self._connect_count += 1
+                if self._connect_count > 1: self.metrics.inc("reconnects")
                 self.log("✅ 成功连接到TTS服务器。"); return True
             except Exception as e:
-                self.log(f"❌ 连接TTS服务器失败: {e}"); self.sock = None; return False
+                self.log(f"❌ 连接TTS服务器失败: {e}"); self.sock = None; self._connected.clear(); return False
+    def _drop_connection(self):
+        self._connected.clear()
+        with self.lock:
+            sock, self.sock = self.sock, None
+            if sock is None: return
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            sock.close()
     def _send_msg(self, data):
-        length = struct.pack('>I', len(data)); self.sock.sendall(length + data)
+        tts_protocol.send_msg(self.sock, data)
     def _recv_msg(self):
-        raw_msglen = self._recv_all(4)
-        if not raw_msglen: return None
-        msglen = struct.unpack('>I', raw_msglen)[0]
-        return self._recv_all(msglen)
-    def _recv_all(self, n):
-        data = bytearray()
-        while len(data) < n:
-            packet = self.sock.recv(n - len(data))
-            if not packet: return None
-            data.extend(packet)
-        return data
+        """读取一条服务器消息，自动识别二进制帧与JSON帧，返回音频已解码的packet"""
+        return tts_protocol.recv_msg(self.sock)
@@ -0,0 +1,169 @@
+# playback_engine.py
+# 常驻进程内的播放引擎：一个输出流一直保持打开，按小块写入PCM，
+# 连续的片段首尾相接没有间隙，每写完一块都会检查抢占标志，可以立即打断当前播放。
+# 输出端(sink)可替换：声卡(pyaudio)、空输出(无头Linux上测量间隙/延迟)、WAV文件。
+import threading, time, wave
+from audio_pcm import PcmClip, StreamingClip
+
+
+class NullSink:
+    """不发声的输出端。realtime=True 时按音频时长阻塞，模拟声卡的节奏；同时记录每次写入，用于测量间隙"""
+    def __init__(self, realtime=True):
+        self.realtime = realtime
+        self.format = None
+        self.writes = []  # [(monotonic时间, 字节数)]
+
+    def open(self, fmt):
+        self.format = fmt
+
+    def write(self, data):
+        self.writes.append((time.monotonic(), len(data)))
+        if self.realtime:
+            sample_rate, sample_width, channels = self.format
+            time.sleep(len(data) / float(sample_rate * sample_width * channels))
+
+    def close(self):
+        pass
+
+
+class FileSink(NullSink):
+    """把播放内容依次写进一个WAV文件，便于离线检查拼接结果"""
+    def __init__(self, path, realtime=False):
+        super().__init__(realtime)
+        self.path = path
+        self._wav = None
+
+    def open(self, fmt):
+        super().open(fmt)
+        sample_rate, sample_width, channels = fmt
+        self._wav = wave.open(self.path, 'wb')
+        self._wav.setnchannels(channels)
+        self._wav.setsampwidth(sample_width)
+        self._wav.setframerate(sample_rate)
+
+    def write(self, data):
+        self._wav.writeframes(data)
+        super().write(data)
+
+    def close(self):
+        if self._wav: self._wav.close(); self._wav = None
+
+
+class PyAudioSink:
+    """声卡输出，使用 pyaudio 的阻塞写入流"""
+    def __init__(self):
+        import pyaudio
+        self._pyaudio = pyaudio
+        self._pa = None
+        self._stream = None
+
+    def open(self, fmt):
+        sample_rate, sample_width, channels = fmt
+        self._pa = self._pyaudio.PyAudio()
+        self._stream = self._pa.open(format=self._pa.get_format_from_width(sample_width),
+                                     channels=channels, rate=sample_rate, output=True)
+
+    def write(self, data):
+        self._stream.write(bytes(data))
+
+    def close(self):
+        if self._stream: self._stream.stop_stream(); self._stream.close(); self._stream = None
+        if self._pa: self._pa.terminate(); self._pa = None
+
+
+def create_default_sink():
+    """返回声卡输出端；未安装 pyaudio 时返回 None，由调用方回退到其它播放方式"""
+    try:
+        return PyAudioSink()
+    except ImportError:
+        return None
+
+
+class PlaybackEngine:
+    def __init__(self, sink, block_ms=40, output_format=None, stream_timeout=10.0):
+        self.sink = sink
+        self.block_ms = block_ms
+        self.stream_timeout = stream_timeout
+        self.output_format = output_format  # 为None时采用第一个片段的格式
+        self._opened = False
+        self._preempt = threading.Event()
+        self._fade_ms = 0
+        self._stream = None  # 正在播放的 StreamingClip，打断时唤醒它的等待
+        self._lock = threading.Lock()
+        self._last_end = None
+        self.stats = {"clips": 0, "preempted": 0, "last_gap": 0.0, "max_gap": 0.0, "total_gap": 0.0}
+
+    def play(self, clip, clear_preempt=True):
+        """阻塞播放一个片段（PcmClip、StreamingClip 或 WAV 文件路径）。完整播完返回True，被抢占返回False。
+        StreamingClip 边到达边播放，等待下一块超过 stream_timeout 秒时按已收到的部分结束。
+        clear_preempt=False 时保留调用前已收到的打断请求（调用方自己在合适的时机调用 clear_preempt）"""
+        if isinstance(clip, StreamingClip):
+            fmt, pieces = clip.format, clip.iter_pieces(self.stream_timeout, self._preempt)
+        else:
+            if not isinstance(clip, PcmClip): clip = PcmClip.from_file(clip)
+            fmt, pieces = clip.format, (clip,)
+        with self._lock:
+            if clear_preempt: self._preempt.clear()
+            self._stream = clip if isinstance(clip, StreamingClip) else None
+            if not self._opened:
+                if self.output_format is None: self.output_format = fmt
+                self.sink.open(self.output_format)
+                self._opened = True
+            try:
+                return self._write_pieces(pieces)
+            finally:
+                self._stream = None
+
+    def _write_pieces(self, pieces):
+        """调用方需持有 _lock"""
+        started = False
+        for piece in pieces:
+            piece = piece.convert(*self.output_format)
+            pcm = memoryview(piece.pcm)
+            step = max(piece.frame_size, piece.frame_size * int(piece.sample_rate * self.block_ms / 1000))
+
+            for offset in range(0, len(pcm), step):
+                if self._preempt.is_set():
+                    if started and self._fade_ms: self._write_fade(piece, pcm[offset:])
+                    self.stats["preempted"] += 1
+                    self._last_end = None
+                    return False
+                if not started: self._record_gap(); started = True
+                self.sink.write(pcm[offset:offset + step])
+        if self._stream is not None and self._preempt.is_set():  # 等待下一块时被打断
+            self.stats["preempted"] += 1
+            self._last_end = None
+            return False
+        self.stats["clips"] += 1
+        self._last_end = time.monotonic()
+        return True
+
+    def preempt(self, fade_ms=0):
+        """打断正在播放的片段，在当前音频块写完后生效（流式片段在等待下一块时立即结束）；fade_ms>0 时先把接下来这段音频淡出再停止，避免爆音"""
+        self._fade_ms = fade_ms
+        self._preempt.set()
+        stream = self._stream
+        if stream is not None: stream.wake()
+
+    def clear_preempt(self):
+        self._preempt.clear()
+
+    def close(self):
+        self.preempt()
+        with self._lock:
+            if self._opened: self.sink.close(); self._opened = False
+
+    def _write_fade(self, piece, rest):
+        """把剩余音频的前 _fade_ms 毫秒做线性淡出后写出"""
+        size = min(len(rest), piece.frame_size * int(piece.sample_rate * self._fade_ms / 1000))
+        if size < piece.frame_size: return
+        tail = PcmClip(bytes(rest[:size]), *piece.format).to_segment()
+        self.sink.write(tail.fade_out(len(tail)).raw_data)
+
+    def _record_gap(self):
+        """记录上一片段结束到本片段开始写入之间的空档"""
+        if self._last_end is None: return
+        gap = time.monotonic() - self._last_end
+        self.stats["last_gap"] = gap
+        self.stats["total_gap"] += gap
+        self.stats["max_gap"] = max(self.stats["max_gap"], gap)
@@ -0,0 +1,120 @@
+# reassembly_store.py
+# 带截止时间和内存上限的重组缓冲区，接口与原来的 {seq: entry} 字典保持一致。
+# 每个条目有整体截止时间（自动任务更短），主线到达后助播另有截止时间；
+# 缓冲的音频字节超过上限时，优先让已有主线的条目降级为只播主线，其次丢弃最旧的自动任务。
+# sweep() 只做判定并返回需要处理的条目，拼接、计数等由调用方完成。
+import threading, time
+from audio_pcm import PcmClip
+
+DEGRADE = "degrade"  # 放弃助播，只播主线
+DROP = "drop"  # 已从缓冲区移除，整条任务丢弃
+
+
+def _audio_size(value):
+    if isinstance(value, (bytes, bytearray)): return len(value)
+    if isinstance(value, PcmClip): return len(value.pcm)
+    return 0
+
+
+class ReassemblyStore:
+    def __init__(self, main_timeout=30.0, assist_timeout=8.0, auto_timeout=15.0, max_bytes=64 * 1024 * 1024):
+        self.main_timeout = main_timeout  # 从入队到主线音频到达的最长等待
+        self.assist_timeout = assist_timeout  # 主线到达后等待助播的最长时间
+        self.auto_timeout = auto_timeout  # 自动话术(优先级1)的整体期限，过期说明已经过时
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._meta = {}  # seq -> [创建时间, 截止时间, 助播截止时间, 已缓冲字节]
+        self._bytes = 0
+        self.metrics = {"expired": 0, "assist_timeouts": 0, "over_budget_degraded": 0,
+                        "over_budget_dropped": 0, "stale_auto_dropped": 0, "peak_bytes": 0}
+
+    def __contains__(self, seq):
+        return seq in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, seq):
+        return self._entries[seq]
+
+    def get(self, seq, default=None):
+        return self._entries.get(seq, default)
+
+    def __setitem__(self, seq, entry):
+        now = time.monotonic()
+        timeout = self.auto_timeout if entry.get('priority') == 1 else self.main_timeout
+        with self._lock:
+            self.pop(seq)
+            self._entries[seq] = entry
+            self._meta[seq] = [now, now + timeout, None, 0]
+            if entry.get('main') is not None: self._meta[seq][2] = now + self.assist_timeout
+
+    def set_part(self, seq, part, value):
+        """写入主线/助播结果并计入内存占用；主线到达时开始计算助播的截止时间"""
+        with self._lock:
+            entry = self._entries.get(seq)
+            if entry is None: return None
+            meta = self._meta[seq]
+            old = _audio_size(entry.get(part))
+            entry[part] = value
+            delta = _audio_size(value) - old
+            meta[3] += delta
+            self._bytes += delta
+            self.metrics["peak_bytes"] = max(self.metrics["peak_bytes"], self._bytes)
+            if part == 'main' and meta[2] is None: meta[2] = time.monotonic() + self.assist_timeout
+            return entry
+
+    def pop(self, seq, default=None):
+        with self._lock:
+            entry = self._entries.pop(seq, None)
+            if entry is None: return default
+            self._bytes -= self._meta.pop(seq)[3]
+            return entry
+
+    @property
+    def buffered_bytes(self):
+        return self._bytes
+
+    def sweep(self, now=None):
+        """返回 [(seq, entry, DEGRADE|DROP)]。DROP 的条目已被移除；DEGRADE 的条目仍在缓冲区，由调用方拼接"""
+        now = time.monotonic() if now is None else now
+        actions = []
+        with self._lock:
+            for seq, entry in list(self._entries.items()):
+                created, deadline, assist_deadline, _ = self._meta[seq]
+                main_ready = entry.get('main') is not None
+                if main_ready and entry.get('assist') is None and assist_deadline is not None and now >= assist_deadline:
+                    self.metrics["assist_timeouts"] += 1
+                    actions.append((seq, entry, DEGRADE))
+                elif not main_ready and now >= deadline:
+                    self.metrics["stale_auto_dropped" if entry.get('priority') == 1 else "expired"] += 1
+                    actions.append((seq, self.pop(seq), DROP))
+
+            if self._bytes > self.max_bytes:
+                actions.extend(self._shed_over_budget({seq for seq, _, _ in actions}))
+        return actions
+
+    def _shed_over_budget(self, handled):
+        """超出内存上限：先降级已有主线的条目，再按自动任务优先、从旧到新丢弃"""
+        def order(seq):
+            entry = self._entries[seq]
+            rank = 0 if entry.get('main') is not None else (1 if entry.get('priority') == 1 else 2)
+            return (rank, self._meta[seq][0])
+
+        actions = []
+        excess = self._bytes - self.max_bytes
+        for seq in sorted((s for s in self._entries if s not in handled), key=order):
+            if excess <= 0: break
+            excess -= self._meta[seq][3]
+            if self._entries[seq].get('main') is not None:
+                self.metrics["over_budget_degraded"] += 1
+                actions.append((seq, self._entries[seq], DEGRADE))
+            else:
+                self.metrics["over_budget_dropped"] += 1
+                actions.append((seq, self.pop(seq), DROP))
+        return actions
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(self.metrics, entries=len(self._entries), buffered_bytes=self._bytes)
@@ -0,0 +1,174 @@
+# server_pool.py
+# 多台TTS服务器的连接池：对每个端点保持一条 AsyncTTSTransport 连接，
+# 按"未完成请求数最少"或"延迟EWMA最低"选择服务器；某台服务器断开时把它的待回复请求转发到其它服务器。
+# 同一 seq 的主线和助播请求尽量分到不同服务器并行合成。所有连接共用一个事件循环线程。
+# 连接还在但迟迟不回包的服务器（如GPU进程卡死）按回复期限判为卡住，同样转发它的待回复请求，冷却后再试用。
+import asyncio, threading, time
+from async_transport import AsyncTTSTransport
+
+
+class _Endpoint:
+    __slots__ = ('host', 'port', 'transport', 'healthy', 'ewma_latency', 'assigned', 'last_reply', 'stalled_at')
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.transport = None
+        self.healthy = False
+        self.ewma_latency = None  # 秒
+        self.assigned = 0  # 已分配且尚未完成的请求数
+        self.last_reply = 0.0  # 最近一次收到该服务器回包的时间
+        self.stalled_at = None  # 被判为卡住的时间
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+
+class TTSServerPool:
+    def __init__(self, endpoints, on_packet, strategy='least_outstanding', ewma_alpha=0.2,
+                 binary_frames=True, is_pending=None, log=print, codecs=(), reply_timeout=8.0, stall_factor=4.0,
+                 stall_cooldown=10.0, check_interval=0.5):
+        if strategy not in ('least_outstanding', 'ewma'):
+            raise ValueError(f"未知的负载均衡策略: {strategy}")
+        self.endpoints = [_Endpoint(host, port) for host, port in endpoints]
+        self.on_packet = on_packet
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.binary_frames = binary_frames
+        self.codecs = codecs
+        self.is_pending = is_pending
+        self.log = log
+        # 有请求在等待、且超过 max(reply_timeout, stall_factor × 延迟EWMA) 秒没有收到任何回包的服务器判为卡住
+        self.reply_timeout = reply_timeout
+        self.stall_factor = stall_factor
+        self.stall_cooldown = stall_cooldown  # 卡住的服务器冷却多久后重新参与分配
+        self.check_interval = check_interval
+        self._loop = None
+        self._loop_thread = None
+        self._routes = {}  # (request_id, is_assistant) -> _Endpoint
+        self._sent_at = {}  # (request_id, is_assistant) -> 发往当前服务器的时间
+        self._closed = False
+        self.stats = {"failovers": 0, "requests": 0, "stalls": 0}
+
+    @property
+    def outstanding(self):
+        return len(self._routes)
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="TTSServerPool")
+        self._loop_thread.start()
+        for ep in self.endpoints:
+            ep.transport = AsyncTTSTransport(ep.host, ep.port, self._packet_handler(ep), binary_frames=self.binary_frames,
+                                             loop=self._loop, is_pending=self.is_pending, log=self.log, codecs=self.codecs,
+                                             on_connection_change=self._on_connection_change)
+            ep.transport.start()
+        asyncio.run_coroutine_threadsafe(self._watch_replies(), self._loop)
+
+    def submit(self, payload):
+        """线程安全：路由并发送请求，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(self.request(payload), self._loop)
+
+    async def request(self, payload):
+        """选择服务器发送请求；该服务器断开时转发到其它服务器，直到收到回复"""
+        key = (payload['request_id'], bool(payload.get('is_assistant')))
+        failed = set()
+        self.stats["requests"] += 1
+        try:
+            while True:
+                ep = self._pick(key, failed)
+                self._routes[key] = ep
+                ep.assigned += 1
+                started = self._sent_at[key] = time.monotonic()
+                try:
+                    packet = await ep.transport.request(payload)
+                except ConnectionError:
+                    failed.add(ep.name)
+                    self.stats["failovers"] += 1
+                    if self.is_pending and not self.is_pending(key[0]): raise
+                    continue
+                finally:
+                    ep.assigned -= 1
+                self._observe_latency(ep, time.monotonic() - started)
+                return packet
+        finally:
+            self._routes.pop(key, None)
+            self._sent_at.pop(key, None)
+
+    def cancel(self, request_id):
+        """线程安全：在处理该请求的服务器上取消它"""
+        self._loop.call_soon_threadsafe(self._cancel, request_id)
+
+    def _cancel(self, request_id):
+        for ep in {self._routes.get((request_id, part)) for part in (False, True)} - {None}:
+            ep.transport._cancel(request_id)
+
+    def close(self):
+        if self._loop is None or self._closed: return
+        self._closed = True
+        for ep in self.endpoints: ep.transport.close()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def get_stats(self):
+        return dict(self.stats, endpoints=[
+            {"endpoint": ep.name, "healthy": ep.healthy, "stalled": ep.stalled_at is not None, "assigned": ep.assigned,
+             "ewma_latency": ep.ewma_latency, "codec": ep.transport.codec, **ep.transport.stats} for ep in self.endpoints])
+
+    def _pick(self, key, failed):
+        """优先健康且未失败过的端点；同一seq的另一部分所在的服务器排在后面，让主线和助播并行合成"""
+        sibling = self._routes.get((key[0], not key[1]))
+        candidates = [ep for ep in self.endpoints if ep.healthy and ep.name not in failed] \
+            or [ep for ep in self.endpoints if ep.healthy] \
+            or self.endpoints  # 全部不可用时仍然分配，等连接恢复后由 transport 重发
+        return min(candidates, key=lambda ep: (ep is sibling,) + self._score(ep))
+
+    def _score(self, ep):
+        latency = ep.ewma_latency or 0.0  # 还没有延迟样本的端点优先试一次
+        if self.strategy == 'ewma':
+            return (latency * (ep.assigned + 1), ep.assigned)
+        return (ep.assigned, latency)
+
+    def _observe_latency(self, ep, latency):
+        if ep.ewma_latency is None: ep.ewma_latency = latency
+        else: ep.ewma_latency += self.ewma_alpha * (latency - ep.ewma_latency)
+
+    def _on_connection_change(self, transport, connected):
+        ep = next(ep for ep in self.endpoints if ep.transport is transport)
+        ep.healthy = connected
+        ep.stalled_at = None
+        if connected or self._closed: return
+        self._fail_over(ep, "连接中断")
+
+    def _fail_over(self, ep, reason):
+        if not any(other.healthy for other in self.endpoints): return  # 没有可转发的服务器，保留给原连接重连后重发
+        moved = ep.transport.abandon_inflight(ConnectionError(f"TTS服务器 {ep.name} {reason}"))
+        if moved: self.log(f"⚠️ TTS服务器 {ep.name} 不可用（{reason}），{moved} 个请求转发到其它服务器。")
+
+    def _packet_handler(self, ep):
+        def on_packet(packet):
+            ep.last_reply = time.monotonic()
+            if ep.stalled_at is not None and ep.transport.connected:
+                ep.stalled_at, ep.healthy = None, True
+                self.log(f"✅ TTS服务器 {ep.name} 恢复回包。")
+            self.on_packet(packet)
+        return on_packet
+
+    async def _watch_replies(self):
+        """定期检查：连接正常但有请求等待、又长时间没有任何回包的服务器判为卡住并转发其请求"""
+        while not self._closed:
+            await asyncio.sleep(self.check_interval)
+            now = time.monotonic()
+            for ep in self.endpoints:
+                if ep.stalled_at is not None:
+                    if now - ep.stalled_at >= self.stall_cooldown and ep.transport.connected:
+                        ep.stalled_at, ep.healthy = None, True  # 冷却结束，重新试用；仍然卡住会再次被判出
+                    continue
+                if not ep.healthy: continue
+                waiting = [self._sent_at[key] for key, route in self._routes.items() if route is ep and key in self._sent_at]
+                if not waiting: continue
+                deadline = max(self.reply_timeout, self.stall_factor * (ep.ewma_latency or 0.0))
+                if now - max(min(waiting), ep.last_reply) <= deadline: continue
+                ep.healthy, ep.stalled_at = False, now
+                self.stats["stalls"] += 1
+                self._fail_over(ep, f"{deadline:.1f}秒内没有回包")
@@ -0,0 +1,139 @@
+# sound_bank.py
+# 本地音效库（[咳嗽]、[叹气]、[呼吸] 等）：启动时把 sounds_library 中的文件全部解码进内存，播放时不再读盘。
+# - 同一音效按需转换到不同的采样格式并缓存，拼进语音或交给播放引擎时不用每次重采样；
+# - 后台线程按修改时间轮询，文件变化或 sounds_library 增加条目时重新加载；
+# - split_markers() 把文本中内嵌的音效标记切出来，音效直接拼进相邻的语音片段，中间没有额外的间隙。
+import os, random, re, threading
+from audio_pcm import PcmClip
+
+
+class SoundBank:
+    def __init__(self, directory, library, output_format=None, poll_interval=2.0, log=print):
+        self.directory = directory
+        self.library = library  # {标记: 文件名 或 [文件名, ...]}，与调用方共享同一个字典，增删条目在下次轮询时生效
+        self.output_format = output_format  # 预先转换的格式（播放引擎的输出格式），为None时保留原格式
+        self.poll_interval = poll_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._clips = {}  # 文件名 -> {采样格式: PcmClip}，第一个为原始解码结果
+        self._mtimes = {}  # 文件名 -> 加载时的修改时间
+        self._missing = set()
+        self._pattern = None
+        self._pattern_keys = None
+        self._stopped = threading.Event()
+        self._loaded_once = False
+        self.stats = {"loaded": 0, "reloads": 0, "hits": 0, "misses": 0, "load_errors": 0}
+        self.reload()
+
+    def start_watching(self):
+        threading.Thread(target=self._watch, daemon=True, name="SoundBankWatcher").start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def has(self, command):
+        return command in self.library
+
+    def get(self, command, fmt=None):
+        """随机取该标记的一个音效，转换到 fmt（默认 output_format）；未加载成功时返回None"""
+        filenames = self._filenames(command)
+        with self._lock:
+            loaded = [name for name in filenames if name in self._clips]
+            if not loaded:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            variants = self._clips[random.choice(loaded)]
+        fmt = fmt or self.output_format
+        clip = variants.get(fmt) if fmt else next(iter(variants.values()))
+        if clip is None:
+            clip = next(iter(variants.values())).convert(*fmt)
+            with self._lock: variants[fmt] = clip
+        return clip
+
+    def path(self, command):
+        """随机取一个已加载音效的文件路径（子进程播放后端只能播放文件）；没有时返回None"""
+        with self._lock: loaded = [name for name in self._filenames(command) if name in self._clips]
+        return os.path.join(self.directory, random.choice(loaded)) if loaded else None
+
+    def split_markers(self, text):
+        """把内嵌音效标记的文本切成 [(语音文本, 前置音效, 后置音效)]：标记拼在前一段语音之后，
+        文本以标记开头时拼在第一段语音之前。只有标记没有语音时返回 [(None, 标记列表, [])]"""
+        pattern = self._marker_pattern()
+        if pattern is None or not pattern.search(text): return [(text, [], [])]
+        runs, before = [], []
+        pos = 0
+        for match in pattern.finditer(text):
+            speech = text[pos:match.start()]
+            if speech.strip():
+                runs.append((speech, before, []))
+                before = []
+            if runs: runs[-1][2].append(match.group())
+            else: before.append(match.group())
+            pos = match.end()
+        if text[pos:].strip(): runs.append((text[pos:], before, []))
+        elif before: runs.append((None, before, []))
+        return runs
+
+    def reload(self):
+        """加载新增或修改过的音效文件，返回重新加载的文件数"""
+        names = {name for command in list(self.library) for name in self._filenames(command)}
+        changed = 0
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                if name not in self._missing:
+                    self._missing.add(name)
+                    self.log(f"❌ 本地音效文件未找到: {path}")
+                continue
+            self._missing.discard(name)
+            if self._mtimes.get(name) == mtime: continue
+            try:
+                clip = PcmClip.from_file(path)
+                clip = PcmClip(bytes(clip.pcm), *clip.format)
+            except Exception as e:
+                self.stats["load_errors"] += 1
+                self.log(f"❌ 本地音效解码失败 {path}: {e}")
+                self._mtimes[name] = mtime
+                continue
+            variants = {clip.format: clip}
+            if self.output_format: variants[self.output_format] = clip.convert(*self.output_format)
+            with self._lock:
+                self._clips[name] = variants
+                self._mtimes[name] = mtime
+            changed += 1
+        with self._lock:
+            for name in set(self._clips) - names:
+                del self._clips[name]
+                self._mtimes.pop(name, None)
+        self.stats["loaded"] += changed
+        if changed and self._loaded_once: self.stats["reloads"] += 1
+        self._loaded_once = True
+        return changed
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, sounds=len(self._clips),
+                        bytes=sum(len(clip.pcm) for variants in self._clips.values() for clip in variants.values()))
+
+    def _filenames(self, command):
+        info = self.library.get(command)
+        if not info: return []
+        return list(info) if isinstance(info, (list, tuple)) else [info]
+
+    def _marker_pattern(self):
+        keys = tuple(sorted(self.library, key=len, reverse=True))
+        if keys != self._pattern_keys:
+            self._pattern_keys = keys
+            self._pattern = re.compile('|'.join(map(re.escape, keys))) if keys else None
+        return self._pattern
+
+    def _watch(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                if self.reload(): self.log("🔄 本地音效已重新加载。")
+            except Exception as e:
+                self.log(f"❌ 重新加载本地音效时出错: {e}")
@@ -0,0 +1,125 @@
+# synthesis_cache.py
+# 按内容寻址的合成结果缓存，TTSClientGenerator 与 TTSGenerator 共用。
+# 键 = (规范化文本, 声音/是否助播, 参考音频, 合成参数) 的哈希；
+# 两级存储：内存LRU（按字节预算淘汰）+ 可选的磁盘层（同样按字节预算淘汰最久未用的文件）。
+import hashlib, json, os, re, threading, unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """规范化文本：全角半角统一、去掉所有空白，使仅有空格差异的句子命中同一条缓存"""
+    return re.sub(r'\s+', '', unicodedata.normalize('NFKC', text))
+
+
+class SynthesisCache:
+    def __init__(self, cache_dir=None, memory_budget=64 * 1024 * 1024, disk_budget=512 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> 文件大小
+        self._disk_bytes = 0
+        self.stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(text, voice, ref_audio=None, params=None):
+        material = json.dumps([normalize_text(text), voice, ref_audio, params or {}],
+                              sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """查询缓存，未命中返回None。磁盘命中会提升到内存层"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1; self.stats["memory_hits"] += 1
+                return data
+            on_disk = key in self._disk
+        if on_disk:
+            try:
+                with open(self._disk_path(key), 'rb') as f: data = f.read()
+                os.utime(self._disk_path(key))  # 刷新修改时间，重启后仍保持LRU顺序
+            except OSError:
+                data = None
+            with self._lock:
+                if data is None:
+                    self._forget_disk(key)
+                else:
+                    if key in self._disk: self._disk.move_to_end(key)
+                    self._put_memory(key, data)
+                    self.stats["hits"] += 1; self.stats["disk_hits"] += 1
+                    return data
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, data):
+        data = bytes(data)
+        with self._lock:
+            self._put_memory(key, data)
+            if not self.cache_dir or key in self._disk or len(data) > self.disk_budget: return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f: f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            return
+        with self._lock:
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            while self._disk_bytes > self.disk_budget and self._disk:
+                old_key = next(iter(self._disk))
+                self._forget_disk(old_key)
+                try: os.remove(self._disk_path(old_key))
+                except OSError: pass
+                self.stats["evictions"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, memory_bytes=self._memory_bytes, memory_entries=len(self._memory),
+                        disk_bytes=self._disk_bytes, disk_entries=len(self._disk))
+
+    def _put_memory(self, key, data):
+        """调用方需持有锁"""
+        if len(data) > self.memory_budget: return
+        old = self._memory.pop(key, None)
+        if old is not None: self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None: self._disk_bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _load_disk_index(self):
+        """启动时按修改时间重建磁盘索引，最旧的排在最前面优先淘汰"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                try: os.remove(path)
+                except OSError: pass
+                continue
+            if not name.endswith('.wav'): continue
+            try: st = os.stat(path)
+            except OSError: continue
+            entries.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
@@ -0,0 +1,65 @@
+# 模块都在仓库根目录，测试直接按模块名导入
+import json, os, socket, sys, threading
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tts_protocol
+
+
+class FakeTTSServer:
+    """最小的TTS服务器：每收到一个请求调用 handler(server, 连接序号, 请求)，
+    返回dict时作为JSON回包发送，返回False时断开该连接，返回None时不回复"""
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []  # [(连接序号, 请求)]
+        self.connections = 0
+        self._conns = []
+        self._sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self._conns.append(conn)
+            threading.Thread(target=self._serve, args=(conn, self.connections), daemon=True).start()
+
+    def _serve(self, conn, number):
+        with conn:
+            while True:
+                try:
+                    request = tts_protocol.recv_msg(conn)
+                except OSError:
+                    return
+                if request is None: return
+                if 'request_id' not in request: continue  # 控制消息
+                self.requests.append((number, request))
+                reply = self.handler(self, number, request)
+                if reply is False: return
+                if reply: tts_protocol.send_msg(conn, json.dumps(reply).encode('utf-8'))
+
+    def close(self):
+        """停止监听并断开所有连接"""
+        for sock in [self._sock] + self._conns:
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            sock.close()
+
+
+def reply_for(request, **extra):
+    return dict({"request_id": request["request_id"], "is_assistant": bool(request.get("is_assistant")),
+                 "status": "success", "audio_data": ""}, **extra)
+
+
+@pytest.fixture
+def tts_server():
+    servers = []
+
+    def start(handler):
+        servers.append(FakeTTSServer(handler))
+        return servers[-1]
+    yield start
+    for server in servers: server.close()
@@ -0,0 +1,40 @@
+from concurrent.futures import CancelledError
+import pytest
+from async_transport import AsyncTTSTransport
+from conftest import reply_for
+
+
+def quiet(*_): pass
+
+
+def test_inflight_request_is_replayed_after_reconnect(tts_server):
+    # 第一条连接收到请求后直接断开，重连后应重发并收到回复
+    server = tts_server(lambda server, number, request: False if number == 1 else reply_for(request, server_conn=number))
+    received = []
+    transport = AsyncTTSTransport("127.0.0.1", server.port, received.append, backoff_base=0.01, log=quiet)
+    transport.start()
+    try:
+        packet = transport.submit({"request_id": 1, "text": "你好"}).result(5)
+        assert packet["request_id"] == 1 and packet["server_conn"] == 2
+        assert received == [packet]
+        assert [number for number, _ in server.requests] == [1, 2]
+        assert server.requests[1][1]["frame_format"] == "binary"
+        assert transport.stats["reconnects"] == 1 and transport.stats["resent"] == 1
+        assert transport.outstanding == 0
+    finally:
+        transport.close()
+
+
+def test_requests_no_longer_pending_are_not_replayed(tts_server):
+    server = tts_server(lambda server, number, request: False if number == 1 else reply_for(request))
+    transport = AsyncTTSTransport("127.0.0.1", server.port, quiet, backoff_base=0.01, log=quiet,
+                                  is_pending=lambda request_id: request_id != 2)
+    transport.start()
+    try:
+        stale = transport.submit({"request_id": 2, "text": "过时"})
+        assert transport.submit({"request_id": 3, "text": "新的"}).result(5)["request_id"] == 3
+        with pytest.raises(CancelledError):
+            stale.result(5)
+        assert [request["request_id"] for number, request in server.requests if number > 1] == [3]
+    finally:
+        transport.close()
@@ -0,0 +1,99 @@
+import errno, os
+import pytest
+pytest.importorskip("pydub")
+import audio_spool
+from audio_pcm import PcmClip
+from audio_spool import AudioSpool, SpoolFull
+
+
+def test_quota_is_reserved_and_returned(tmp_path):
+    spool = AudioSpool(str(tmp_path / "spool"), quota_bytes=100)
+    first = spool.write(b'x' * 60, tag=7)
+    assert spool.owns(first) and os.path.basename(first).startswith(f"tts_{os.getpid()}_7_")
+    with pytest.raises(SpoolFull):
+        spool.write(b'y' * 50)
+    assert spool.used_bytes == 60 and len(os.listdir(spool.directory)) == 1
+    spool.release(first)
+    assert not os.path.exists(first) and spool.used_bytes == 0
+    assert spool.write(b'z' * 100) and spool.get_stats()["rejected"] == 1
+
+
+def test_adopt_moves_or_copies_atomically(tmp_path, monkeypatch):
+    spool = AudioSpool(str(tmp_path / "spool"), quota_bytes=None)
+    src = tmp_path / "gradio.wav"
+    src.write_bytes(b'RIFF1')
+    moved = spool.adopt(str(src))
+    assert not src.exists() and open(moved, 'rb').read() == b'RIFF1'
+
+    real_replace = os.replace
+
+    def cross_device(a, b):
+        if a == str(src): raise OSError(errno.EXDEV, "Invalid cross-device link")
+        real_replace(a, b)
+    monkeypatch.setattr(audio_spool.os, "replace", cross_device)
+    src.write_bytes(b'RIFF22')
+    copied = spool.adopt(str(src))
+    assert not src.exists() and open(copied, 'rb').read() == b'RIFF22'
+    assert copied != moved and not [name for name in os.listdir(spool.directory) if name.endswith(".part")]
+    assert (spool.stats["moved"], spool.stats["copied"]) == (1, 1) and spool.used_bytes == 11
+
+
+@pytest.mark.parametrize("mmap_min_bytes", [0, 1024 * 1024])
+def test_open_clip_reads_written_wav_and_unmaps_on_exit(tmp_path, mmap_min_bytes):
+    spool = AudioSpool(str(tmp_path / "spool"), mmap_min_bytes=mmap_min_bytes)
+    clip = PcmClip(b'\x01\x00' * 800, 16000, 2, 1)
+    path = spool.write(clip)
+    with spool.open_clip(path) as loaded:
+        assert loaded.format == clip.format and bytes(loaded.pcm) == clip.pcm
+    if mmap_min_bytes == 0:
+        with pytest.raises(ValueError):
+            bytes(loaded.pcm)  # 映射已解除
+    spool.release(path)
+    assert spool.used_bytes == 0 and not os.listdir(spool.directory)
+
+
+def test_failed_remove_keeps_quota_and_is_retried(tmp_path, monkeypatch):
+    spool = AudioSpool(str(tmp_path / "spool"), quota_bytes=100)
+    busy = spool.write(b'x' * 60)
+    real_remove = os.remove
+
+    def locked(path):
+        if path == busy: raise PermissionError(13, "file is in use")
+        real_remove(path)
+    monkeypatch.setattr(audio_spool.os, "remove", locked)
+    spool.release(busy)
+    assert os.path.exists(busy) and spool.used_bytes == 60
+    assert spool.get_stats()["undeleted"] == 1
+    with pytest.raises(SpoolFull):
+        spool.write(b'y' * 50)
+
+    monkeypatch.setattr(audio_spool.os, "remove", real_remove)
+    spool.write(b'y' * 50)
+    assert not os.path.exists(busy) and spool.used_bytes == 50
+    assert spool.get_stats()["undeleted"] == 0 and spool.stats["remove_failures"] == 1
+
+
+def test_cleanup_orphans_removes_files_of_dead_processes(tmp_path):
+    directory = tmp_path / "spool"
+    directory.mkdir()
+    dead = directory / "tts_99999999_3_1.wav"
+    mine = directory / f"tts_{os.getpid()}_1.wav"
+    other = directory / "other_99999999_1.wav"
+    for path in (dead, mine, other): path.write_bytes(b'x')
+    spool = AudioSpool(str(directory))
+    assert not dead.exists() and mine.exists() and other.exists()
+    assert spool.stats["orphans_removed"] == 1
+
+
+def test_cleanup_keeps_files_when_owner_cannot_be_probed(tmp_path, monkeypatch):
+    directory = tmp_path / "spool"
+    directory.mkdir()
+    old = directory / "tts_4242_1.wav"
+    old.write_bytes(b'x')
+    os.utime(old, (0, 0))
+    monkeypatch.setattr(audio_spool, "_pid_alive", lambda pid: None)
+    AudioSpool(str(directory), orphan_age=1)
+    assert old.exists()
+    monkeypatch.setattr(audio_spool, "_pid_alive", lambda pid: False)
+    AudioSpool(str(directory), orphan_age=1)
+    assert not old.exists()
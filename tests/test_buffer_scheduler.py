@@ -0,0 +1,53 @@
+import threading, time
+import pytest
+from buffer_scheduler import BufferScheduler
+
+
+def test_estimates_are_learned_from_actual_durations():
+    scheduler = BufferScheduler(target_seconds=10, low_water_seconds=4, seconds_per_char=0.2, alpha=0.5)
+    key = scheduler.submitted(text="字" * 20)
+    assert scheduler.buffered_seconds() == pytest.approx(4.0)
+    assert scheduler.demand() == (0.0, 0) and not scheduler.needs_more()
+    scheduler.ready(key, 6.0)
+    assert scheduler.seconds_per_char == pytest.approx(0.25)
+    scheduler.ready(scheduler.submitted(text="字" * 4), 5.0, learn=False)
+    assert scheduler.seconds_per_char == pytest.approx(0.25)
+    scheduler.finished(key)
+    assert scheduler.buffered_seconds() == pytest.approx(5.0) and not scheduler.needs_more()
+    scheduler.discard(("auto", 2))
+    assert scheduler.demand() == (10.0, 40)
+    stats = scheduler.get_stats()
+    assert (stats["submitted"], stats["finished"], stats["discarded"], stats["tasks"]) == (2, 1, 1, 0)
+
+
+def test_playing_clip_counts_only_its_remaining_time():
+    scheduler = BufferScheduler(target_seconds=10)
+    key = scheduler.submitted("playing", "字" * 8)
+    scheduler.ready(key, 2.0)
+    scheduler.started(key)
+    time.sleep(0.2)
+    assert 1.6 < scheduler.buffered_seconds() < 1.9
+
+
+def test_wait_for_demand_wakes_when_buffer_drains():
+    scheduler = BufferScheduler(target_seconds=4, low_water_seconds=2, seconds_per_char=0.5, poll_interval=10)
+    key = scheduler.submitted(text="字" * 8)
+    assert scheduler.wait_for_demand(timeout=0.05) == (0.0, 0)
+    threading.Timer(0.1, scheduler.finished, args=(key,)).start()
+    started = time.monotonic()
+    assert scheduler.wait_for_demand(timeout=5) == (4.0, 8)
+    assert time.monotonic() - started < 1
+
+
+def test_on_demand_is_not_repeated_until_renotify():
+    calls = []
+    scheduler = BufferScheduler(target_seconds=5, seconds_per_char=0.25, poll_interval=0.01, renotify_seconds=60,
+                                on_demand=lambda seconds, chars: calls.append((seconds, chars)))
+    try:
+        time.sleep(0.1)
+        assert calls == [(5.0, 20)]
+        scheduler.ready(scheduler.submitted(text="字" * 40), 10.0)
+        time.sleep(0.05)
+        assert calls == [(5.0, 20)] and scheduler.stats["demands"] == 1
+    finally:
+        scheduler.stop()
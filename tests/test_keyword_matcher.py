@@ -0,0 +1,62 @@
+import random
+from keyword_matcher import MultiPatternMatcher
+
+
+def brute_force(text, words_by_tag):
+    found = set()
+    for tag, words in words_by_tag.items():
+        for word in words:
+            start = text.find(word)
+            while start != -1:
+                found.add((start, start + len(word), word, tag))
+                start = text.find(word, start + 1)
+    return found
+
+
+def flatten(matches):
+    return {(m.start, m.end, m.word, tag) for m in matches for tag in m.tags}
+
+
+def test_overlapping_and_nested_matches():
+    matcher = MultiPatternMatcher()
+    matcher.update('sensitive', ["he", "she", "his", "hers"])
+    assert flatten(matcher.find_all("ushers")) == {(1, 4, "she", 'sensitive'), (2, 4, "he", 'sensitive'),
+                                                  (2, 6, "hers", 'sensitive')}
+
+
+def test_same_word_under_two_tags():
+    matcher = MultiPatternMatcher()
+    matcher.update('sensitive', ["下单"])
+    matcher.update('keyword', ["下单", "优惠"])
+    hits = matcher.find_all("现在下单有优惠")
+    assert [(m.word, m.tags) for m in hits] == [("下单", frozenset({'sensitive', 'keyword'})),
+                                                ("优惠", frozenset({'keyword'}))]
+
+
+def test_update_replaces_word_list():
+    matcher = MultiPatternMatcher()
+    matcher.update('keyword', ["库存", "优惠"])
+    assert [m.word for m in matcher.find_all("库存优惠")] == ["库存", "优惠"]
+    matcher.update('keyword', ["优惠券"])
+    assert [m.word for m in matcher.find_all("库存优惠券")] == ["优惠券"]
+    matcher.update('keyword', [])
+    assert matcher.find_all("库存优惠券") == []
+
+
+def test_matches_brute_force_on_random_text():
+    rng = random.Random(0)
+    alphabet = "abc"
+    matcher = MultiPatternMatcher()
+    for _ in range(20):
+        words = {tag: {''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(6)}
+                 for tag in ('sensitive', 'keyword')}
+        for tag, tag_words in words.items(): matcher.update(tag, tag_words)
+        text = ''.join(rng.choice(alphabet) for _ in range(60))
+        assert flatten(matcher.find_all(text)) == brute_force(text, words)
+
+
+def test_select_non_overlapping_prefers_leftmost_longest():
+    matcher = MultiPatternMatcher()
+    matcher.update('sensitive', ["ab", "abc", "bcd", "d"])
+    chosen = MultiPatternMatcher.select_non_overlapping(matcher.find_all("abcd"))
+    assert [m.word for m in chosen] == ["abc", "d"]
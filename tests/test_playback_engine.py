@@ -0,0 +1,50 @@
+import threading, time
+import pytest
+pytest.importorskip("pydub")
+from audio_pcm import PcmClip, StreamingClip
+from playback_engine import NullSink, PlaybackEngine
+
+FORMAT = (16000, 2, 1)
+
+
+def silence(seconds):
+    return PcmClip(b'\x00' * int(FORMAT[0] * seconds) * FORMAT[1], *FORMAT)
+
+
+def test_clips_play_back_to_back():
+    sink = NullSink(realtime=False)
+    engine = PlaybackEngine(sink, block_ms=40)
+    assert engine.play(silence(0.2)) and engine.play(silence(0.1))
+    assert sink.format == FORMAT
+    assert sum(size for _, size in sink.writes) == int(16000 * 0.3) * 2
+    assert engine.stats["clips"] == 2 and engine.stats["preempted"] == 0
+    assert engine.stats["max_gap"] < 0.05
+
+
+def test_preempt_stops_within_a_block():
+    engine = PlaybackEngine(NullSink(realtime=True), block_ms=20)
+    results = []
+    player = threading.Thread(target=lambda: results.append(engine.play(silence(2.0))))
+    started = time.monotonic()
+    player.start()
+    time.sleep(0.1)
+    engine.preempt()
+    player.join(1.0)
+    assert results == [False]
+    assert time.monotonic() - started < 0.5
+    assert engine.stats["preempted"] == 1 and engine.stats["clips"] == 0
+    assert engine.play(silence(0.05)) and engine.stats["clips"] == 1
+
+
+def test_preempt_wakes_a_stream_waiting_for_its_next_piece():
+    engine = PlaybackEngine(NullSink(realtime=False), stream_timeout=10.0)
+    stream = StreamingClip(silence(0.05))
+    results = []
+    player = threading.Thread(target=lambda: results.append(engine.play(stream)))
+    player.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    engine.preempt()
+    player.join(1.0)
+    assert results == [False] and time.monotonic() - started < 0.5
+    assert engine.stats["preempted"] == 1 and engine.stats["clips"] == 0
@@ -0,0 +1,49 @@
+import time
+import pytest
+pytest.importorskip("pydub")
+from reassembly_store import ReassemblyStore, DEGRADE, DROP
+
+
+def entry(priority=2, main=None):
+    return {"main": main, "assist": None, "content": "x", "priority": priority}
+
+
+def test_dict_interface_and_byte_accounting():
+    store = ReassemblyStore()
+    store[1] = entry()
+    assert 1 in store and len(store) == 1 and store.get(2) is None
+    store.set_part(1, 'main', b'x' * 100)
+    store.set_part(1, 'assist', b'y' * 50)
+    assert store.buffered_bytes == 150
+    store.set_part(1, 'main', "streamed")
+    assert store.buffered_bytes == 50
+    assert store.set_part(9, 'main', b'z') is None
+    assert store.pop(1)["assist"] == b'y' * 50
+    assert store.buffered_bytes == 0 and store.pop(1) is None
+
+
+def test_assist_timeout_degrades_and_main_timeout_drops():
+    store = ReassemblyStore(main_timeout=10, assist_timeout=2, auto_timeout=5)
+    store[1] = entry()
+    store[2] = entry()
+    store[3] = entry(priority=1)
+    store.set_part(1, 'main', b'a')
+    now = time.monotonic()
+    assert store.sweep(now) == []
+    actions = {seq: action for seq, _, action in store.sweep(now + 6)}
+    assert actions == {1: DEGRADE, 3: DROP}
+    assert 1 in store and 3 not in store
+    assert {seq: action for seq, _, action in store.sweep(now + 11)} == {1: DEGRADE, 2: DROP}
+    metrics = store.get_metrics()
+    assert metrics["stale_auto_dropped"] == 1 and metrics["expired"] == 1
+
+
+def test_over_budget_degrades_ready_entries_before_dropping_auto_tasks():
+    store = ReassemblyStore(max_bytes=100)
+    for seq, priority in ((1, 2), (2, 1), (3, 2)): store[seq] = entry(priority)
+    store.set_part(1, 'main', b'a' * 60)
+    store.set_part(2, 'assist', b'b' * 60)
+    store.set_part(3, 'assist', b'c' * 60)
+    actions = [(seq, action) for seq, _, action in store.sweep()]
+    assert actions == [(1, DEGRADE), (2, DROP)]
+    assert 2 not in store and 3 in store
@@ -0,0 +1,65 @@
+import time
+from server_pool import TTSServerPool
+from conftest import reply_for
+
+
+def quiet(*_): pass
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_request_fails_over_when_server_disconnects(tts_server):
+    def crash(server, number, request):
+        server.close()  # 断开并停止监听，重连一直失败
+        return False
+
+    broken = tts_server(crash)
+    backup = tts_server(lambda server, number, request: reply_for(request, server="backup"))
+    pool = TTSServerPool([("127.0.0.1", broken.port), ("127.0.0.1", backup.port)], quiet, log=quiet)
+    pool.start()
+    try:
+        wait_until(lambda: all(ep.healthy for ep in pool.endpoints))
+        packet = pool.submit({"request_id": 1, "text": "你好"}).result(5)
+        assert packet["server"] == "backup"
+        assert len(broken.requests) == 1 and len(backup.requests) == 1
+        assert pool.stats["failovers"] == 1 and pool.outstanding == 0
+        assert [ep.healthy for ep in pool.endpoints] == [False, True]
+    finally:
+        pool.close()
+
+
+def test_main_and_assist_parts_go_to_different_servers(tts_server):
+    servers = [tts_server(lambda server, number, request: None) for _ in range(2)]
+    pool = TTSServerPool([("127.0.0.1", server.port) for server in servers], quiet, log=quiet)
+    pool.start()
+    try:
+        wait_until(lambda: all(ep.healthy for ep in pool.endpoints))
+        pool.submit({"request_id": 5, "text": "主线"})
+        pool.submit({"request_id": 5, "text": "助播", "is_assistant": True})
+        wait_until(lambda: all(server.requests for server in servers))
+        assert [len(server.requests) for server in servers] == [1, 1]
+    finally:
+        pool.close()
+
+
+def test_request_fails_over_when_server_stops_replying(tts_server):
+    stuck = tts_server(lambda server, number, request: None)  # 连接保持，但一直不回包
+    backup = tts_server(lambda server, number, request: reply_for(request, server="backup"))
+    pool = TTSServerPool([("127.0.0.1", stuck.port), ("127.0.0.1", backup.port)], quiet, log=quiet,
+                         reply_timeout=0.3, check_interval=0.05, stall_cooldown=60)
+    pool.start()
+    try:
+        wait_until(lambda: all(ep.healthy for ep in pool.endpoints))
+        started = time.monotonic()
+        packet = pool.submit({"request_id": 1, "text": "你好"}).result(5)
+        assert packet["server"] == "backup" and time.monotonic() - started < 2
+        assert pool.stats["stalls"] == 1 and pool.stats["failovers"] == 1
+        assert pool.endpoints[0].transport.connected and not pool.endpoints[0].healthy
+        assert pool.submit({"request_id": 2, "text": "再来"}).result(5)["server"] == "backup"
+    finally:
+        pool.close()
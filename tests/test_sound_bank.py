@@ -0,0 +1,54 @@
+import os
+import pytest
+pytest.importorskip("pydub")
+from audio_pcm import PcmClip
+from sound_bank import SoundBank
+
+
+def write_tone(path, frames, sample_rate=16000):
+    PcmClip(b'\x10\x00' * frames, sample_rate, 2, 1).write_wav(str(path))
+
+
+def quiet(*_): pass
+
+
+@pytest.fixture
+def library(tmp_path):
+    write_tone(tmp_path / "cough.wav", 1600)
+    write_tone(tmp_path / "sigh.wav", 800)
+    return {"[咳嗽]": "cough.wav", "[叹气]": ["sigh.wav"], "[呼吸]": "missing.wav"}
+
+
+def test_split_markers(tmp_path, library):
+    bank = SoundBank(str(tmp_path), library, log=quiet)
+    assert bank.split_markers("没有音效。") == [("没有音效。", [], [])]
+    assert bank.split_markers("[咳嗽]你好[叹气]，今天[呼吸]") == [
+        ("你好", ["[咳嗽]"], ["[叹气]"]), ("，今天", [], ["[呼吸]"])]
+    assert bank.split_markers("[咳嗽][叹气]") == [(None, ["[咳嗽]", "[叹气]"], [])]
+
+
+def test_clips_are_preloaded_and_converted_once(tmp_path, library):
+    logs = []
+    bank = SoundBank(str(tmp_path), library, output_format=(8000, 2, 1), log=logs.append)
+    assert bank.get("[呼吸]") is None and len(logs) == 1
+    clip = bank.get("[咳嗽]")
+    assert clip.format == (8000, 2, 1) and bank.get("[咳嗽]") is clip
+    assert bank.get("[咳嗽]", (16000, 2, 1)).duration == pytest.approx(0.1)
+    assert bank.path("[叹气]") == os.path.join(str(tmp_path), "sigh.wav")
+    assert bank.get_stats()["sounds"] == 2
+
+
+def test_reload_picks_up_changed_and_new_files(tmp_path, library):
+    bank = SoundBank(str(tmp_path), library, log=quiet)
+    assert bank.reload() == 0
+    write_tone(tmp_path / "cough.wav", 3200)
+    mtime = os.path.getmtime(tmp_path / "cough.wav") + 5
+    os.utime(tmp_path / "cough.wav", (mtime, mtime))
+    write_tone(tmp_path / "missing.wav", 400)
+    library["[清嗓]"] = "cough.wav"
+    del library["[叹气]"]
+    assert bank.reload() == 2
+    assert bank.get("[咳嗽]").duration == pytest.approx(0.2)
+    assert bank.get("[呼吸]") is not None and bank.get("[叹气]") is None
+    assert bank.split_markers("[清嗓]好") == [("好", ["[清嗓]"], [])]
+    assert bank.stats["reloads"] == 1 and bank.get_stats()["sounds"] == 2
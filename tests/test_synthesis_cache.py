@@ -0,0 +1,42 @@
+import os
+from synthesis_cache import SynthesisCache
+
+
+def test_key_ignores_whitespace_and_width():
+    assert SynthesisCache.make_key("你好 世界！", "main") == SynthesisCache.make_key("你好世界!", "main")
+    assert SynthesisCache.make_key("你好", "main") != SynthesisCache.make_key("你好", "assist")
+    assert SynthesisCache.make_key("你好", "main", params={"speed": 1}) != SynthesisCache.make_key("你好", "main")
+
+
+def test_memory_lru_evicts_by_bytes():
+    cache = SynthesisCache(memory_budget=30)
+    cache.put("a", b'x' * 10)
+    cache.put("b", b'y' * 10)
+    cache.put("c", b'z' * 10)
+    assert cache.get("a") == b'x' * 10  # a 变为最近使用
+    cache.put("d", b'w' * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c") and cache.get("d")
+    cache.put("big", b'!' * 31)
+    assert cache.get("big") is None
+    stats = cache.get_stats()
+    assert stats["memory_bytes"] == 30 and stats["memory_entries"] == 3
+    assert stats["evictions"] == 1 and stats["misses"] == 2
+
+
+def test_disk_tier_survives_restart_and_evicts_oldest(tmp_path):
+    cache = SynthesisCache(str(tmp_path), memory_budget=1024, disk_budget=25)
+    cache.put("a", b'1' * 10)
+    cache.put("b", b'2' * 10)
+    cache.put("c", b'3' * 10)
+    assert not os.path.exists(tmp_path / "a.wav")
+    (tmp_path / "x.1.tmp").write_bytes(b'partial')
+
+    restarted = SynthesisCache(str(tmp_path), memory_budget=1024, disk_budget=25)
+    assert not os.path.exists(tmp_path / "x.1.tmp")
+    assert restarted.get("a") is None
+    assert restarted.get("b") == b'2' * 10
+    assert restarted.get("b") == b'2' * 10
+    stats = restarted.get_stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+    assert stats["disk_entries"] == 2 and stats["disk_bytes"] == 20
@@ -0,0 +1,58 @@
+from text_segmenter import TextSegmenter
+
+
+def joined(segments):
+    return ''.join(segments).replace(" ", "")
+
+
+def test_short_text_is_one_segment():
+    assert TextSegmenter().split("大家好。") == ["大家好。"]
+    assert TextSegmenter().split("   ") == []
+
+
+def test_first_segment_is_short_and_text_is_preserved():
+    text = "第一句话比较长，后面还有很多内容要说。第二句话也不短，同样需要合成。第三句话在这里结束！"
+    seg = TextSegmenter(first_max_chars=12, max_chars=40)
+    segments = seg.split(text)
+    assert len(segments[0]) <= 12
+    assert all(len(s) <= 40 for s in segments)
+    assert all(s.strip() for s in segments)
+    assert joined(segments) == joined([text])
+    assert len(seg.split(text, short_first=False)[0]) > 12
+
+
+def test_numbers_are_not_split():
+    segments = TextSegmenter(first_max_chars=8, max_chars=20).split("价格只要9.9元，时间是10:30，数量1,000件。")
+    assert not any(s.endswith(("9.", "10:", "1,")) for s in segments)
+
+
+def test_english_sentences_keep_spaces():
+    text = "Hello there. This is a test. And one more line here."
+    segments = TextSegmenter(first_max_chars=20, max_chars=30).split(text, short_first=False)
+    assert segments == ["Hello there. This is a test.", "And one more line here."]
+
+
+def test_long_clause_is_hard_cut():
+    segments = TextSegmenter(first_max_chars=10, max_chars=20).split("字" * 55)
+    assert all(len(s) <= 20 for s in segments)
+    assert ''.join(segments) == "字" * 55
+
+
+def test_first_max_is_clamped_to_max_chars():
+    seg = TextSegmenter(first_max_chars=200, max_chars=30)
+    assert seg.first_max_chars == 30
+    assert all(len(s) <= 30 for s in seg.split("很长的一句话，" * 20))
+
+
+def test_stream_matches_text_and_emits_early():
+    text = "欢迎来到直播间，今天给大家带来一款好物。它的价格非常实惠，库存也不多了。赶紧下单吧！"
+    stream = TextSegmenter(first_max_chars=10, max_chars=40).stream()
+    segments, first_at = [], None
+    for i in range(0, len(text), 3):
+        out = stream.feed(text[i:i + 3])
+        if out and first_at is None: first_at = i + 3
+        segments.extend(out)
+    segments.extend(stream.flush())
+    assert first_at is not None and first_at <= 12
+    assert all(s.strip() for s in segments)
+    assert joined(segments) == joined([text])
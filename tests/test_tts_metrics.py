@@ -0,0 +1,21 @@
+import json
+from tts_metrics import PipelineMetrics
+
+
+def test_prometheus_separates_counters_and_gauges():
+    metrics = PipelineMetrics()
+    metrics.mark(1, "accepted", priority=2)
+    metrics.mark(1, "playback_finished")
+    text = metrics.to_prometheus(extra_counters={"cache_hits": 3}, extra_gauges={"spool_used_bytes": 512})
+    lines = text.splitlines()
+    assert "# TYPE tts_client_tasks_completed_total counter" in lines and "tts_client_tasks_completed_total 1" in lines
+    assert "# TYPE tts_client_cache_hits_total counter" in lines and "tts_client_cache_hits_total 3" in lines
+    assert "# TYPE tts_client_spool_used_bytes gauge" in lines and "tts_client_spool_used_bytes 512" in lines
+    assert not any(line.startswith("tts_client_spool_used_bytes_total") for line in lines)
+    assert 'tts_client_stage_latency_seconds_count{stage="playback_finished",priority="2"} 1' in lines
+
+
+def test_json_export_keeps_gauges_apart():
+    snap = json.loads(PipelineMetrics().to_json({"cache_hits": 1}, {"reassembly_entries": 4}))
+    assert snap["counters"]["cache_hits"] == 1 and snap["gauges"] == {"reassembly_entries": 4}
+    assert "reassembly_entries" not in snap["counters"]
@@ -0,0 +1,61 @@
+import base64, json, socket
+import tts_protocol
+
+
+def roundtrip(*messages):
+    a, b = socket.socketpair()
+    try:
+        a.sendall(b''.join(messages))
+        a.close()
+        packets = []
+        while True:
+            packet = tts_protocol.recv_msg(b)
+            if packet is None: return packets
+            packets.append(packet)
+    finally:
+        b.close()
+
+
+def binary_frame(request_id, audio, **kwargs):
+    return tts_protocol.pack_frame_header(request_id, len(audio), **kwargs) + audio
+
+
+def test_binary_frame_roundtrip():
+    packet, = roundtrip(binary_frame(7, b'RIFFdata', is_assistant=True, codec=tts_protocol.CODEC_FLAC))
+    assert packet == {"request_id": 7, "is_assistant": True, "status": "success", "codec": "flac", "audio_data": b'RIFFdata'}
+    assert not tts_protocol.is_partial_chunk(packet)
+
+
+def test_error_frame_without_audio():
+    packet, = roundtrip(binary_frame(3, b'', status=tts_protocol.STATUS_ERROR))
+    assert packet["status"] == "error" and packet["audio_data"] == b''
+
+
+def test_chunked_frames_carry_index_and_end_flag():
+    first, last = roundtrip(binary_frame(5, b'aa', chunk_index=0, end_of_stream=False),
+                            binary_frame(5, b'bb', chunk_index=1, end_of_stream=True))
+    assert (first["chunk_index"], first["end_of_stream"]) == (0, False)
+    assert (last["chunk_index"], last["end_of_stream"]) == (1, True)
+    assert tts_protocol.is_partial_chunk(first) and tts_protocol.is_partial_chunk(last)
+    single, = roundtrip(binary_frame(5, b'cc', chunk_index=0, end_of_stream=True))
+    assert not tts_protocol.is_partial_chunk(single)
+
+
+def test_json_packet_is_decoded_and_mixes_with_binary():
+    payload = {"request_id": 9, "is_assistant": False, "status": "success", "audio_data": base64.b64encode(b'wav').decode()}
+    json_packet, binary_packet = roundtrip(tts_protocol.frame_msg(json.dumps(payload).encode()), binary_frame(10, b'raw'))
+    assert json_packet["audio_data"] == b'wav' and json_packet["request_id"] == 9
+    assert binary_packet["audio_data"] == b'raw'
+
+
+def test_control_messages():
+    cancel, hello, ack = roundtrip(*(tts_protocol.frame_msg(m) for m in (
+        tts_protocol.cancel_msg(4), tts_protocol.hello_msg(["flac", "wav"]), tts_protocol.hello_ack_msg("flac"))))
+    assert cancel == {"type": tts_protocol.MSG_CANCEL, "cancel_id": 4}
+    assert "request_id" not in cancel
+    assert hello["codecs"] == ["flac", "wav"] and ack["codec"] == "flac"
+
+
+def test_truncated_message_returns_none():
+    frame = binary_frame(1, b'abcdef')
+    assert roundtrip(frame[:-2]) == []
@@ -0,0 +1,33 @@
+import threading
+import pytest
+from worker_pool import BoundedExecutor, PoolRejected
+
+
+def test_rejects_when_workers_and_queue_are_full():
+    pool = BoundedExecutor(max_workers=1, max_queue=1)
+    gate = threading.Event()
+    try:
+        running = pool.submit(gate.wait)
+        queued = pool.submit(lambda: "done")
+        with pytest.raises(PoolRejected):
+            pool.submit(lambda: None)
+        with pytest.raises(PoolRejected):
+            pool.submit(lambda: None, block=True, timeout=0.05)
+        assert pool.stats["rejected"] == 2
+        gate.set()
+        assert running.result(1) and queued.result(1) == "done"
+        assert pool.submit(lambda: 42, block=True, timeout=1).result(1) == 42
+    finally:
+        gate.set()
+        pool.shutdown()
+    assert pool.stats == {"submitted": 3, "rejected": 2, "completed": 3}
+
+
+def test_failed_task_releases_its_slot():
+    pool = BoundedExecutor(max_workers=1, max_queue=0)
+    try:
+        with pytest.raises(ZeroDivisionError):
+            pool.submit(lambda: 1 / 0).result(1)
+        assert pool.submit(lambda: "ok", block=True, timeout=1).result(1) == "ok"
+    finally:
+        pool.shutdown()
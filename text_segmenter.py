@@ -0,0 +1,159 @@
+# text_segmenter.py
+# 两个生成器共用的分句：按中英文句末标点分句，过长的句子再按逗号等分句点切开，保留原标点。
+# - 首段刻意取短（一个分句左右），尽快开始播放；之后的段落把整句合并到 max_chars，减少合成请求数。
+# - stream() 用于流式到达的AI文本：每闭合一句就输出，不等整段回复结束。
+# 数字之间的 '.' ',' ':'（如 9.9、1,000、10:30）不当作分句点。
+
+SENTENCE_ENDS = "。！？.!?；;…~～\n"
+CLAUSE_ENDS = "，,、：:"
+CLOSERS = "”’\"'）)】」』》"
+_NUMERIC_SEPARATORS = ".,:"
+
+
+def _is_break(text, i, marks):
+    """text[i] 是否为 marks 中的分句点；ASCII 的 . , : 夹在两个数字之间时不算"""
+    ch = text[i]
+    if ch not in marks: return False
+    if ch in _NUMERIC_SEPARATORS and 0 < i < len(text) - 1 and text[i - 1].isdigit() and text[i + 1].isdigit():
+        return False
+    return True
+
+
+def _boundaries(text, marks, final=True):
+    """返回各分句点之后的位置（连续的标点和后引号、括号算作同一个分句点）。
+    final=False 时文本可能还没到齐，末尾的分句点要等后面再来字符才算闭合"""
+    ends = []
+    i, n = 0, len(text)
+    while i < n:
+        if _is_break(text, i, marks):
+            j = i + 1
+            while j < n and (text[j] in CLOSERS or _is_break(text, j, marks)): j += 1
+            if j < n or final: ends.append(j)
+            i = j
+        else:
+            i += 1
+    return ends
+
+
+class TextSegmenter:
+    def __init__(self, first_max_chars=20, max_chars=100, min_chars=4):
+        self.first_max_chars = min(first_max_chars, max_chars)  # 首段的长度上限（字）
+        self.max_chars = max_chars  # 其余各段的长度上限
+        self.min_chars = min_chars  # 短于此的句子与后一句合并，不单独成段
+
+    def split(self, text, short_first=True):
+        """把整段文本切成合成用的段落；short_first=True 时首段取短以降低首音延迟。不会产生空段"""
+        text = text.strip()
+        if not text: return []
+        if len(text) <= (self.first_max_chars if short_first else self.max_chars): return [text]
+        sentences = self._sentences(text, final=True)[0]
+        segments = []
+        if short_first:
+            cut = self._head_cut(sentences[0].strip())
+            head, rest = sentences[0].strip()[:cut], sentences[0].strip()[cut:]
+            segments.append(head.strip())
+            sentences[0:1] = [rest] if rest.strip() else []
+        current = ""
+        for sentence in sentences:
+            for piece in self._fit(sentence, self.max_chars):
+                if current and len(current.strip()) + len(piece.strip()) > self.max_chars:
+                    segments.append(current.strip())
+                    current = ""
+                current += piece
+        current = current.strip()
+        if current:
+            # 末尾零碎的一小段并入前一段
+            if segments and len(current) < self.min_chars and len(segments[-1]) + len(current) <= self.max_chars + self.min_chars:
+                segments[-1] += current
+            else:
+                segments.append(current)
+        return segments
+
+    def stream(self, short_first=True):
+        """返回增量分句器：feed(新到的文本) 返回已闭合的段落，flush() 返回剩余部分"""
+        return StreamSegmenter(self, short_first)
+
+    def _sentences(self, text, final):
+        """切出完整的句子（短于 min_chars 的与后一句合并），返回 (句子列表, 未闭合的剩余文本)。
+        句子保留原有的空白，英文句子合并成一段时不会粘在一起"""
+        sentences, start = [], 0
+        for end in _boundaries(text, SENTENCE_ENDS, final):
+            if len(text[start:end].strip()) < self.min_chars and (end < len(text) or not final): continue
+            if text[start:end].strip(): sentences.append(text[start:end])
+            start = end
+        rest = text[start:]
+        if final and rest.strip():
+            sentences.append(rest)
+            rest = ""
+        return sentences, rest
+
+    def _head_cut(self, sentence):
+        """首段的切点：优先取不超过 first_max_chars 的最长分句，没有时取第一个不超过 max_chars 的分句，
+        都没有时在 first_max_chars 处硬切"""
+        if len(sentence) <= self.first_max_chars: return len(sentence)
+        cuts = [end for end in _boundaries(sentence, CLAUSE_ENDS) if self.min_chars <= end < len(sentence)]
+        short = [end for end in cuts if end <= self.first_max_chars]
+        if short: return short[-1]
+        if cuts and cuts[0] <= self.max_chars: return cuts[0]
+        return self.first_max_chars
+
+    def _fit(self, sentence, limit):
+        """超过 limit 的句子按分句点切开，分句也过长时按 limit 硬切"""
+        if len(sentence.strip()) <= limit: return [sentence]
+        pieces, start = [], 0
+        for end in _boundaries(sentence, CLAUSE_ENDS) + [len(sentence)]:
+            while end - start > limit:
+                pieces.append(sentence[start:start + limit])
+                start += limit
+            if pieces and start < end and len(pieces[-1]) + end - start <= limit:
+                pieces[-1] += sentence[start:end]
+            elif start < end:
+                pieces.append(sentence[start:end])
+            start = end
+        return [piece for piece in pieces if piece.strip()]
+
+
+class StreamSegmenter:
+    """流式AI文本的增量分句：首段遇到合适的分句点就输出，之后每闭合一句输出一句"""
+    def __init__(self, segmenter, short_first=True):
+        self.segmenter = segmenter
+        self._buffer = ""
+        self._first = short_first
+
+    def feed(self, text):
+        self._buffer += text
+        segments = []
+        if self._first:
+            head = self._take_head()
+            if head is None: return segments
+            segments.append(head)
+        sentences, self._buffer = self.segmenter._sentences(self._buffer, final=False)
+        for sentence in sentences:
+            segments.extend(piece.strip() for piece in self.segmenter._fit(sentence.strip(), self.segmenter.max_chars))
+        if len(self._buffer) > self.segmenter.max_chars:
+            # 迟迟不出现句末标点：在最后一个分句点处先切出一段
+            cuts = [end for end in _boundaries(self._buffer, CLAUSE_ENDS, final=False) if end <= self.segmenter.max_chars]
+            cut = cuts[-1] if cuts else self.segmenter.max_chars
+            piece, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+            if piece: segments.append(piece)
+        return segments
+
+    def flush(self):
+        """AI回复结束：输出剩下的文本"""
+        text, self._buffer = self._buffer, ""
+        segments = self.segmenter.split(text, short_first=self._first)
+        self._first = False
+        return segments
+
+    def _take_head(self):
+        """首段：缓冲中出现第一个不早于 min_chars 的句末或分句点就输出；
+        超过 first_max_chars 仍没有时按 TextSegmenter 首段的规则切"""
+        seg = self.segmenter
+        text = self._buffer.lstrip()
+        cuts = [end for end in _boundaries(text, SENTENCE_ENDS + CLAUSE_ENDS, final=False) if end >= seg.min_chars]
+        if cuts and cuts[0] <= seg.first_max_chars: cut = cuts[0]
+        elif len(text) > seg.first_max_chars: cut = seg._head_cut(text)
+        else: return None
+        self._first = False
+        head, self._buffer = text[:cut].strip(), text[cut:]
+        return head or None
@@ -1,22 +1,89 @@
 import time
 import os
-import shutil
 import threading
 import queue
+import logging
 from collections import deque
 from pydub import AudioSegment
 from pydub.playback import play
+from pydub.silence import detect_silence
 from gradio_client import Client, handle_file
 from concurrent.futures import ThreadPoolExecutor
+from playback_engine import PlaybackEngine, create_default_sink
+from audio_pcm import PcmClip
+from synthesis_cache import SynthesisCache
+from tts_logging import get_logger
+from voice_profiles import VoiceProfile, PreparedVoices
+from audio_spool import AudioSpool, SpoolFull
+from buffer_scheduler import BufferScheduler
+from text_segmenter import TextSegmenter
+
+class _OrderedRelease:
+    """并发合成的分块按原顺序放入播放队列：先完成的分块等待前面的分块，失败的分块(None)跳过。
+    tickets 为各分块在 BufferScheduler 中的登记；released 记录已给出结果的分块，同一分块只按第一次结果处理"""
+    def __init__(self, generator, priority, tickets):
+        self.generator = generator
+        self.priority = priority
+        self.tickets = tickets
+        self._results = {}
+        self._next = 0
+        self.released = set()
+        self._lock = threading.Lock()
+
+    def done(self, index, audio):
+        with self._lock:
+            if index in self.released: return
+            self.released.add(index)
+            self._results[index] = audio
+            while self._next in self._results:
+                audio = self._results.pop(self._next)
+                ticket = self.tickets[self._next]
+                self._next += 1
+                if audio is not None: self.generator._enqueue(self.priority, audio, ticket)
+                else: self.generator.scheduler.discard(ticket)
+
 
 class TTSGenerator:
-    def __init__(self, client_url, ref_audio_path, output_dir):
-        self.client = Client(client_url)
+    def __init__(self, client_url, ref_audio_path, output_dir, playback_sink=None, synthesis_cache=None, cache_dir=None,
+                 voices=None, default_voice="default", chunk_parallelism=3, batch_short_texts=False,
+                 batch_max_chars=120, batch_window=0.3, spool=None, spool_ram=False, spool_quota=256 * 1024 * 1024,
+                 scheduler=None, buffer_target_seconds=20.0, on_script_demand=None, segmenter=None,
+                 first_segment_chars=30, segment_max_chars=200, log_level=logging.INFO):
+        self.logger = get_logger("TTSGenerator", log_level)
         self.ref_audio_path = ref_audio_path
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
+        # 合成结果的落盘目录：唯一文件名、原子移动、配额；spool_ram=True 时放在内存盘上
+        self.spool = spool or AudioSpool(None if spool_ram else output_dir, quota_bytes=spool_quota, ram=spool_ram,
+                                         prefix="gen")
         self.number = 0
         self.seq = 0  # 新增全局序号
+        self._seq_lock = threading.Lock()
+        # 按缓冲的音频秒数做背压；_tickets 记录播放队列中每个 seq 对应的登记
+        self.scheduler = scheduler or BufferScheduler(buffer_target_seconds, on_demand=on_script_demand, log=self.logger.warning)
+        self._tickets = {}
+        # 低优先级文本的分句：缓冲为空时首段取短，尽快开始播放；其余各段按整句合并到 segment_max_chars
+        self.segmenter = segmenter or TextSegmenter(first_segment_chars, segment_max_chars)
+
+        # 除文本和参考音频外的固定合成参数，同时作为缓存键的一部分
+        self.predict_params = dict(
+            prompt_text="十分钟温水冲泡三秒之内喝掉啊，饱腹感达到四到六个小时的啊",
+            prompt_language="中文",
+            text_language="中文",
+            how_to_cut="凑四句一切",
+            top_k=15,
+            top_p=1,
+            temperature=1,
+            ref_free=False,
+            speed=0.85,
+            if_freeze=False,
+            inp_refs=None,
+            sample_steps=8,
+            if_sr=False,
+            pause_second=0.3,
+        )
+        # 合成结果缓存，可与 TTSClientGenerator 共享同一实例
+        self.synthesis_cache = synthesis_cache or SynthesisCache(cache_dir)
 
         # 音频任务队列和播放记录
         self.audio_queue = queue.PriorityQueue()
@@ -27,143 +94,279 @@ class TTSGenerator:
         # 锁机制确保音频播放同步
         self.play_lock = threading.Lock()
 
+        # 常驻播放引擎，没有可用的声卡输出端时回退到 pydub.playback
+        sink = playback_sink or create_default_sink()
+        self.playback_engine = PlaybackEngine(sink) if sink else None
+
         # 删除原来的统一线程池，添加两个专用线程池
         self.executor_high = ThreadPoolExecutor(max_workers=5)
         self.executor_low = ThreadPoolExecutor(max_workers=5)
+        # 长文本的分块并发合成，并发数有上限，结果按原顺序入队
+        self.executor_chunks = ThreadPoolExecutor(max_workers=chunk_parallelism)
+
+        # 短文本合并：窗口内积累的多条低优先级短文本合成一次，再按句间停顿切回每句
+        self.batch_short_texts = batch_short_texts
+        self.batch_max_chars = batch_max_chars
+        self.batch_window = batch_window
+        self._batch_pending = []  # [(text, voice, ticket)]
+        self._batch_cond = threading.Condition()
+        if batch_short_texts:
+            threading.Thread(target=self._batch_worker, daemon=True, name="TTSBatcher").start()
+
+        # 已准备的声音：按名字选择参考音频和参数；Client 会话池与所有合成线程的总数相同
+        self.voices = PreparedVoices(client_url, Client, handle_file, pool_size=10 + chunk_parallelism,
+                                     log=self.logger.warning)
+        self.default_voice = default_voice
+        self.voices.add_voice(VoiceProfile("default", ref_audio_path), preload=default_voice == "default")
+        for voice in voices or ():
+            self.voices.add_voice(voice)
 
         # 启动播放线程
         self.play_audio_thread = threading.Thread(target=self.play_audio_worker, daemon=True)
         self.play_audio_thread.start()
 
-    def generate_audio(self, text, priority):
-        # 当为优先级2且文本较长时，拆分文本后顺序生成音频
-        if priority == 2 and len(text) > 200:
-            sentences = text.split("。")
-            chunks = []
-            current = ""
-            for sentence in sentences:
-                if sentence.strip() == "":
-                    continue
-                if len(current) + len(sentence) < 200:
-                    current += sentence + "。"
-                else:
-                    if current:
-                        chunks.append(current)
-                    current = sentence + "。"
-            if current:
-                chunks.append(current)
-            def task():
-                for chunk in chunks:
-                    self.number = self.number + 1
-                    try:
-                        result = self.client.predict(
-                            ref_wav_path=handle_file(self.ref_audio_path),
-                            prompt_text="十分钟温水冲泡三秒之内喝掉啊，饱腹感达到四到六个小时的啊",
-                            prompt_language="中文",
-                            text=chunk,
-                            text_language="中文",
-                            how_to_cut="凑四句一切",
-                            top_k=15,
-                            top_p=1,
-                            temperature=1,
-                            ref_free=False,
-                            speed=0.85,
-                            if_freeze=False,
-                            inp_refs=None,
-                            sample_steps=8,
-                            if_sr=False,
-                            pause_second=0.3,
-                            api_name="/get_tts_wav"
-                        )
-                        if not result:
-                            print("❌ 语音合成失败: API 未返回有效数据")
-                            continue
-                        output_audio_path = result
-                        timestamp = int(time.time())
-                        new_audio_path = os.path.join(self.output_dir, f"audio_{timestamp}.wav")
-                        
-                        # ...复制文件并删除临时文件...
-                        shutil.copy2(output_audio_path, new_audio_path)
-                        os.remove(output_audio_path)
-                        print(f"✅ 语音合成完成: {new_audio_path}")
-                        print(f"这是优先级{priority}的音频文件")
-                        # 提交任务到全局队列 (2代表低优先级)
-                        self.seq += 1
-                        self.play_queue.put((2, self.seq, new_audio_path))
-                    except Exception as e:
-                        print(f"❌ 语音合成出错: {e}")
-            self.executor_low.submit(task)
+    @property
+    def client(self):
+        """兼容直接使用 generator.client 调用 gradio 接口的代码；合成本身使用 voices 的会话池"""
+        return self.voices.shared_client()
+
+    def add_voice(self, name, ref_audio_path, prompt_text=None, prompt_language=None, preload=True, **params):
+        """注册一个可按任务选择的声音（参考音频 + 提示文本），preload=True 时立即建立会话"""
+        return self.voices.add_voice(VoiceProfile(name, ref_audio_path, prompt_text, prompt_language, **params), preload)
+
+    def _predict(self, client, voice, text, params):
+        return client.predict(ref_wav_path=self.voices.ref_handle(voice), text=text, api_name="/get_tts_wav", **params)
+
+    def _synthesize(self, text, voice=None, tag=None, **overrides):
+        """合成一段文本，返回可放入播放队列的音频（缓存命中时为PcmClip，否则为文件路径），失败返回None。
+        tag 为调度器分配的任务序号，用作 spool 文件名的一部分"""
+        voice = self.voices.get(voice or self.default_voice)
+        params = dict(voice.predict_params(self.predict_params), **overrides)
+        cache_key = self.synthesis_cache.make_key(text, "main", voice.ref_audio_path, params)
+        cached = self.synthesis_cache.get(cache_key)
+        if cached is not None:
+            self.logger.debug("♻️ 命中合成缓存: %s", text[:20])
+            return PcmClip.from_bytes(cached)
+
+        with self.voices.session() as client:
+            result = self._predict(client, voice, text, params)
+        if not result:
+            self.logger.warning("❌ 语音合成失败: API 未返回有效数据")
+            return None
+        try:
+            # 与 gradio 临时目录在同一文件系统时直接改名，不复制数据
+            new_audio_path = self.spool.adopt(result, tag)
+        except SpoolFull as e:
+            self.logger.warning("⚠️ %s，本段音频只保存在内存中", e)
+            return self._load_and_remove(result)
+        with open(new_audio_path, 'rb') as f:
+            self.synthesis_cache.put(cache_key, f.read())
+        self.logger.info("✅ 语音合成完成: %s", new_audio_path)
+        return new_audio_path
+
+    def _enqueue(self, priority, audio, ticket):
+        self.scheduler.ready(ticket, self._duration(audio))
+        with self._seq_lock:
+            self.seq += 1
+            self._tickets[self.seq] = ticket
+            self.play_queue.put((priority, self.seq, audio))
+
+    def _duration(self, audio):
+        if isinstance(audio, PcmClip): return audio.duration
+        with self.spool.open_clip(audio) as clip: return clip.duration
+
+    def _split_long_text(self, text):
+        return self.segmenter.split(text, short_first=self.scheduler.buffered_seconds() <= 0)
+
+    def _synthesize_chunk(self, chunk, voice, release, index):
+        self.number = self.number + 1
+        audio = None
+        try:
+            audio = self._synthesize(chunk, voice, release.tickets[index][1])
+            if audio is not None: self.logger.debug("这是优先级%s的音频文件", release.priority)
+        except Exception as e:
+            self.logger.warning("❌ 语音合成出错: %s", e)
+        finally:
+            release.done(index, audio)
+
+    def generate_audio(self, text, priority, voice=None):
+        # 优先级2的文本按分句拆成多段时，并发生成各分块，按原顺序入队 (2代表低优先级)
+        chunks = self._split_long_text(text) if priority == 2 else [text]
+        if not chunks: return
+        if len(chunks) > 1:
+            release = _OrderedRelease(self, 2, [self.scheduler.submitted(text=chunk) for chunk in chunks])
+            for index, chunk in enumerate(chunks):
+                self.executor_chunks.submit(self._synthesize_chunk, chunk, voice, release, index)
+        elif priority == 2 and self.batch_short_texts and len(text) <= self.batch_max_chars:
+            self.number = self.number + 1
+            with self._batch_cond:
+                self._batch_pending.append((text, voice, self.scheduler.submitted(text=text)))
+                self._batch_cond.notify()
         else:
             self.number = self.number + 1
+            ticket = self.scheduler.submitted(text=text)
             def task():
                 try:
-                    result = self.client.predict(
-                        ref_wav_path=handle_file(self.ref_audio_path),
-                        prompt_text="十分钟温水冲泡三秒之内喝掉啊，饱腹感达到四到六个小时的啊",
-                        prompt_language="中文",
-                        text=text,
-                        text_language="中文",
-                        how_to_cut="凑四句一切",
-                        top_k=15,
-                        top_p=1,
-                        temperature=1,
-                        ref_free=False,
-                        speed=0.85,
-                        if_freeze=False,
-                        inp_refs=None,
-                        sample_steps=8,
-                        if_sr=False,
-                        pause_second=0.3,
-                        api_name="/get_tts_wav"
-                    )
-                    if not result:
-                        print("❌ 语音合成失败: API 未返回有效数据")
+                    audio = self._synthesize(text, voice, ticket[1])
+                    if audio is None:
+                        self.scheduler.discard(ticket)
                         return
-                    output_audio_path = result
-                    timestamp = int(time.time())
-                    new_audio_path = os.path.join(self.output_dir, f"audio_{timestamp}.wav")
-                    
-                    # ...复制文件并删除临时文件...
-                    shutil.copy2(output_audio_path, new_audio_path)
-                    os.remove(output_audio_path)
-                    print(f"✅ 语音合成完成: {new_audio_path}")
-                    print(f"这是优先级{priority}的音频文件")
-                    self.seq += 1
-                    if priority == 1:
-                        self.play_queue.put((1, self.seq, new_audio_path))
-                    else:
-                        self.play_queue.put((2, self.seq, new_audio_path))
+                    self.logger.debug("这是优先级%s的音频文件", priority)
+                    self._enqueue(1 if priority == 1 else 2, audio, ticket)
                 except Exception as e:
-                    print(f"❌ 语音合成出错: {e}")
+                    self.scheduler.discard(ticket)
+                    self.logger.warning("❌ 语音合成出错: %s", e)
             if priority == 1:
                 self.executor_high.submit(task)
             else:
                 self.executor_low.submit(task)
 
+    def _batch_worker(self):
+        """等第一条短文本到达后再等待 batch_window 秒（或攒够 batch_max_chars 字），把同一声音的连续短文本合成一次"""
+        while True:
+            with self._batch_cond:
+                self._batch_cond.wait_for(lambda: self._batch_pending)
+                deadline = time.monotonic() + self.batch_window
+                while sum(len(item[0]) for item in self._batch_pending) < self.batch_max_chars:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: break
+                    self._batch_cond.wait(remaining)
+                batch, size = [], 0
+                for item in self._batch_pending:
+                    text, voice, _ = item
+                    if batch and (voice != batch[0][1] or size + len(text) > self.batch_max_chars): break
+                    batch.append(item); size += len(text)
+                del self._batch_pending[:len(batch)]
+            self.executor_low.submit(self._synthesize_batch, batch)
+
+    def _synthesize_batch(self, batch):
+        voice = batch[0][1]
+        release = _OrderedRelease(self, 2, [ticket for _, _, ticket in batch])
+        try:
+            # 命中缓存的句子直接使用，其余合并为一次请求
+            todo = []
+            for index, (text, _, _) in enumerate(batch):
+                audio = self._cached_clip(text, voice) if len(batch) > 1 else None
+                if audio is not None: release.done(index, audio)
+                else: todo.append(index)
+            if not todo: return
+            if len(todo) == 1:
+                release.done(todo[0], self._synthesize(batch[todo[0]][0], voice, batch[todo[0]][2][1])); return
+
+            texts = [batch[i][0] for i in todo]
+            # 每句按中文句号切开合成，句间插入 pause_second 秒静音，之后按这些静音切回
+            joined = "".join(t if t.endswith("。") else t + "。" for t in texts)
+            audio = self._synthesize(joined, voice, batch[todo[0]][2][1], how_to_cut="按中文句号。切")
+            if audio is None:
+                for index in todo: release.done(index, None)
+                return
+            clip = audio if isinstance(audio, PcmClip) else self._load_and_remove(audio)
+            pieces = self._split_on_pauses(clip, [len([s for s in t.split("。") if s.strip()]) for t in texts])
+            if pieces is None:
+                # 找不到足够的句间停顿时整段作为一条播放
+                self.logger.debug("合并合成的音频无法按停顿切分，整段播放")
+                pieces = [clip] + [None] * (len(todo) - 1)
+            else:
+                params = self.voices.get(voice or self.default_voice).predict_params(self.predict_params)
+                for text, piece in zip(texts, pieces):
+                    self.synthesis_cache.put(self._cache_key(text, voice, params), piece.to_wav_bytes())
+            for index, piece in zip(todo, pieces): release.done(index, piece)
+        except Exception as e:
+            self.logger.warning("❌ 合并合成出错: %s", e)
+            for index in range(len(batch)):
+                if index not in release.released: release.done(index, None)
+
+    def _cache_key(self, text, voice, params):
+        return self.synthesis_cache.make_key(text, "main", self.voices.get(voice or self.default_voice).ref_audio_path, params)
+
+    def _cached_clip(self, text, voice):
+        params = self.voices.get(voice or self.default_voice).predict_params(self.predict_params)
+        cached = self.synthesis_cache.get(self._cache_key(text, voice, params))
+        return PcmClip.from_bytes(cached) if cached is not None else None
+
+    def _load_and_remove(self, path):
+        clip = PcmClip.from_file(path)
+        if self.spool.owns(path): self.spool.release(path)
+        else: os.remove(path)
+        return clip
+
+    def _split_on_pauses(self, clip, segment_counts):
+        """按句间停顿把合并合成的音频切回每条文本。取最长的 N-1 段静音作为分句点（N为总分句数），
+        再按每条文本的分句数归组；静音段不足时返回None"""
+        total = sum(segment_counts)
+        pause_ms = int(self.predict_params.get('pause_second', 0.3) * 1000)
+        segment = clip.to_segment()
+        silences = detect_silence(segment, min_silence_len=max(50, int(pause_ms * 0.8)),
+                                  silence_thresh=segment.dBFS - 16, seek_step=10)
+        silences = [s for s in silences if s[0] > 0 and s[1] < len(segment)]  # 首尾静音不是分句点
+        if len(silences) < total - 1: return None
+        cuts = sorted(sorted(silences, key=lambda s: s[1] - s[0], reverse=True)[:total - 1])
+        bounds, seen = [0], 0
+        for count in segment_counts[:-1]:
+            seen += count
+            start, end = cuts[seen - 1]
+            bounds.append((start + end) // 2)
+        bounds.append(None)
+        pieces = []
+        for start, end in zip(bounds, bounds[1:]):
+            lo = int(start * clip.sample_rate / 1000) * clip.frame_size
+            hi = len(clip.pcm) if end is None else int(end * clip.sample_rate / 1000) * clip.frame_size
+            pieces.append(PcmClip(clip.pcm[lo:hi], *clip.format))
+        return pieces
+
     def play_audio_worker(self):
         while True:
             try:
                 # 阻塞等待下一个任务
                 priority, seq, audio_path = self.play_queue.get()
+                ticket = self._tickets.pop(seq, None)
                 with self.play_lock:
-                    audio = AudioSegment.from_file(audio_path)
-                    play(audio)
-                    self.played_audio_paths.add(audio_path)
-                    print(f"还有{self.number}个音频未生成音频")
+                    self.scheduler.started(ticket)
+                    try:
+                        if isinstance(audio_path, PcmClip) and self.playback_engine:
+                            self.playback_engine.play(audio_path)
+                        elif self.playback_engine:
+                            # spool 中的大文件通过 mmap 读取，不再复制一份PCM；播完先解除映射再删除文件
+                            with self.spool.open_clip(audio_path) as clip: self.playback_engine.play(clip)
+                        elif isinstance(audio_path, PcmClip):
+                            play(audio_path.to_segment())
+                        else:
+                            play(AudioSegment.from_file(audio_path))
+                    finally:
+                        self.scheduler.finished(ticket)
+                    self.logger.debug("还有%s个音频未生成音频", self.number)
                     self.number = self.number - 1
 
-                    print(f"🔊 播放完成: {audio_path}")
+                    if isinstance(audio_path, PcmClip):
+                        # 缓存命中的音频只在内存中，没有文件需要清理
+                        self.logger.info("🔊 播放完成: 缓存音频 %s", seq)
+                    else:
+                        self.played_audio_paths.add(audio_path)
+                        self.logger.info("🔊 播放完成: %s", audio_path)
 
-                    # 删除已播放的音频文件
-                    if os.path.exists(audio_path):
-                        os.remove(audio_path)
-                        self.played_audio_paths.remove(audio_path)
+                        # 删除已播放的音频文件
+                        self.spool.release(audio_path)
+                        self.played_audio_paths.discard(audio_path)
                 self.play_queue.task_done()
             except Exception as e:
-                print(f"❌ 音频播放失败: {e}")
+                self.logger.warning("❌ 音频播放失败: %s", e)
 
-    def add_task(self, text, priority=2):
-        self.generate_audio(text, priority)
+    def add_task(self, text, priority=2, voice=None):
+        self.generate_audio(text, priority, voice)
+
+    def add_text_stream(self, chunks, priority=2, voice=None):
+        """流式AI文本（逐段到达的字符串迭代器）：每闭合一句就开始合成，不等整段回复；
+        各句并发合成、按原顺序入队。阻塞到迭代器结束，返回段数"""
+        release = _OrderedRelease(self, 1 if priority == 1 else 2, [])
+        stream = self.segmenter.stream(short_first=self.scheduler.buffered_seconds() <= 0)
+        def submit(segment):
+            index = len(release.tickets)
+            release.tickets.append(self.scheduler.submitted(text=segment))
+            self.executor_chunks.submit(self._synthesize_chunk, segment, voice, release, index)
+        for text in chunks:
+            for segment in stream.feed(text): submit(segment)
+        for segment in stream.flush(): submit(segment)
+        return len(release.tickets)
 
     def get_unprocessed_size(self):
         # 返回全局播放队列里的待处理任务数量
@@ -179,8 +382,14 @@ class TTSGenerator:
         # 修改关闭，需同时关闭两个线程池
         self.executor_high.shutdown(wait=True)
         self.executor_low.shutdown(wait=True)
+        self.executor_chunks.shutdown(wait=True)
+        self.scheduler.stop()
         self.play_audio_thread.join()
 
     def can_generate_new_script(self):
-        # 修改为判断全局播放队列中的待处理任务数，小于2时允许生成新话术
-        return self.play_queue.qsize() < 2
+        # 缓冲的音频（合成中的预估 + 待播放 + 正在播放的剩余）低于低水位时允许生成新话术
+        return self.scheduler.needs_more()
+
+    def wait_for_demand(self, timeout=None):
+        # 阻塞到需要补充话术为止，返回 (需要的秒数, 预估字数)；超时返回 (0.0, 0)
+        return self.scheduler.wait_for_demand(timeout)
@@ -0,0 +1,16 @@
+# tts_logging.py
+# 分级日志：替代原来无条件的 print。未配置日志系统时默认以 "[名称] 消息" 格式输出 INFO 及以上，
+# 热路径上的 DEBUG 日志使用 %s 延迟格式化，关闭时几乎没有开销。
+import logging
+
+
+def get_logger(name, level=logging.INFO):
+    """每次调用都按 level 设置级别；只有在还没有任何处理器时才添加默认处理器"""
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('[%(name)s] %(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
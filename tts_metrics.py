@@ -0,0 +1,117 @@
+# tts_metrics.py
+# 每个任务(seq)的延迟时间线与聚合指标。
+# 各阶段记录单调时钟时间戳，任务结束时把"从受理到该阶段"的耗时计入按 阶段×优先级 划分的直方图；
+# 另有取消、服务器错误、重连等计数器。通过 snapshot() 拉取，或导出为 Prometheus 文本/JSON。
+import json, threading, time
+from bisect import bisect_left
+
+STAGES = ("accepted", "request_sent", "assistant_ai_returned", "first_byte", "last_byte",
+          "assembled", "dequeued", "playback_started", "playback_finished")
+
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一格为 +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self):
+        cumulative, buckets = 0, {}
+        for bound, n in zip(BUCKETS + (float('inf'),), self.counts):
+            cumulative += n
+            buckets["+Inf" if bound == float('inf') else str(bound)] = cumulative
+        return {"count": self.count, "sum": self.total, "buckets": buckets}
+
+
+class PipelineMetrics:
+    def __init__(self, max_open_timelines=10000):
+        self.max_open_timelines = max_open_timelines
+        self._lock = threading.Lock()
+        self._timelines = {}  # seq -> {"priority": p, 阶段: 时间戳}
+        self._histograms = {}  # (阶段, 优先级) -> Histogram
+        self.counters = {"tasks_accepted": 0, "tasks_completed": 0, "tasks_discarded": 0,
+                         "cancelled_auto_tasks": 0, "server_errors": 0, "reconnects": 0}
+
+    def mark(self, seq, stage, priority=None, overwrite=False):
+        """记录任务到达某阶段的时间；同一阶段默认只记第一次，overwrite=True 时记最后一次"""
+        now = time.monotonic()
+        with self._lock:
+            timeline = self._timelines.get(seq)
+            if timeline is None:
+                if stage != "accepted": return
+                if len(self._timelines) >= self.max_open_timelines:
+                    self._timelines.pop(next(iter(self._timelines)))
+                timeline = self._timelines[seq] = {"priority": priority}
+                self.counters["tasks_accepted"] += 1
+            if overwrite or stage not in timeline: timeline[stage] = now
+            if stage == "playback_finished": self._finish(seq, "tasks_completed")
+
+    def discard(self, seq, counter=None):
+        """任务未播放就结束（失败、超时、取消），已记录的阶段仍计入直方图"""
+        with self._lock:
+            if counter: self.counters[counter] += 1
+            if seq in self._timelines: self._finish(seq, "tasks_discarded")
+
+    def inc(self, counter, n=1):
+        with self._lock: self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def timeline(self, seq):
+        """返回尚未结束的任务的各阶段耗时（相对受理时间）"""
+        with self._lock:
+            timeline = self._timelines.get(seq)
+            if not timeline: return None
+            return {stage: timeline[stage] - timeline["accepted"] for stage in STAGES if stage in timeline}
+
+    def snapshot(self):
+        with self._lock:
+            return {"counters": dict(self.counters), "open_timelines": len(self._timelines),
+                    "stages": {f"{stage}|{priority}": h.to_dict() for (stage, priority), h in self._histograms.items()}}
+
+    def to_json(self, extra_counters=None, extra_gauges=None):
+        snap = self.snapshot()
+        snap["counters"].update(extra_counters or {})
+        snap["gauges"] = dict(extra_gauges or {})
+        return json.dumps(snap, ensure_ascii=False)
+
+    def to_prometheus(self, prefix="tts_client", extra_counters=None, extra_gauges=None):
+        """extra_counters 为只增不减的计数（加 _total 后缀），extra_gauges 为当前值（字节数、条目数等）"""
+        lines = []
+        with self._lock:
+            counters = dict(self.counters, **(extra_counters or {}))
+            for name, value in sorted(counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {value}")
+            for name, value in sorted((extra_gauges or {}).items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+            metric = f"{prefix}_stage_latency_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (stage, priority), h in sorted(self._histograms.items(), key=lambda kv: (kv[0][0], str(kv[0][1]))):
+                labels = f'stage="{stage}",priority="{priority}"'
+                for bound, cumulative in h.to_dict()["buckets"].items():
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{labels}}} {h.total}")
+                lines.append(f"{metric}_count{{{labels}}} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def _finish(self, seq, counter):
+        """调用方需持有锁"""
+        timeline = self._timelines.pop(seq)
+        self.counters[counter] += 1
+        start = timeline.get("accepted")
+        priority = timeline.get("priority")
+        for stage in STAGES[1:]:
+            if stage in timeline:
+                key = (stage, priority)
+                histogram = self._histograms.get(key)
+                if histogram is None: histogram = self._histograms[key] = Histogram()
+                histogram.observe(timeline[stage] - start)
@@ -0,0 +1,149 @@
+# tts_protocol.py
+# 客户端与TTS中央服务器之间的长度前缀帧协议。
+# 每条消息 = 4字节大端长度 + 负载，负载有两种格式：
+#   1. JSON（旧格式）：{"request_id", "is_assistant", "status", "audio_data": base64字符串}
+#   2. 二进制音频帧：固定头部 + 原始音频字节，省掉base64带来的33%膨胀和多次内存拷贝
+# 客户端在请求中携带 "frame_format": "binary" 表示能解析二进制帧；
+# 旧服务器会忽略这个字段并继续返回JSON，所以两种格式在接收端都要支持。
+# 流式合成（请求携带 "stream": true）时，同一 request_id 会返回多个块，
+# 二进制帧使用版本2头部，额外带块序号，并用 FLAG_END_OF_STREAM 标记最后一块；
+# JSON帧对应 "chunk_index" / "end_of_stream" 字段。未带这些信息的回包视为完整的单块。
+# 取消消息 {"type": "cancel", "cancel_id": request_id}：服务器应丢弃尚未开始或正在进行的合成。
+# 取消消息不带 request_id 字段，不认识它的旧服务器不会把它当成一次合成请求。
+# 编码协商：客户端连上后先发 {"type": "hello", "codecs": [偏好顺序]}，服务器回 {"type": "hello_ack", "codec": 选中的编码}，
+# 之后的音频按该编码压缩；二进制帧头部的 codec 字段、JSON帧的 "codec" 字段标明每一帧实际使用的编码，
+# 接收端按帧解码，不依赖握手结果。旧服务器不回 hello_ack，继续发送WAV。
+import base64, json, struct
+
+LENGTH_PREFIX = struct.Struct('>I')
+
+FRAME_MAGIC = b'TB'  # JSON负载必然以 '{' 开头，不会与之冲突
+FRAME_VERSION = 1
+FRAME_VERSION_CHUNKED = 2
+# magic(2s) version(B) flags(B) request_id(I) status(B) codec(B)
+FRAME_HEADER = struct.Struct('>2sBBIBB')
+# 版本2在头部之后追加: chunk_index(H)
+CHUNK_HEADER = struct.Struct('>H')
+
+FLAG_ASSISTANT = 0x01
+FLAG_END_OF_STREAM = 0x02
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_NAMES = {STATUS_OK: "success", STATUS_ERROR: "error"}
+
+CODEC_WAV = 0
+CODEC_FLAC = 1
+CODEC_OPUS = 2
+CODEC_NAMES = {CODEC_WAV: "wav", CODEC_FLAC: "flac", CODEC_OPUS: "opus"}
+CODEC_IDS = {name: codec for codec, name in CODEC_NAMES.items()}
+
+MSG_CANCEL = "cancel"
+MSG_HELLO = "hello"
+MSG_HELLO_ACK = "hello_ack"
+
+
+def frame_msg(data):
+    """给负载加上长度前缀，多条消息可以拼接后一次sendall"""
+    return LENGTH_PREFIX.pack(len(data)) + data
+
+
+def cancel_msg(request_id):
+    """取消某个请求（主线和助播两部分）的消息负载"""
+    return json.dumps({"type": MSG_CANCEL, "cancel_id": request_id}).encode('utf-8')
+
+
+def hello_msg(codecs):
+    """连接握手：客户端按偏好顺序列出能解码的音频编码"""
+    return json.dumps({"type": MSG_HELLO, "codecs": list(codecs)}).encode('utf-8')
+
+
+def hello_ack_msg(codec):
+    return json.dumps({"type": MSG_HELLO_ACK, "codec": codec}).encode('utf-8')
+
+
+def send_msg(sock, data):
+    """发送一条长度前缀消息"""
+    sock.sendall(frame_msg(data))
+
+
+def send_audio_frame(sock, request_id, audio_data, is_assistant=False, status=STATUS_OK, codec=CODEC_WAV,
+                     chunk_index=None, end_of_stream=True):
+    """以二进制帧发送音频（服务器端使用）。头部和音频分两次sendall，避免拼接大块音频产生拷贝"""
+    header = pack_frame_header(request_id, len(audio_data), is_assistant, status, codec, chunk_index, end_of_stream)
+    sock.sendall(header)
+    if audio_data: sock.sendall(audio_data)
+
+
+def pack_frame_header(request_id, audio_len, is_assistant=False, status=STATUS_OK, codec=CODEC_WAV,
+                      chunk_index=None, end_of_stream=True):
+    """生成 长度前缀 + 二进制帧头部；给出 chunk_index 时使用带块序号的版本2头部"""
+    flags = (FLAG_ASSISTANT if is_assistant else 0) | (FLAG_END_OF_STREAM if end_of_stream else 0)
+    if chunk_index is None:
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, request_id, status, codec)
+    else:
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION_CHUNKED, flags, request_id, status, codec) \
+            + CHUNK_HEADER.pack(chunk_index)
+    return LENGTH_PREFIX.pack(len(header) + audio_len) + header
+
+
+def recv_exact_into(sock, view):
+    """把数据直接读进预分配的缓冲区，连接关闭时返回False"""
+    while len(view):
+        n = sock.recv_into(view)
+        if not n: return False
+        view = view[n:]
+    return True
+
+
+def recv_msg(sock):
+    """读取一条消息并解析为packet字典，连接关闭时返回None。
+    无论哪种线路格式，返回的 packet['audio_data'] 都已经是原始音频字节。"""
+    raw_len = bytearray(LENGTH_PREFIX.size)
+    if not recv_exact_into(sock, memoryview(raw_len)): return None
+    msglen = LENGTH_PREFIX.unpack(raw_len)[0]
+
+    head = bytearray(min(msglen, FRAME_HEADER.size))
+    if not recv_exact_into(sock, memoryview(head)): return None
+    if is_binary_frame(head):
+        ext = bytearray(frame_ext_size(head))
+        if not recv_exact_into(sock, memoryview(ext)): return None
+        audio = bytearray(msglen - len(head) - len(ext))
+        if not recv_exact_into(sock, memoryview(audio)): return None
+        return parse_frame_header(head, audio, ext)
+
+    rest = bytearray(msglen - len(head))
+    if not recv_exact_into(sock, memoryview(rest)): return None
+    return parse_json_packet(head + rest)
+
+
+def is_binary_frame(head):
+    return len(head) == FRAME_HEADER.size and head[:2] == FRAME_MAGIC
+
+
+def frame_ext_size(head):
+    """基本头部之后还需读取的扩展头部长度"""
+    return CHUNK_HEADER.size if head[2] >= FRAME_VERSION_CHUNKED else 0
+
+
+def parse_frame_header(head, audio, ext=b''):
+    _, _, flags, request_id, status, codec = FRAME_HEADER.unpack(head)
+    packet = {"request_id": request_id, "is_assistant": bool(flags & FLAG_ASSISTANT),
+              "status": STATUS_NAMES.get(status, "error"), "codec": CODEC_NAMES.get(codec, f"codec_{codec}"),
+              "audio_data": audio}
+    if ext:
+        packet["chunk_index"] = CHUNK_HEADER.unpack(ext)[0]
+        packet["end_of_stream"] = bool(flags & FLAG_END_OF_STREAM)
+    return packet
+
+
+def is_partial_chunk(packet):
+    """是否为流式合成中的一个分块（而不是完整的单块回包）"""
+    return packet.get("chunk_index", 0) > 0 or not packet.get("end_of_stream", True)
+
+
+def parse_json_packet(data):
+    packet = json.loads(data.decode('utf-8'))
+    if packet.get('audio_data'):
+        packet['audio_data'] = base64.b64decode(packet['audio_data'])
+    return packet
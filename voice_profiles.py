@@ -0,0 +1,96 @@
+# voice_profiles.py
+# gradio 合成接口的"已准备声音"层：
+# - 每个声音（参考音频 + 提示文本 + 参数覆盖）注册一次，按名字选择；
+# - 参考音频用 gradio_client.handle_file 包装，由 Client 自己上传；参考音频文件不变时复用同一个 FileData；
+# - 维护与工作线程数相同的 Client 会话池，避免多个线程共用一个 Client。
+import os, queue, threading
+from contextlib import contextmanager
+
+
+class VoiceProfile:
+    """一个可选的合成声音；params 覆盖 TTSGenerator 的默认合成参数"""
+    def __init__(self, name, ref_audio_path, prompt_text=None, prompt_language=None, **params):
+        self.name = name
+        self.ref_audio_path = ref_audio_path
+        self.params = dict(params)
+        if prompt_text is not None: self.params['prompt_text'] = prompt_text
+        if prompt_language is not None: self.params['prompt_language'] = prompt_language
+        self.handle = None  # handle_file 包装的参考音频
+        self.handle_mtime = None
+
+    def predict_params(self, defaults):
+        return dict(defaults, **self.params)
+
+
+class PreparedVoices:
+    def __init__(self, client_url, client_factory, file_handle, pool_size=10, log=print):
+        self.client_url = client_url
+        self.client_factory = client_factory
+        self.file_handle = file_handle  # gradio_client.handle_file
+        self.pool_size = pool_size
+        self.log = log
+        self.voices = {}
+        self._lock = threading.Lock()
+        self._sessions = queue.LifoQueue()
+        self._created = 0
+        self._shared_client = None
+        self.stats = {"sessions": 0}
+
+    def add_voice(self, voice, preload=True):
+        """注册一个声音；preload=True 时立即建立一个会话，首次合成不用再等 Client 初始化"""
+        with self._lock: self.voices[voice.name] = voice
+        if preload:
+            with self.session(): pass
+        return voice
+
+    def get(self, name):
+        try:
+            return self.voices[name]
+        except KeyError:
+            raise ValueError(f"未知的声音: {name}")
+
+    @contextmanager
+    def session(self):
+        """借出一个 Client 会话，用完归还；池未满时按需创建，已满时等待其他线程归还"""
+        try:
+            client = self._sessions.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create: self._created += 1
+            if create:
+                try:
+                    client = self.client_factory(self.client_url)
+                except BaseException:
+                    with self._lock: self._created -= 1
+                    raise
+                self.stats["sessions"] += 1
+            else:
+                client = self._sessions.get()
+        try:
+            yield client
+        finally:
+            self._sessions.put(client)
+
+    def shared_client(self):
+        """会话池之外的一个 Client，供直接调用 gradio 接口的旧代码使用；首次调用时创建"""
+        if self._shared_client is None:
+            client = self.client_factory(self.client_url)
+            with self._lock:
+                if self._shared_client is None: self._shared_client = client
+        return self._shared_client
+
+    def ref_handle(self, voice):
+        """返回可直接传给 predict 的参考音频；参考音频文件修改后重新包装"""
+        try:
+            mtime = os.path.getmtime(voice.ref_audio_path)
+        except OSError:
+            mtime = None  # 文件不存在时照常交给 predict，由它报错
+        with self._lock:
+            if voice.handle is None or voice.handle_mtime != mtime or mtime is None:
+                voice.handle, voice.handle_mtime = self.file_handle(voice.ref_audio_path), mtime
+            return voice.handle
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, idle_sessions=self._sessions.qsize(), voices=list(self.voices))
@@ -0,0 +1,40 @@
+# worker_pool.py
+# 有界线程池：固定数量的工作线程 + 有上限的等待队列。
+# 队列满时按调用方的选择阻塞等待（背压）或立即拒绝，线程数在突发流量下保持不变。
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PoolRejected(RuntimeError):
+    """线程池与等待队列都已满，任务被拒绝"""
+
+
+class BoundedExecutor:
+    def __init__(self, max_workers, max_queue, name="Worker"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "rejected": 0, "completed": 0}
+
+    def submit(self, fn, *args, block=False, timeout=None):
+        """提交任务。block=False 时队列满立即抛出 PoolRejected；block=True 时最多等待 timeout 秒"""
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            with self._stats_lock: self.stats["rejected"] += 1
+            raise PoolRejected(f"队列已满 (workers={self.max_workers}, queue={self.max_queue})")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._stats_lock: self.stats["submitted"] += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _on_done(self, _future):
+        self._slots.release()
+        with self._stats_lock: self.stats["completed"] += 1